@@ -0,0 +1,361 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+r"""Micro-benchmarks of the orchestration overhead of the societies.
+
+The models and the tool are stubs answering instantly, so the measured time
+is the time spent in OWL and camel. Run from the repository root:
+
+    python -m benchmarks.bench_orchestration --output results.json
+    python -m benchmarks.bench_orchestration --compare baseline.json
+
+The results are written as JSON, with the commit they were measured at, and
+two result files can be compared metric by metric.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from copy import copy
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from camel.logger import set_log_level
+from camel.messages import BaseMessage
+
+from owl.utils import (
+    RoundCompletedEvent,
+    arun_society,
+    run_society,
+    stream_society,
+)
+
+from .stub_backend import TASK_PROMPT, StubConfig, build_society
+
+# Metrics for which a higher value is better, the others are costs
+HIGHER_IS_BETTER = ("throughput", "efficiency")
+
+
+def _summary(samples: List[float], scale: float = 1.0) -> Dict[str, float]:
+    samples = sorted(sample * scale for sample in samples)
+    return {
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "min": samples[0],
+        "max": samples[-1],
+    }
+
+
+def _model_time(models) -> float:
+    return sum(model.model_time for model in models)
+
+
+def bench_step(config: StubConfig, rounds: int, use_async: bool) -> Dict[str, Any]:
+    r"""The overhead of :meth:`OwlRolePlaying.step` or :meth:`astep` per
+    round, i.e. the wall time of the round less the time spent in the stub
+    models, in milliseconds. The overhead of the first and last rounds shows
+    its growth with the chat history."""
+    society, models = build_society(config)
+    input_msg = society.init_chat()
+    overheads = []
+
+    async def astep(msg):
+        return await society.astep(msg)
+
+    loop = asyncio.new_event_loop() if use_async else None
+    try:
+        for _ in range(rounds):
+            model_time = _model_time(models)
+            start = time.perf_counter()
+            if loop is not None:
+                assistant_response, _ = loop.run_until_complete(astep(input_msg))
+            else:
+                assistant_response, _ = society.step(input_msg)
+            overheads.append(
+                time.perf_counter() - start - (_model_time(models) - model_time)
+            )
+            input_msg = assistant_response.msg
+    finally:
+        if loop is not None:
+            loop.close()
+    return {
+        "overhead_ms": _summary(overheads, 1000),
+        "first_round_overhead_ms": overheads[0] * 1000,
+        "last_round_overhead_ms": overheads[-1] * 1000,
+    }
+
+
+def bench_step_parts(config: StubConfig, number: int) -> Dict[str, float]:
+    r"""The cost of the message handling of :meth:`OwlRolePlaying.step`, in
+    microseconds per call: copying a message, appending the auxiliary
+    information to it, and reducing the message options."""
+    society, _ = build_society(config)
+    msg = BaseMessage.make_user_message(
+        role_name="user", content="x" * config.response_chars
+    )
+
+    def concatenate():
+        modified = copy(msg)
+        modified.content += f"""\n
+            Here are auxiliary information about the overall task, which may help you understand the intent of the current task:
+            <auxiliary_information>
+            {TASK_PROMPT}
+            </auxiliary_information>
+            """
+
+    parts: Dict[str, Callable[[], Any]] = {
+        "copy_message": lambda: copy(msg),
+        "concatenate_prompt": concatenate,
+        "reduce_message_options": lambda: society._reduce_message_options([msg]),
+    }
+    return {
+        f"{name}_us": min(timeit.repeat(part, number=number, repeat=5)) / number * 1e6
+        for name, part in parts.items()
+    }
+
+
+def bench_run_society(config: StubConfig, rounds: int, repeats: int) -> Dict[str, Any]:
+    r"""The cost of a whole :func:`run_society` loop, less the time spent in
+    the stub models, per round in milliseconds, including building the
+    society."""
+    overheads = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        society, models = build_society(config)
+        run_society(society, round_limit=rounds)
+        overheads.append((time.perf_counter() - start - _model_time(models)) / rounds)
+    return {"overhead_per_round_ms": _summary(overheads, 1000)}
+
+
+def bench_memory(config: StubConfig, rounds: int) -> Dict[str, Any]:
+    r"""The growth of the memory allocated by a society per round, the slope
+    of a least squares fit of the allocated memory after each round, in
+    kilobytes."""
+    # Warm up the caches of camel and pydantic, allocated once per process
+    run_society(build_society(config)[0], round_limit=2)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        society, _ = build_society(config)
+        baseline = tracemalloc.get_traced_memory()[0]
+        allocated = []
+        for event in stream_society(society, round_limit=rounds):
+            if isinstance(event, RoundCompletedEvent):
+                allocated.append(tracemalloc.get_traced_memory()[0] - baseline)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    xs = list(range(len(allocated)))
+    x_mean, y_mean = statistics.mean(xs), statistics.mean(allocated)
+    slope = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, allocated)) / max(
+        sum((x - x_mean) ** 2 for x in xs), 1
+    )
+    return {
+        "growth_per_round_kb": slope / 1024,
+        "allocated_after_last_round_kb": allocated[-1] / 1024,
+        "peak_kb": peak / 1024,
+    }
+
+
+def bench_concurrency(
+    config: StubConfig, rounds: int, concurrency: List[int]
+) -> Dict[str, Any]:
+    r"""The throughput of N concurrent :func:`arun_society` calls, in rounds
+    per second, and their efficiency, the ratio of the time a single society
+    takes to the time the N societies take."""
+
+    async def run_all(n: int) -> float:
+        societies = [build_society(config)[0] for _ in range(n)]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(arun_society(society, round_limit=rounds) for society in societies)
+        )
+        return time.perf_counter() - start
+
+    results: Dict[str, Any] = {}
+    single = None
+    for n in concurrency:
+        elapsed = asyncio.run(run_all(n))
+        if single is None:
+            single = asyncio.run(run_all(1)) if n != 1 else elapsed
+        results[f"societies_{n}"] = {
+            "wall_time_s": elapsed,
+            "throughput_rounds_per_s": n * rounds / elapsed,
+            "efficiency": single / elapsed,
+        }
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    config = StubConfig(
+        response_chars=args.response_chars,
+        tool_calls=args.tool_calls,
+        tool_result_chars=args.tool_result_chars,
+    )
+    concurrent_config = StubConfig(
+        response_chars=args.response_chars,
+        tool_calls=args.tool_calls,
+        tool_result_chars=args.tool_result_chars,
+        latency=args.latency,
+    )
+    results: Dict[str, Any] = {}
+    benchmarks: List[Tuple[str, Callable[[], Any]]] = [
+        ("step", lambda: bench_step(config, args.rounds, use_async=False)),
+        ("astep", lambda: bench_step(config, args.rounds, use_async=True)),
+        ("step_parts", lambda: bench_step_parts(config, args.number)),
+        (
+            "run_society",
+            lambda: bench_run_society(config, args.rounds, args.repeats),
+        ),
+        ("memory", lambda: bench_memory(config, args.rounds)),
+        (
+            "concurrency",
+            lambda: bench_concurrency(concurrent_config, args.rounds, args.concurrency),
+        ),
+    ]
+    for name, benchmark in benchmarks:
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = benchmark()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "config": {
+            **config.to_dict(),
+            "rounds": args.rounds,
+            "repeats": args.repeats,
+            "concurrency": args.concurrency,
+            "concurrency_latency": args.latency,
+        },
+        "results": results,
+    }
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    r"""Print the change of every metric between two result files.
+
+    Returns:
+        List[str]: The metrics which regressed by more than
+            :obj:`threshold`, a fraction.
+    """
+    old = _flatten(baseline["results"])
+    new = _flatten(current["results"])
+    print(
+        f"{'metric':<60} {'baseline':>12} {'current':>12} {'change':>8}  "
+        f"({baseline['meta'].get('commit')} -> {current['meta'].get('commit')})"
+    )
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        change = (new[name] - old[name]) / old[name] if old[name] else 0.0
+        worse = -change if any(k in name for k in HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<60} {old[name]:>12.3f} {new[name]:>12.3f} "
+            f"{change:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--response-chars", type=int, default=2000)
+    parser.add_argument("--tool-calls", type=int, default=1)
+    parser.add_argument("--tool-result-chars", type=int, default=4000)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="model latency in seconds of the concurrency benchmark",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=["step", "astep", "step_parts", "run_society", "memory", "concurrency"],
+    )
+    parser.add_argument("--output", help="the JSON file of the results")
+    parser.add_argument("--compare", help="a JSON file of baseline results")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="the relative change reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    # The round logs would dominate the measured overhead
+    set_log_level("WARNING")
+
+    current = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+    else:
+        print(json.dumps(current, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
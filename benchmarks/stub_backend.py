@@ -0,0 +1,234 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+import asyncio
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from camel.messages import OpenAIMessage
+from camel.models import BaseModelBackend
+from camel.models.stub_model import StubTokenCounter
+from camel.toolkits import FunctionTool
+from camel.types import ChatCompletion
+from camel.utils import BaseTokenCounter
+from pydantic import BaseModel
+
+from owl.utils import OwlRolePlaying
+
+TASK_PROMPT = (
+    "Find the number of stars of the camel-ai/owl repository on GitHub, and "
+    "write it into a file."
+)
+
+
+@dataclass
+class StubConfig:
+    r"""The workload of the stub societies.
+
+    Args:
+        response_chars (int, optional): The length of each model reply.
+            (default: :obj:`2000`)
+        tool_calls (int, optional): The number of tool calls emitted by the
+            assistant model in each round. (default: :obj:`1`)
+        tool_result_chars (int, optional): The length of each tool result.
+            (default: :obj:`4000`)
+        latency (float, optional): The delay of each model call in seconds.
+            (default: :obj:`0.0`)
+        done_after (int, optional): The number of rounds after which the user
+            model replies `TASK_DONE`, :obj:`None` to run until the round
+            limit. (default: :obj:`None`)
+    """
+
+    response_chars: int = 2000
+    tool_calls: int = 1
+    tool_result_chars: int = 4000
+    latency: float = 0.0
+    done_after: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class StubModelBackend(BaseModelBackend):
+    r"""A model answering instantly, or after a fixed latency, with replies
+    of a configurable size, to measure the overhead of the framework.
+
+    As the user model, it replies with instructions, and `TASK_DONE` after
+    :obj:`done_after` replies. As the assistant model, it first emits
+    :obj:`tool_calls` calls of the `stub_tool` tool, then replies once their
+    results are in the prompt. The time spent in the backend, building the
+    completions and sleeping, is accumulated in :obj:`model_time`.
+
+    Args:
+        role (str): `"user"` or `"assistant"`.
+        config (StubConfig): The workload.
+    """
+
+    def __init__(self, role: str, config: StubConfig):
+        super().__init__(model_type="stub-benchmark")
+        self.role = role
+        self.config = config
+        self.calls = 0
+        self.replies = 0
+        self.model_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def token_counter(self) -> BaseTokenCounter:
+        if self._token_counter is None:
+            self._token_counter = StubTokenCounter()
+        return self._token_counter
+
+    @property
+    def token_limit(self) -> int:
+        return 999_999_999
+
+    def check_model_config(self):
+        pass
+
+    def _padding(self, prefix: str) -> str:
+        return prefix + "x" * max(self.config.response_chars - len(prefix), 0)
+
+    def _respond(
+        self,
+        messages: List[OpenAIMessage],
+        tools: Optional[List[Dict[str, Any]]],
+    ) -> ChatCompletion:
+        with self._lock:
+            self.calls += 1
+            message: Dict[str, Any] = {"role": "assistant"}
+            if self.role == "user":
+                self.replies += 1
+                done = (
+                    self.config.done_after is not None
+                    and self.replies > self.config.done_after
+                )
+                message["content"] = (
+                    "TASK_DONE"
+                    if done
+                    else self._padding(
+                        f"Instruction: run step {self.replies}\nInput: None\n"
+                    )
+                )
+            elif tools and self.config.tool_calls and messages[-1]["role"] != "tool":
+                message["content"] = ""
+                message["tool_calls"] = [
+                    {
+                        "id": f"call_{self.calls}_{i}",
+                        "type": "function",
+                        "function": {
+                            "name": "stub_tool",
+                            "arguments": json.dumps({"query": f"query {i}"}),
+                        },
+                    }
+                    for i in range(self.config.tool_calls)
+                ]
+            else:
+                self.replies += 1
+                message["content"] = self._padding(f"Solution: step {self.replies}\n")
+
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in messages)
+        return ChatCompletion.model_validate(
+            {
+                "id": f"stub-{self.calls}",
+                "model": "stub-benchmark",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "choices": [
+                    {
+                        "finish_reason": "stop",
+                        "index": 0,
+                        "message": message,
+                        "logprobs": None,
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(message["content"]) // 4,
+                    "total_tokens": (prompt_chars + len(message["content"])) // 4,
+                },
+            }
+        )
+
+    def _run(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> ChatCompletion:
+        start = time.perf_counter()
+        response = self._respond(messages, tools)
+        if self.config.latency > 0:
+            time.sleep(self.config.latency)
+        self.model_time += time.perf_counter() - start
+        return response
+
+    async def _arun(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> ChatCompletion:
+        start = time.perf_counter()
+        response = self._respond(messages, tools)
+        if self.config.latency > 0:
+            await asyncio.sleep(self.config.latency)
+        self.model_time += time.perf_counter() - start
+        return response
+
+
+def make_stub_tool(result_chars: int) -> FunctionTool:
+    r"""A tool answering instantly with a result of :obj:`result_chars`
+    characters."""
+
+    def stub_tool(query: str) -> str:
+        r"""Search the web.
+
+        Args:
+            query (str): The query.
+
+        Returns:
+            str: The search results.
+        """
+        return f"Results for {query}: " + "y" * result_chars
+
+    return FunctionTool(stub_tool)
+
+
+def build_society(
+    config: StubConfig, **society_kwargs
+) -> Tuple[OwlRolePlaying, List[StubModelBackend]]:
+    r"""Build a society served by stub models and the stub tool.
+
+    Returns:
+        Tuple[OwlRolePlaying, List[StubModelBackend]]: The society, and its
+            user and assistant models.
+    """
+    user_model = StubModelBackend("user", config)
+    assistant_model = StubModelBackend("assistant", config)
+    society = OwlRolePlaying(
+        task_prompt=TASK_PROMPT,
+        with_task_specify=False,
+        user_role_name="user",
+        user_agent_kwargs={"model": user_model},
+        assistant_role_name="assistant",
+        assistant_agent_kwargs={
+            "model": assistant_model,
+            "tools": [make_stub_tool(config.tool_result_chars)],
+        },
+        **society_kwargs,
+    )
+    return society, [user_model, assistant_model]
@@ -49,6 +49,14 @@ logger = get_logger(__name__)
 LEVEL = 1
 SAVE_RESULT = True
 test_idx = [0]
+# Number of tasks run in parallel, each with its own toolkits
+WORKERS = 1
+# Extract the attachments of the tasks up front, in parallel
+PREPROCESS_ATTACHMENTS = False
+# Split the tasks across machines, each running one shard. Merge the results
+# with `python -m owl.utils.results_cli merge results/result.jsonl`
+SHARD_INDEX = int(os.environ.get("GAIA_SHARD_INDEX", 0))
+NUM_SHARDS = int(os.environ.get("GAIA_NUM_SHARDS", 1))
 
 
 def main():
@@ -93,35 +101,47 @@ def main():
         ),
     }
 
-    # Configure toolkits
-    tools = [
-        *BrowserToolkit(
-            headless=False,  # Set to True for headless mode (e.g., on remote servers)
-            web_agent_model=models["browsing"],
-            planning_agent_model=models["planning"],
-        ).get_tools(),
-        *VideoAnalysisToolkit(
-            model=models["video"]
-        ).get_tools(),  # This requires OpenAI Key
-        *AudioAnalysisToolkit().get_tools(),  # This requires OpenAI Key
-        *CodeExecutionToolkit(sandbox="subprocess", verbose=True).get_tools(),
-        *ImageAnalysisToolkit(model=models["image"]).get_tools(),
-        *SearchToolkit().get_tools(),
-        *ExcelToolkit().get_tools(),
-        *FileWriteToolkit(output_dir="./").get_tools(),
-    ]
+    # Configure toolkits, built for each worker in its own directory
+    def build_tools(worker_dir: pathlib.Path):
+        return [
+            *BrowserToolkit(
+                headless=False,  # Set to True for headless mode (e.g., on remote servers)
+                cache_dir=str(worker_dir / "browser"),
+                web_agent_model=models["browsing"],
+                planning_agent_model=models["planning"],
+            ).get_tools(),
+            *VideoAnalysisToolkit(
+                download_directory=str(worker_dir / "video"),
+                model=models["video"],
+            ).get_tools(),  # This requires OpenAI Key
+            *AudioAnalysisToolkit(
+                cache_dir=str(worker_dir / "audio")
+            ).get_tools(),  # This requires OpenAI Key
+            *CodeExecutionToolkit(sandbox="subprocess", verbose=True).get_tools(),
+            *ImageAnalysisToolkit(model=models["image"]).get_tools(),
+            *SearchToolkit().get_tools(),
+            *ExcelToolkit().get_tools(),
+            *FileWriteToolkit(output_dir=str(worker_dir)).get_tools(),
+        ]
 
     # Configure agent roles and parameters
     user_agent_kwargs = {"model": models["user"]}
-    assistant_agent_kwargs = {"model": models["assistant"], "tools": tools}
+    assistant_agent_kwargs = {"model": models["assistant"]}
 
     # Initialize benchmark
-    benchmark = GAIABenchmark(data_dir="data/gaia", save_to="results/result.json")
+    # The results are appended to results/result.jsonl, use
+    # `python -m owl.utils.results_cli export` to write them as a JSON list
+    benchmark = GAIABenchmark(data_dir="data/gaia", save_to="results/result.jsonl")
 
     # Print benchmark information
     print(f"Number of validation examples: {len(benchmark.valid)}")
     print(f"Number of test examples: {len(benchmark.test)}")
 
+    if PREPROCESS_ATTACHMENTS:
+        benchmark.preprocess_attachments(
+            on="valid", level=LEVEL, cache_dir=os.path.join(cache_dir, "attachments")
+        )
+
     # Run benchmark
     result = benchmark.run(
         on="valid",
@@ -132,6 +152,11 @@ def main():
         user_agent_kwargs=user_agent_kwargs,
         assistant_role_name="assistant",
         assistant_agent_kwargs=assistant_agent_kwargs,
+        workers=WORKERS,
+        tools_factory=build_tools,
+        workspace_dir=os.path.join(cache_dir, "gaia_workers"),
+        shard_index=SHARD_INDEX,
+        num_shards=NUM_SHARDS,
     )
 
     # Output results
@@ -12,22 +12,199 @@
 # limitations under the License.
 # ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
 
-from .common import extract_pattern
+from .common import extract_pattern, resolve_import
 from .enhanced_role_playing import (
     OwlRolePlaying,
     OwlGAIARolePlaying,
     run_society,
     arun_society,
+    stream_society,
+    astream_society,
+    resume_society,
+    aresume_society,
 )
+from .society_events import (
+    SocietyEvent,
+    UserInstructionEvent,
+    ToolCallEvent,
+    AssistantReplyEvent,
+    TokenUsageEvent,
+    RoundTelemetryEvent,
+    RoundCompletedEvent,
+    RoundControlEvent,
+    SocietyTerminatedEvent,
+)
+from .round_control import (
+    RoundFingerprint,
+    RoundAction,
+    RoundDecision,
+    BaseRoundController,
+    RepetitionRoundController,
+)
+from .cassette import (
+    Cassette,
+    RecordingModelBackend,
+    ReplayModelBackend,
+    request_key,
+)
+from .checkpoint import (
+    SocietyCheckpoint,
+    BaseCheckpointStore,
+    DirectoryCheckpointStore,
+    SQLiteCheckpointStore,
+)
+from .enhanced_chat_agent import OwlChatAgent
+from .context_compaction import ContextCompactor
+from .model_routing import ModelRouter
+from .fan_out import SubTask, TaskPlan, aplan_task, arun_fan_out, run_fan_out
+from .history_store import ChatHistoryStore, PayloadRef
+from .telemetry import (
+    LLMCallTelemetry,
+    ToolCallTelemetry,
+    RoundTelemetry,
+    SocietyTelemetry,
+)
+from .tool_cache import (
+    BaseToolCacheBackend,
+    MemoryToolCacheBackend,
+    SQLiteToolCacheBackend,
+    ToolCache,
+    ToolCacheStats,
+    is_error_result,
+)
+from .tool_dispatch import ToolDispatcher
+from .async_logging import (
+    AsyncLogging,
+    LazyQueueHandler,
+    PayloadLimiter,
+    setup_async_logging,
+)
+from .experience import (
+    Experience,
+    ExperienceStore,
+    HashingEmbedding,
+    PlanStep,
+)
+from .hedging import HedgedModelBackend
+from .llm_scheduler import (
+    LLMScheduler,
+    RateLimit,
+    RequestPriority,
+    ScheduledModelBackend,
+    get_default_scheduler,
+)
+from .society_factory import PrebuiltFunctionTool, SocietyFactory
+from .society_executor import SocietyExecutor, SocietySpec
+from .cancellation import CancellationError, CancelToken, release_tool_resources
+from .token_accounting import (
+    ContextGuard,
+    HeuristicTokenCounter,
+    PreflightResult,
+    ReductionStrategy,
+    TiktokenTokenCounter,
+    TokenizerRegistry,
+    TokenLedger,
+    model_summarizer,
+)
+from .result_store import ResultStore
+from .benchmark_report import BenchmarkReport, TaskMetrics
 from .gaia import GAIABenchmark
 from .document_toolkit import DocumentProcessingToolkit
+from .attachments import (
+    AttachmentCache,
+    ExtractedAttachment,
+    extract_attachments,
+)
 
 __all__ = [
     "extract_pattern",
+    "resolve_import",
     "OwlRolePlaying",
     "OwlGAIARolePlaying",
     "run_society",
     "arun_society",
+    "stream_society",
+    "astream_society",
+    "resume_society",
+    "aresume_society",
+    "SocietyEvent",
+    "UserInstructionEvent",
+    "ToolCallEvent",
+    "AssistantReplyEvent",
+    "TokenUsageEvent",
+    "RoundTelemetryEvent",
+    "RoundCompletedEvent",
+    "RoundControlEvent",
+    "SocietyTerminatedEvent",
+    "RoundFingerprint",
+    "RoundAction",
+    "RoundDecision",
+    "BaseRoundController",
+    "RepetitionRoundController",
+    "SocietyCheckpoint",
+    "BaseCheckpointStore",
+    "DirectoryCheckpointStore",
+    "SQLiteCheckpointStore",
+    "OwlChatAgent",
+    "ContextCompactor",
+    "ModelRouter",
+    "SubTask",
+    "TaskPlan",
+    "aplan_task",
+    "arun_fan_out",
+    "run_fan_out",
+    "ChatHistoryStore",
+    "PayloadRef",
+    "LLMCallTelemetry",
+    "ToolCallTelemetry",
+    "RoundTelemetry",
+    "SocietyTelemetry",
+    "Cassette",
+    "RecordingModelBackend",
+    "ReplayModelBackend",
+    "request_key",
+    "BaseToolCacheBackend",
+    "MemoryToolCacheBackend",
+    "SQLiteToolCacheBackend",
+    "ToolCache",
+    "ToolCacheStats",
+    "is_error_result",
+    "ToolDispatcher",
+    "AsyncLogging",
+    "LazyQueueHandler",
+    "PayloadLimiter",
+    "setup_async_logging",
+    "Experience",
+    "ExperienceStore",
+    "HashingEmbedding",
+    "PlanStep",
+    "HedgedModelBackend",
+    "LLMScheduler",
+    "RateLimit",
+    "RequestPriority",
+    "ScheduledModelBackend",
+    "get_default_scheduler",
+    "PrebuiltFunctionTool",
+    "SocietyFactory",
+    "SocietyExecutor",
+    "SocietySpec",
+    "CancellationError",
+    "CancelToken",
+    "release_tool_resources",
+    "ContextGuard",
+    "HeuristicTokenCounter",
+    "PreflightResult",
+    "ReductionStrategy",
+    "TiktokenTokenCounter",
+    "TokenizerRegistry",
+    "TokenLedger",
+    "model_summarizer",
+    "ResultStore",
+    "BenchmarkReport",
+    "TaskMetrics",
     "GAIABenchmark",
     "DocumentProcessingToolkit",
+    "AttachmentCache",
+    "ExtractedAttachment",
+    "extract_attachments",
 ]
@@ -0,0 +1,238 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import atexit
+import gzip
+import json
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import IO, List, Optional, Union
+
+
+class LazyQueueHandler(QueueHandler):
+    r"""Put log records on a bounded queue without formatting them.
+
+    The message of a record is only formatted by the listener thread, so
+    logging a large payload costs the caller a queue insertion. The
+    arguments of a record must therefore not be mutated after logging it.
+    When the queue is full, records are dropped rather than blocking the
+    caller, and counted in :obj:`dropped`.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class PayloadLimiter:
+    r"""Bound the size of log messages.
+
+    Messages longer than :obj:`max_message_chars` are truncated, or only
+    kept with probability :obj:`sample_rate`. Their full text can be
+    written to a gzip compressed trace file, one JSON line per message,
+    the truncated message referencing its line by id.
+
+    Args:
+        max_message_chars (int, optional): The size threshold of the
+            messages. (default: :obj:`4096`)
+        sample_rate (float, optional): The probability to keep an oversized
+            message. (default: :obj:`1.0`)
+        trace_path (Union[str, Path], optional): The trace file of the full
+            oversized messages. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        max_message_chars: int = 4096,
+        sample_rate: float = 1.0,
+        trace_path: Optional[Union[str, Path]] = None,
+    ):
+        self.max_message_chars = max_message_chars
+        self.sample_rate = sample_rate
+        self.trace_path = Path(trace_path) if trace_path else None
+        self._trace_file: Optional[IO[str]] = None
+        self._next_id = 0
+        self.truncated = 0
+        self.sampled_out = 0
+
+    def _trace(self, record: logging.LogRecord, message: str) -> Optional[int]:
+        if self.trace_path is None:
+            return None
+        if self._trace_file is None:
+            self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+            self._trace_file = gzip.open(self.trace_path, "at", encoding="utf-8")
+        trace_id = self._next_id
+        self._next_id += 1
+        self._trace_file.write(
+            json.dumps(
+                {
+                    "id": trace_id,
+                    "created": record.created,
+                    "logger": record.name,
+                    "level": record.levelname,
+                    "message": message,
+                },
+                ensure_ascii=False,
+            )
+            + "\n"
+        )
+        return trace_id
+
+    def process(self, record: logging.LogRecord) -> Optional[logging.LogRecord]:
+        r"""Format the message of a record, bounding its size.
+
+        Returns:
+            Optional[logging.LogRecord]: The record, or :obj:`None` if it was
+                sampled out.
+        """
+        message = record.getMessage()
+        if len(message) > self.max_message_chars:
+            trace_id = self._trace(record, message)
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                return None
+            self.truncated += 1
+            reference = f", trace id {trace_id}" if trace_id is not None else ""
+            message = (
+                f"{message[: self.max_message_chars]}... "
+                f"[{len(message) - self.max_message_chars} more chars{reference}]"
+            )
+        record.msg = message
+        record.args = None
+        return record
+
+    def close(self) -> None:
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+
+class _PayloadListener(QueueListener):
+    def __init__(self, log_queue, limiter: PayloadLimiter, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.limiter = limiter
+
+    def handle(self, record: logging.LogRecord) -> None:
+        prepared = self.limiter.process(record)
+        if prepared is not None:
+            super().handle(prepared)
+
+
+class AsyncLogging:
+    r"""Move the log handlers of the root and `camel` loggers behind a
+    bounded queue, served by a background thread.
+
+    The caller of a logging function only enqueues the record: formatting,
+    size bounding by a :obj:`PayloadLimiter` and I/O happen in the
+    background, so large payloads no longer block the society loop or the
+    event loop of :func:`arun_society`.
+
+    The handlers of the `camel` logger are served by the same queue, through
+    the root logger.
+
+    Args:
+        handlers (List[logging.Handler], optional): The handlers to serve.
+            (default: the handlers of the root and `camel` loggers)
+        max_message_chars (int, optional): The size threshold of the
+            messages. (default: :obj:`4096`)
+        sample_rate (float, optional): The probability to keep an oversized
+            message. (default: :obj:`1.0`)
+        trace_path (Union[str, Path], optional): The gzip compressed trace
+            file of the full oversized messages. (default: :obj:`None`)
+        queue_size (int, optional): The capacity of the queue, records are
+            dropped when it is full. (default: :obj:`10000`)
+    """
+
+    def __init__(
+        self,
+        handlers: Optional[List[logging.Handler]] = None,
+        max_message_chars: int = 4096,
+        sample_rate: float = 1.0,
+        trace_path: Optional[Union[str, Path]] = None,
+        queue_size: int = 10000,
+    ):
+        self.handlers = handlers
+        self.limiter = PayloadLimiter(max_message_chars, sample_rate, trace_path)
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.queue_handler = LazyQueueHandler(self.queue)
+        self._listener: Optional[_PayloadListener] = None
+        self._moved: List[tuple] = []
+        self._lock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        r"""The number of records dropped because the queue was full."""
+        return self.queue_handler.dropped
+
+    def start(self) -> "AsyncLogging":
+        with self._lock:
+            if self._listener is not None:
+                return self
+            handlers = self.handlers
+            if handlers is None:
+                handlers = []
+                for logger in (logging.getLogger(), logging.getLogger("camel")):
+                    for handler in logger.handlers[:]:
+                        logger.removeHandler(handler)
+                        self._moved.append((logger, handler))
+                        if handler not in handlers:
+                            handlers.append(handler)
+            logging.getLogger().addHandler(self.queue_handler)
+            self._listener = _PayloadListener(self.queue, self.limiter, *handlers)
+            self._listener.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self) -> None:
+        r"""Flush the queue, and restore the handlers."""
+        with self._lock:
+            if self._listener is None:
+                return
+            logging.getLogger().removeHandler(self.queue_handler)
+            self._listener.stop()
+            self._listener = None
+            for logger, handler in self._moved:
+                logger.addHandler(handler)
+            self._moved = []
+            self.limiter.close()
+            atexit.unregister(self.stop)
+
+    def __enter__(self) -> "AsyncLogging":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def setup_async_logging(**kwargs) -> AsyncLogging:
+    r"""Start an :obj:`AsyncLogging` with the given arguments.
+
+    Returns:
+        AsyncLogging: The started instance, call :meth:`AsyncLogging.stop`
+            to flush it.
+    """
+    return AsyncLogging(**kwargs).start()
@@ -0,0 +1,308 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from camel.logger import get_logger
+
+from .common import resolve_import
+from .document_toolkit import DocumentProcessingToolkit
+
+logger = get_logger(__name__)
+
+# The attachments read by `DocumentProcessingToolkit`, which cannot
+# transcribe audio or video files
+EXTRACTABLE_SUFFIXES = frozenset(
+    {
+        ".pdf",
+        ".docx",
+        ".doc",
+        ".pptx",
+        ".txt",
+        ".md",
+        ".csv",
+        ".xlsx",
+        ".xls",
+        ".json",
+        ".jsonl",
+        ".jsonld",
+        ".xml",
+        ".py",
+        ".zip",
+        ".jpg",
+        ".jpeg",
+        ".png",
+    }
+)
+
+ATTACHMENT_PROMPT = """
+Here is the content extracted from the attached file {file_name}, so you do not need to extract it again:
+<attachment_content>
+{content}
+</attachment_content>
+"""
+
+ATTACHMENT_SUMMARY_PROMPT = """
+Here is a summary of the content of the attached file {file_name}. Its full content is too long to be given here, read the file with your tools when you need details:
+<attachment_summary>
+{summary}
+</attachment_summary>
+"""
+
+
+@dataclass
+class ExtractedAttachment:
+    r"""The content extracted from an attachment.
+
+    Args:
+        sha256 (str): The SHA-256 hash of the file, the key of the cache.
+        file_name (str): The name of the file it was extracted from.
+        success (bool): Whether the extraction succeeded.
+        content (str): The extracted content, or the error.
+        summary (str, optional): A summary of the content.
+            (default: :obj:`None`)
+    """
+
+    sha256: str
+    file_name: str
+    success: bool
+    content: str
+    summary: Optional[str] = None
+
+    def to_prompt(self, max_chars: int = 20000) -> Optional[str]:
+        r"""The text offering the content to a society.
+
+        Args:
+            max_chars (int, optional): The maximum length of the content
+                given in full. A longer content is given as its summary, or
+                not at all without summary. (default: :obj:`20000`)
+
+        Returns:
+            Optional[str]: The text, :obj:`None` if there is nothing to give.
+        """
+        if not self.success:
+            return None
+        if len(self.content) <= max_chars:
+            return ATTACHMENT_PROMPT.format(
+                file_name=self.file_name, content=self.content
+            )
+        if self.summary:
+            return ATTACHMENT_SUMMARY_PROMPT.format(
+                file_name=self.file_name, summary=self.summary
+            )
+        return None
+
+
+def file_sha256(path: Union[str, Path]) -> str:
+    r"""The SHA-256 hash of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AttachmentCache:
+    r"""A content-addressed cache of the content extracted from attachments.
+
+    Entries are keyed by the hash of the file, so an attachment copied or
+    shared by several tasks is extracted once, and a modified file is
+    extracted again. Each entry is a JSON file of the cache directory, which
+    can be shared by successive runs.
+
+    Args:
+        cache_dir (Union[str, Path]): The directory of the cache. The files
+            unpacked from archives are stored in its `files` directory.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.files_dir = self.cache_dir / "files"
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+
+    def key(self, path: Union[str, Path]) -> str:
+        r"""The key of a file, its hash, computed once per version of the
+        file."""
+        stat = os.stat(path)
+        version = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            sha256 = self._hashes.get(version)
+        if sha256 is None:
+            sha256 = file_sha256(path)
+            with self._lock:
+                self._hashes[version] = sha256
+        return sha256
+
+    def _entry_path(self, sha256: str) -> Path:
+        return self.cache_dir / sha256[:2] / f"{sha256}.json"
+
+    def get(self, path: Union[str, Path]) -> Optional[ExtractedAttachment]:
+        r"""Get the content extracted from a file, :obj:`None` if it was not
+        extracted yet."""
+        entry_path = self._entry_path(self.key(path))
+        if not entry_path.exists():
+            return None
+        with open(entry_path, "r", encoding="utf-8") as f:
+            return ExtractedAttachment(**json.load(f))
+
+    def put(self, attachment: ExtractedAttachment) -> None:
+        r"""Store the content extracted from a file."""
+        entry_path = self._entry_path(attachment.sha256)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(attachment), f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+
+# The toolkit of a worker process, built once
+_worker_toolkit: Optional[DocumentProcessingToolkit] = None
+
+
+def _init_extractor(files_dir: str, model_factory: Optional[Union[str, Callable]]):
+    global _worker_toolkit
+    model = resolve_import(model_factory)() if model_factory is not None else None
+    _worker_toolkit = DocumentProcessingToolkit(cache_dir=files_dir, model=model)
+
+
+def _extract(path: str) -> Tuple[bool, str]:
+    success, content = _worker_toolkit.extract_document_content(path)
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+    return success, content
+
+
+def extract_attachments(
+    paths: Iterable[Union[str, Path]],
+    cache: AttachmentCache,
+    processes: Optional[int] = None,
+    model_factory: Optional[Union[str, Callable]] = None,
+    summarizer: Optional[Callable[[str], str]] = None,
+    summarize_above: int = 20000,
+) -> Dict[str, ExtractedAttachment]:
+    r"""Extract the content of attachments in parallel, with the
+    :obj:`DocumentProcessingToolkit` of a pool of worker processes.
+
+    The files already in the cache, and those the toolkit cannot read, are
+    skipped. Identical files are extracted once. Only the successful
+    extractions are cached and returned, the failed ones are tried again by
+    the next call.
+
+    Args:
+        paths (Iterable[Union[str, Path]]): The files.
+        cache (AttachmentCache): The cache of the extracted contents.
+        processes (int, optional): The number of worker processes.
+            (default: the number of CPUs)
+        model_factory (Union[str, Callable], optional): The function building
+            the model captioning the images in each worker, as an import path
+            or a top level function. (default: the default model of camel)
+        summarizer (Callable[[str], str], optional): A function summarizing
+            the contents longer than :obj:`summarize_above` characters, e.g.
+            a :func:`model_summarizer`. It is called in the calling process.
+            (default: :obj:`None`)
+        summarize_above (int, optional): The length above which contents are
+            summarized. (default: :obj:`20000`)
+
+    Returns:
+        Dict[str, ExtractedAttachment]: The extracted content of each path,
+            from the cache or extracted now.
+    """
+    candidates = sorted(
+        {
+            str(path)
+            for path in paths
+            if Path(path).suffix.lower() in EXTRACTABLE_SUFFIXES
+        }
+    )
+    results: Dict[str, ExtractedAttachment] = {}
+    pending: Dict[str, str] = {}
+    for path in candidates:
+        if not Path(path).is_file():
+            logger.warning(f"Attachment not found: {path}")
+            continue
+        attachment = cache.get(path)
+        # The failures cached by earlier versions are tried again
+        if attachment is not None and attachment.success:
+            results[path] = attachment
+            continue
+        pending.setdefault(cache.key(path), path)
+
+    if pending:
+        logger.info(f"Extracting {len(pending)} attachments.")
+        with ProcessPoolExecutor(
+            max_workers=min(processes or os.cpu_count() or 1, len(pending)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_extractor,
+            initargs=(str(cache.files_dir), model_factory),
+        ) as executor:
+            futures = {
+                executor.submit(_extract, path): (sha256, path)
+                for sha256, path in pending.items()
+            }
+            for future in as_completed(futures):
+                sha256, path = futures[future]
+                try:
+                    success, content = future.result()
+                except Exception as e:
+                    success, content = False, str(e)
+                if not success:
+                    # The toolkit reports transient failures, e.g. of the
+                    # captioning model, the same way as unreadable files, so
+                    # failures are not cached and are tried again by the
+                    # next run
+                    logger.warning(f"Failed to extract {path}: {content}")
+                    continue
+                attachment = ExtractedAttachment(
+                    sha256=sha256,
+                    file_name=Path(path).name,
+                    success=success,
+                    content=content,
+                )
+                cache.put(attachment)
+                results[path] = attachment
+
+    if summarizer is not None:
+        for attachment in {id(a): a for a in results.values()}.values():
+            if (
+                attachment.success
+                and attachment.summary is None
+                and len(attachment.content) > summarize_above
+            ):
+                try:
+                    attachment.summary = summarizer(attachment.content)
+                except Exception as e:
+                    logger.warning(f"Failed to summarize {attachment.file_name}: {e}")
+                    continue
+                cache.put(attachment)
+
+    # The paths sharing a file share its content, under their own name
+    for path in candidates:
+        if path not in results and Path(path).is_file():
+            attachment = cache.get(path)
+            if attachment is not None and attachment.success:
+                results[path] = attachment
+    return {
+        path: replace(attachment, file_name=Path(path).name)
+        for path, attachment in results.items()
+    }
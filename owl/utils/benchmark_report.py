@@ -0,0 +1,503 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import csv
+import html
+import json
+import statistics
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .result_store import ResultStore
+
+# The reasons of a society stopping without a final answer, `stalled` being
+# written by earlier versions
+_STOP_REASONS = ("round_limit", "final_answer", "stalled", "deadline", "cancelled")
+
+# A table of a report: its title, header and rows
+Table = Tuple[str, List[str], List[List[str]]]
+
+
+@dataclass
+class TaskMetrics:
+    r"""The cost and latency of a benchmark task.
+
+    Args:
+        task_id (str): The ID of the task.
+        level (str): The level of the task.
+        correct (bool): Whether the answer is correct.
+        wall_time (float, optional): The time the task took in seconds,
+            :obj:`None` for the results which did not record it.
+        rounds (int): The number of rounds of the society.
+        prompt_tokens (int): The prompt tokens of all the model calls.
+        completion_tokens (int): The completion tokens of all the model calls.
+        llm_calls (int): The number of model calls.
+        tool_calls (Dict[str, List[Optional[float]]]): The duration of each
+            call of each tool, :obj:`None` where it was not recorded.
+        tool_errors (Dict[str, int]): The number of failed calls of each tool.
+        failure (str, optional): Why the task failed, :obj:`None` if it did
+            not. (default: :obj:`None`)
+    """
+
+    task_id: str
+    level: str
+    correct: bool
+    wall_time: Optional[float]
+    rounds: int
+    prompt_tokens: int
+    completion_tokens: int
+    llm_calls: int
+    tool_calls: Dict[str, List[Optional[float]]] = field(default_factory=dict)
+    tool_errors: Dict[str, int] = field(default_factory=dict)
+    failure: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @classmethod
+    def from_result(
+        cls,
+        result: Dict[str, Any],
+        history: Optional[List[Dict[str, Any]]] = None,
+    ) -> "TaskMetrics":
+        r"""The metrics of a result written by :obj:`GAIABenchmark`.
+
+        The token counts are the sums of the usage recorded for each round.
+        The results of earlier versions, which did not record it, fall back
+        to their `token_info`, and to their history for the rounds and tool
+        calls, without durations.
+
+        Args:
+            result (Dict[str, Any]): The result.
+            history (List[Dict[str, Any]], optional): Its chat history, when
+                not in the result. (default: :obj:`None`)
+        """
+        history = result.get("history") or history or []
+        tool_calls: Dict[str, List[Optional[float]]] = defaultdict(list)
+        tool_errors: Dict[str, int] = defaultdict(int)
+        rounds = result.get("rounds")
+        if rounds is not None:
+            prompt_tokens = sum(r["prompt_tokens"] for r in rounds)
+            completion_tokens = sum(r["completion_tokens"] for r in rounds)
+            llm_calls = sum(r["llm_calls"] for r in rounds)
+            for r in rounds:
+                for call in r["tool_calls"]:
+                    tool_calls[call["tool_name"]].append(call["duration"])
+                    if call.get("error"):
+                        tool_errors[call["tool_name"]] += 1
+            round_count = len(rounds)
+        else:
+            token_info = result.get("token_info") or {}
+            prompt_tokens = token_info.get("prompt_token_count", 0)
+            completion_tokens = token_info.get("completion_token_count", 0)
+            llm_calls = token_info.get("llm_call_count", 0)
+            for entry in history:
+                for call in entry.get("tool_calls") or []:
+                    tool_calls[call["tool_name"]].append(None)
+            round_count = len(history)
+
+        return cls(
+            task_id=str(result["task_id"]),
+            level=str(result.get("level")),
+            correct=bool(result.get("score")),
+            wall_time=result.get("wall_time"),
+            rounds=round_count,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            llm_calls=llm_calls,
+            tool_calls=dict(tool_calls),
+            tool_errors=dict(tool_errors),
+            failure=failure_category(result),
+        )
+
+
+def failure_category(result: Dict[str, Any]) -> Optional[str]:
+    r"""Why a task failed: `error:<exception>` for a society which raised,
+    `missing_attachment` for a task whose file was not found, the reason the
+    society stopped without a final answer, `no_answer`, or `wrong_answer`.
+
+    Returns:
+        Optional[str]: The category, :obj:`None` for a correct answer.
+    """
+    if result.get("score"):
+        return None
+    if result.get("error"):
+        return "error:" + result["error"].split(":", 1)[0]
+    if (
+        result.get("ground_truth") is None
+        and result.get("history") is None
+        and result.get("history_ref") is None
+        and "rounds" not in result
+    ):
+        return "missing_attachment"
+    if result.get("model_answer") is None:
+        reason = result.get("termination_reason")
+        return reason if reason in _STOP_REASONS else "no_answer"
+    return "wrong_answer"
+
+
+def load_task_metrics(path: Union[str, Path]) -> List[TaskMetrics]:
+    r"""Read the metrics of the tasks of a run, from a :obj:`ResultStore`
+    (a `.jsonl` file) or the JSON list written by earlier versions of
+    :obj:`GAIABenchmark`.
+
+    The histories are only read for the results without recorded rounds,
+    one at a time.
+    """
+    path = Path(path)
+    if path.suffix != ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            return [TaskMetrics.from_result(result) for result in json.load(f)]
+    with ResultStore(path) as store:
+        return [
+            TaskMetrics.from_result(
+                record,
+                store.load_history(record) if "rounds" not in record else None,
+            )
+            for record in store.results()
+        ]
+
+
+def _percentiles(samples: Iterable[Optional[float]]) -> Dict[str, Optional[float]]:
+    samples = sorted(sample for sample in samples if sample is not None)
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        "max": samples[-1],
+    }
+
+
+def _format(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}" if abs(value) < 100 else f"{value:.1f}"
+    return str(value)
+
+
+def _change(old: Any, new: Any) -> str:
+    if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+        return "-"
+    if not old:
+        return "-" if not new else "new"
+    return f"{(new - old) / old:+.1%}"
+
+
+class BenchmarkReport:
+    r"""The cost and latency of a benchmark run, per level.
+
+    For each group of tasks, all of them and each level, the report gives
+    the accuracy, the wall time, rounds and tokens of the tasks (p50, p95
+    and max), the correct answers per thousand tokens, the calls and latency
+    of each tool, and the categories of the failures. It is written as
+    Markdown or HTML tables, and the metrics of each task as CSV. Given the
+    report of a baseline run, the tables compare both runs side by side.
+
+    Reports are generated from the command line with
+    `python -m owl.utils.results_cli report`.
+
+    Args:
+        tasks (List[TaskMetrics]): The metrics of the tasks of the run.
+        name (str, optional): The name of the run. (default: :obj:`"run"`)
+    """
+
+    def __init__(self, tasks: List[TaskMetrics], name: str = "run"):
+        self.tasks = tasks
+        self.name = name
+
+    @classmethod
+    def from_file(
+        cls, path: Union[str, Path], name: Optional[str] = None
+    ) -> "BenchmarkReport":
+        r"""The report of the results of a file, see :func:`load_task_metrics`.
+
+        Args:
+            path (Union[str, Path]): The results.
+            name (str, optional): The name of the run. (default: the name of
+                the file)
+        """
+        return cls(load_task_metrics(path), name=name or Path(path).stem)
+
+    def groups(self) -> Dict[str, List[TaskMetrics]]:
+        r"""The tasks of each group: `all`, then each level."""
+        groups: Dict[str, List[TaskMetrics]] = {"all": self.tasks}
+        for level in sorted({task.level for task in self.tasks}):
+            groups[f"level {level}"] = [t for t in self.tasks if t.level == level]
+        return groups
+
+    @staticmethod
+    def summarize(tasks: Sequence[TaskMetrics]) -> Dict[str, Any]:
+        r"""The metrics of a group of tasks."""
+        correct = sum(task.correct for task in tasks)
+        total_tokens = sum(task.total_tokens for task in tasks)
+        summary: Dict[str, Any] = {
+            "tasks": len(tasks),
+            "correct": correct,
+            "accuracy": correct / len(tasks) if tasks else 0.0,
+            "prompt_tokens": sum(task.prompt_tokens for task in tasks),
+            "completion_tokens": sum(task.completion_tokens for task in tasks),
+            "llm_calls": sum(task.llm_calls for task in tasks),
+            "tool_calls": sum(
+                len(durations)
+                for task in tasks
+                for durations in task.tool_calls.values()
+            ),
+            "correct_per_1k_tokens": (
+                correct / (total_tokens / 1000) if total_tokens else None
+            ),
+        }
+        metrics = {
+            "wall_time_s": [task.wall_time for task in tasks],
+            "rounds": [task.rounds for task in tasks],
+            "tokens": [task.total_tokens for task in tasks],
+        }
+        for name, samples in metrics.items():
+            for stat, value in _percentiles(samples).items():
+                summary[f"{name}_{stat}"] = value
+        return summary
+
+    @staticmethod
+    def tool_stats(tasks: Sequence[TaskMetrics]) -> Dict[str, Dict[str, Any]]:
+        r"""The calls, failed calls and latency in seconds of each tool of a
+        group of tasks."""
+        durations: Dict[str, List[Optional[float]]] = defaultdict(list)
+        errors: Counter = Counter()
+        for task in tasks:
+            for tool_name, calls in task.tool_calls.items():
+                durations[tool_name].extend(calls)
+            errors.update(task.tool_errors)
+        return {
+            tool_name: {
+                "calls": len(calls),
+                "errors": errors[tool_name],
+                **{
+                    f"latency_{stat}_s": value
+                    for stat, value in _percentiles(calls).items()
+                },
+            }
+            for tool_name, calls in sorted(durations.items())
+        }
+
+    @staticmethod
+    def failures(tasks: Sequence[TaskMetrics]) -> Dict[str, int]:
+        r"""The number of failed tasks of each category."""
+        return dict(
+            Counter(task.failure for task in tasks if task.failure).most_common()
+        )
+
+    def tables(self, baseline: Optional["BenchmarkReport"] = None) -> List[Table]:
+        r"""The tables of the report, comparing each value to the one of
+        :obj:`baseline` if given."""
+        tables: List[Table] = []
+        baseline_groups = baseline.groups() if baseline is not None else {}
+        for group, tasks in self.groups().items():
+            base_tasks = baseline_groups.get(group)
+            sections = [
+                ("Summary", {"": self.summarize(tasks)}, "metric"),
+                ("Tools", self.tool_stats(tasks), "tool"),
+                (
+                    "Failures",
+                    {name: {"tasks": n} for name, n in self.failures(tasks).items()},
+                    "category",
+                ),
+            ]
+            base_sections = (
+                [
+                    {"": self.summarize(base_tasks)},
+                    self.tool_stats(base_tasks),
+                    {n: {"tasks": c} for n, c in self.failures(base_tasks).items()},
+                ]
+                if base_tasks is not None
+                else [None] * len(sections)
+            )
+            for (title, rows, key), base_rows in zip(sections, base_sections):
+                table = self._table(rows, base_rows, key, baseline)
+                if table[1]:
+                    tables.append((f"{title} ({group})", *table))
+        return tables
+
+    def _table(
+        self,
+        rows: Dict[str, Dict[str, Any]],
+        base_rows: Optional[Dict[str, Dict[str, Any]]],
+        key: str,
+        baseline: Optional["BenchmarkReport"],
+    ) -> Tuple[List[str], List[List[str]]]:
+        # The summary is one column per run, the others one row per name
+        if "" in rows:
+            current = rows[""]
+            header = [key, self.name]
+            if baseline is None:
+                return header, [[m, _format(v)] for m, v in current.items()]
+            old = (base_rows or {}).get("", {})
+            return header[:1] + [baseline.name, self.name, "change"], [
+                [m, _format(old.get(m)), _format(v), _change(old.get(m), v)]
+                for m, v in current.items()
+            ]
+        names = list(rows)
+        if base_rows:
+            names += [name for name in base_rows if name not in rows]
+        if not names:
+            return [], []
+        columns = list(next(iter({**(base_rows or {}), **rows}.values())))
+        if baseline is None:
+            return [key] + columns, [
+                [name] + [_format(rows[name].get(c)) for c in columns] for name in names
+            ]
+        base_rows = base_rows or {}
+        header = [key]
+        for column in columns:
+            header += [f"{column} ({baseline.name})", f"{column} ({self.name})"]
+        body = []
+        for name in names:
+            row = [name]
+            for column in columns:
+                row += [
+                    _format(base_rows.get(name, {}).get(column)),
+                    _format(rows.get(name, {}).get(column)),
+                ]
+            body.append(row)
+        return header, body
+
+    def to_markdown(self, baseline: Optional["BenchmarkReport"] = None) -> str:
+        r"""The report as Markdown tables.
+
+        Args:
+            baseline (BenchmarkReport, optional): The report of a run to
+                compare to. (default: :obj:`None`)
+        """
+        title = self.name if baseline is None else f"{baseline.name} vs {self.name}"
+        lines = [f"# Benchmark report: {title}", ""]
+        for table_title, header, rows in self.tables(baseline):
+            lines += [f"## {table_title}", ""]
+            lines.append("| " + " | ".join(header) + " |")
+            lines.append("|" + "|".join(" --- " for _ in header) + "|")
+            lines += ["| " + " | ".join(row) + " |" for row in rows]
+            lines.append("")
+        return "\n".join(lines)
+
+    def to_html(self, baseline: Optional["BenchmarkReport"] = None) -> str:
+        r"""The report as a standalone HTML page.
+
+        Args:
+            baseline (BenchmarkReport, optional): The report of a run to
+                compare to. (default: :obj:`None`)
+        """
+        title = self.name if baseline is None else f"{baseline.name} vs {self.name}"
+        parts = [
+            "<!DOCTYPE html>",
+            '<html><head><meta charset="utf-8">',
+            f"<title>Benchmark report: {html.escape(title)}</title>",
+            "<style>table{border-collapse:collapse;margin-bottom:1.5em}"
+            "th,td{border:1px solid #ccc;padding:4px 8px;text-align:right}"
+            "th:first-child,td:first-child{text-align:left}</style>",
+            f"</head><body><h1>Benchmark report: {html.escape(title)}</h1>",
+        ]
+        for table_title, header, rows in self.tables(baseline):
+            parts.append(f"<h2>{html.escape(table_title)}</h2><table>")
+            parts.append(
+                "<tr>" + "".join(f"<th>{html.escape(h)}</th>" for h in header) + "</tr>"
+            )
+            for row in rows:
+                parts.append(
+                    "<tr>"
+                    + "".join(f"<td>{html.escape(c)}</td>" for c in row)
+                    + "</tr>"
+                )
+            parts.append("</table>")
+        parts.append("</body></html>")
+        return "\n".join(parts)
+
+    def write_csv(self, path: Union[str, Path]) -> None:
+        r"""Write the metrics of each task as CSV, one row per task, with the
+        calls of each tool in its own column."""
+        tool_names = sorted({name for task in self.tasks for name in task.tool_calls})
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                [
+                    "task_id",
+                    "level",
+                    "correct",
+                    "failure",
+                    "wall_time_s",
+                    "rounds",
+                    "prompt_tokens",
+                    "completion_tokens",
+                    "llm_calls",
+                    "tool_time_s",
+                ]
+                + [f"calls:{name}" for name in tool_names]
+            )
+            for task in self.tasks:
+                tool_time = sum(
+                    d for calls in task.tool_calls.values() for d in calls if d
+                )
+                writer.writerow(
+                    [
+                        task.task_id,
+                        task.level,
+                        int(task.correct),
+                        task.failure or "",
+                        "" if task.wall_time is None else f"{task.wall_time:.3f}",
+                        task.rounds,
+                        task.prompt_tokens,
+                        task.completion_tokens,
+                        task.llm_calls,
+                        f"{tool_time:.3f}",
+                    ]
+                    + [len(task.tool_calls.get(name, [])) for name in tool_names]
+                )
+
+    def write(
+        self,
+        output_dir: Union[str, Path],
+        baseline: Optional["BenchmarkReport"] = None,
+        formats: Sequence[str] = ("md", "html", "csv"),
+    ) -> List[Path]:
+        r"""Write the report to a directory, as `report.md`, `report.html` and
+        `tasks.csv`.
+
+        Args:
+            output_dir (Union[str, Path]): The directory.
+            baseline (BenchmarkReport, optional): The report of a run to
+                compare to. Its tasks are written to `baseline_tasks.csv`.
+                (default: :obj:`None`)
+            formats (Sequence[str], optional): The formats to write.
+                (default: :obj:`("md", "html", "csv")`)
+
+        Returns:
+            List[Path]: The files written.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        if "md" in formats:
+            written.append(output_dir / "report.md")
+            written[-1].write_text(self.to_markdown(baseline), encoding="utf-8")
+        if "html" in formats:
+            written.append(output_dir / "report.html")
+            written[-1].write_text(self.to_html(baseline), encoding="utf-8")
+        if "csv" in formats:
+            written.append(output_dir / "tasks.csv")
+            self.write_csv(written[-1])
+            if baseline is not None:
+                written.append(output_dir / "baseline_tasks.csv")
+                baseline.write_csv(written[-1])
+        return written
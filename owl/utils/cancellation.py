@@ -0,0 +1,279 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import inspect
+import threading
+import time
+from typing import Awaitable, Callable, Iterable, List, Optional, TypeVar, Union
+
+from camel.logger import get_logger
+from camel.toolkits import FunctionTool
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class CancellationError(RuntimeError):
+    r"""Raised when the work of a society is cancelled or passes its
+    deadline.
+
+    Args:
+        reason (str): `"cancelled"` or `"deadline"`.
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(f"Society stopped: {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    r"""A cancellation token with an optional deadline, shared by the agents
+    and the loop of a society.
+
+    The token can be passed wherever camel expects a `stop_event`: its
+    :meth:`is_set` is true once it was cancelled or its deadline passed, so
+    agents stop after their current model call. The society loops also check
+    it between rounds and between tool calls, and :meth:`run` cancels the
+    in-flight async model and tool calls.
+
+    Args:
+        timeout (float, optional): The time in seconds after which the token
+            is cancelled with the `"deadline"` reason. (default: :obj:`None`)
+        event (threading.Event, optional): An event cancelling the token when
+            set, e.g. the stop flag of an UI. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        event: Optional[threading.Event] = None,
+    ):
+        self.event = event or threading.Event()
+        self.deadline: Optional[float] = None
+        self._reason: Optional[str] = None
+        self._callbacks: List[Callable[[], object]] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        if timeout is not None:
+            self.limit(timeout)
+
+    def limit(self, timeout: float) -> "CancelToken":
+        r"""Move the deadline of the token to :obj:`timeout` seconds from
+        now, unless it is already earlier.
+
+        The token is cancelled by a timer at its deadline, so that its
+        callbacks run even while the society is blocked in a tool call. The
+        timer of an earlier deadline stopped by :meth:`close` is restarted.
+        """
+        now = time.monotonic()
+        deadline = now + timeout
+        with self._lock:
+            if self._reason is not None:
+                return self
+            if self.deadline is not None and self.deadline <= deadline:
+                if self._timer is not None:
+                    return self
+                deadline = self.deadline
+            self.deadline = deadline
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(
+                max(0.0, deadline - now), self.cancel, args=("deadline",)
+            )
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        r"""Cancel the token, and run its callbacks."""
+        with self._lock:
+            if self._reason is None:
+                self._reason = reason
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.event.set()
+        self._run_callbacks()
+
+    # `threading.Event` interface, for camel's `stop_event`
+    set = cancel
+
+    def is_set(self) -> bool:
+        return self.cancelled
+
+    @property
+    def cancelled(self) -> bool:
+        if self._reason is not None:
+            return True
+        if self.event.is_set():
+            self.cancel("cancelled")
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+            return True
+        return False
+
+    @property
+    def reason(self) -> Optional[str]:
+        r"""`"cancelled"` or `"deadline"`, :obj:`None` if not cancelled."""
+        return self._reason if self.cancelled else None
+
+    def remaining(self) -> Optional[float]:
+        r"""The time in seconds until the deadline, :obj:`None` without
+        deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        r"""Raise :obj:`CancellationError` if the token was cancelled."""
+        if self.cancelled:
+            raise CancellationError(self._reason or "cancelled")
+
+    def on_cancel(self, callback: Callable[[], object]) -> Callable[[], object]:
+        r"""Register a callback run once when the token is cancelled, e.g. to
+        release the resources of the tools.
+
+        Returns:
+            Callable[[], object]: The callback, to be removed by
+                :meth:`close`.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+        if self._reason is not None:
+            self._run_callbacks()
+        return callback
+
+    def close(self, callbacks: Iterable[Callable[[], object]] = ()) -> None:
+        r"""Stop the deadline timer and remove callbacks, once the work the
+        token was limiting ended without being cancelled.
+
+        The deadline is still checked by :attr:`cancelled`, and its timer is
+        restarted by the next :meth:`limit`, so that the token can be reused
+        by another run.
+
+        Args:
+            callbacks (Iterable[Callable[[], object]], optional): The
+                callbacks registered by the ended work. (default: :obj:`()`)
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            removed = set(map(id, callbacks))
+            self._callbacks = [c for c in self._callbacks if id(c) not in removed]
+
+    def _run_callbacks(self) -> None:
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+    async def run(self, awaitable: Awaitable[T], poll_interval: float = 0.2) -> T:
+        r"""Await an awaitable, cancelling it as soon as the token is.
+
+        Args:
+            awaitable (Awaitable[T]): The model or tool call.
+            poll_interval (float, optional): The interval in seconds at which
+                the token is checked. (default: :obj:`0.2`)
+
+        Returns:
+            T: The result of the awaitable.
+
+        Raises:
+            CancellationError: If the token was cancelled first.
+        """
+        self.check()
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while True:
+                timeout = poll_interval
+                remaining = self.remaining()
+                if remaining is not None:
+                    timeout = min(timeout, remaining)
+                done, _ = await asyncio.wait({task}, timeout=timeout)
+                if done:
+                    return task.result()
+                self.check()
+        finally:
+            if not task.done():
+                task.cancel()
+
+
+def _close_interpreter(interpreter: object) -> None:
+    # The docker and Jupyter interpreters start their sandbox lazily, so
+    # they can still be used after it was removed
+    container = getattr(interpreter, "_container", None)
+    if container is not None:
+        interpreter._container = None  # type: ignore[attr-defined]
+        container.remove(force=True)
+    kernel_manager = getattr(interpreter, "kernel_manager", None)
+    if kernel_manager is not None:
+        client = getattr(interpreter, "client", None)
+        interpreter.kernel_manager = None  # type: ignore[attr-defined]
+        interpreter.client = None  # type: ignore[attr-defined]
+        if client is not None:
+            client.stop_channels()
+        kernel_manager.shutdown_kernel(now=True)
+
+
+def _close_toolkit(toolkit: object) -> None:
+    close = getattr(toolkit, "close", None) or getattr(toolkit, "cleanup", None)
+    if callable(close):
+        result = close()
+        if inspect.isawaitable(result):
+            try:
+                asyncio.get_running_loop().create_task(result)
+            except RuntimeError:
+                asyncio.run(result)
+    browser = getattr(toolkit, "browser", None)
+    # `BrowserToolkit.browse_url` launches a new browser on each call
+    if browser is not None and getattr(browser, "browser", None) is not None:
+        browser.close()
+    interpreter = getattr(toolkit, "interpreter", None)
+    if interpreter is not None:
+        _close_interpreter(interpreter)
+
+
+def release_tool_resources(tools: Iterable[Union[FunctionTool, Callable]]) -> None:
+    r"""Close the browsers and code sandboxes held by the toolkits of some
+    tools, so that the work running in them stops.
+
+    The toolkits are found through the bound methods of the tools, also when
+    wrapped by a :obj:`ToolCache`. A toolkit is closed with its own `close`
+    or `cleanup` method if any, then its browser is closed, and the docker
+    container or Jupyter kernel of its interpreter is removed. These are
+    started again on the next call, but the calls in flight in them fail, so
+    only release the toolkits no other society is using.
+
+    Args:
+        tools (Iterable[Union[FunctionTool, Callable]]): The tools.
+    """
+    toolkits = {}
+    for tool in tools:
+        func = tool.func if isinstance(tool, FunctionTool) else tool
+        toolkit = getattr(inspect.unwrap(func), "__self__", None)
+        if toolkit is not None:
+            toolkits[id(toolkit)] = toolkit
+
+    for toolkit in toolkits.values():
+        try:
+            _close_toolkit(toolkit)
+        except Exception as e:
+            logger.warning(f"Failed to release {type(toolkit).__name__}: {e}")
@@ -0,0 +1,314 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Tuple, Type, Union
+
+from camel.logger import get_logger
+from camel.messages import OpenAIMessage
+from camel.models import BaseModelBackend
+from camel.models.stub_model import StubTokenCounter
+from camel.types import ChatCompletion, UnifiedModelType
+from camel.utils import BaseTokenCounter
+from pydantic import BaseModel
+
+logger = get_logger(__name__)
+
+
+def request_key(
+    messages: List[OpenAIMessage],
+    tools: Optional[List[Dict[str, Any]]] = None,
+    response_format: Optional[Type[BaseModel]] = None,
+) -> str:
+    r"""The key of a model request in a cassette: a hash of the canonical
+    JSON of its messages, tool schemas and response format."""
+    request = {
+        "messages": messages,
+        "tools": tools or [],
+        "response_format": (
+            response_format.model_json_schema() if response_format else None
+        ),
+    }
+    canonical = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    r"""The model responses recorded for a set of runs, stored one JSON line
+    per response. Paths ending with `.gz` are gzip compressed.
+
+    Each entry holds the request key, the model, the recorded latency and
+    the response. The same request may be recorded many times, its responses
+    are then replayed in the recorded order.
+
+    Args:
+        path (Union[str, Path]): The cassette file, created on the first
+            recorded response if missing.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._file: Optional[IO[bytes]] = None
+        if self.path.exists():
+            with self._open("rb") as f:
+                self.entries = [json.loads(line) for line in f if line.strip()]
+
+    def _open(self, mode: str) -> IO[bytes]:
+        if self.path.suffix == ".gz":
+            return gzip.open(self.path, mode)  # type: ignore[return-value]
+        return open(self.path, mode)
+
+    def record(
+        self, key: str, model: str, latency: float, response: ChatCompletion
+    ) -> None:
+        r"""Append a response to the cassette."""
+        entry = {
+            "key": key,
+            "model": model,
+            "latency": round(latency, 4),
+            "response": response.model_dump(mode="json", exclude_unset=True),
+        }
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False)
+        with self._lock:
+            self.entries.append(entry)
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self._open("ab")
+            self._file.write(line.encode("utf-8") + b"\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class RecordingModelBackend(BaseModelBackend):
+    r"""Wrap a model backend and record its responses to a cassette.
+
+    Streamed responses are passed through without being recorded, use the
+    model in non-stream mode while recording.
+
+    Args:
+        model (BaseModelBackend): The recorded model.
+        cassette (Cassette): The cassette the responses are appended to.
+    """
+
+    def __init__(self, model: BaseModelBackend, cassette: Cassette):
+        self.model = model
+        self.cassette = cassette
+        super().__init__(
+            model_type=model.model_type,
+            model_config_dict=model.model_config_dict,
+        )
+
+    @property
+    def token_counter(self) -> BaseTokenCounter:
+        return self.model.token_counter
+
+    @property
+    def token_limit(self) -> int:
+        return self.model.token_limit
+
+    @property
+    def stream(self) -> bool:
+        return self.model.stream
+
+    def check_model_config(self):
+        pass
+
+    def _record(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]],
+        tools: Optional[List[Dict[str, Any]]],
+        response: Any,
+        start_time: float,
+    ) -> None:
+        if not isinstance(response, ChatCompletion):
+            logger.warning("Streamed responses are not recorded")
+            return
+        self.cassette.record(
+            request_key(messages, tools, response_format),
+            str(self.model.model_type),
+            time.monotonic() - start_time,
+            response,
+        )
+
+    def _run(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        start_time = time.monotonic()
+        response = self.model.run(messages, response_format, tools or [])
+        self._record(messages, response_format, tools, response, start_time)
+        return response
+
+    async def _arun(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        start_time = time.monotonic()
+        response = await self.model.arun(messages, response_format, tools or [])
+        self._record(messages, response_format, tools, response, start_time)
+        return response
+
+
+class ReplayModelBackend(BaseModelBackend):
+    r"""Serve the responses of a cassette, without any model call.
+
+    A request is answered with the next unserved response recorded for its
+    key, the last one being served again once all were. When the key was
+    never recorded, e.g. because a tool returned a different result than
+    during the recording, the next response in recording order is served
+    instead, unless :obj:`strict` is set.
+
+    The delay of each response is :obj:`latency` plus :obj:`latency_scale`
+    times its recorded latency, so runs can be replayed at CPU speed or
+    with a realistic timing.
+
+    Args:
+        cassette (Cassette): The recorded responses.
+        model_type (Union[str, UnifiedModelType], optional): The model type
+            reported by the backend. (default: :obj:`"replay"`)
+        strict (bool, optional): Whether to raise on requests missing from
+            the cassette. (default: :obj:`False`)
+        latency (float, optional): The fixed delay of each response in
+            seconds. (default: :obj:`0.0`)
+        latency_scale (float, optional): The part of the recorded latency
+            added to the delay. (default: :obj:`0.0`)
+        token_counter (BaseTokenCounter, optional): The token counter of the
+            backend. (default: :obj:`StubTokenCounter()`)
+        token_limit (int, optional): The token limit of the backend.
+            (default: :obj:`999_999_999`)
+    """
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        model_type: Union[str, UnifiedModelType] = "replay",
+        strict: bool = False,
+        latency: float = 0.0,
+        latency_scale: float = 0.0,
+        token_counter: Optional[BaseTokenCounter] = None,
+        token_limit: int = 999_999_999,
+    ):
+        super().__init__(model_type=model_type, token_counter=token_counter)
+        self._token_counter: Optional[BaseTokenCounter] = token_counter
+        self.cassette = cassette
+        self.strict = strict
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._token_limit = token_limit
+
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[int]] = defaultdict(list)
+        for index, entry in enumerate(cassette.entries):
+            self._by_key[entry["key"]].append(index)
+        self._key_cursors: Dict[str, int] = defaultdict(int)
+        self._served: set = set()
+        self._cursor = 0
+        self.misses = 0
+
+    @property
+    def token_counter(self) -> BaseTokenCounter:
+        if self._token_counter is None:
+            self._token_counter = StubTokenCounter()
+        return self._token_counter
+
+    @property
+    def token_limit(self) -> int:
+        return self._token_limit
+
+    def check_model_config(self):
+        pass
+
+    def _next_entry(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            indices = self._by_key.get(key)
+            if indices:
+                cursor = self._key_cursors[key]
+                index = indices[min(cursor, len(indices) - 1)]
+                self._key_cursors[key] = cursor + 1
+            else:
+                self.misses += 1
+                if self.strict:
+                    raise ValueError(f"No response recorded for request {key[:12]}")
+                while self._cursor < len(self.cassette.entries) and (
+                    self._cursor in self._served
+                ):
+                    self._cursor += 1
+                if self._cursor >= len(self.cassette.entries):
+                    raise ValueError(
+                        f"No response recorded for request {key[:12]} and "
+                        "the cassette is exhausted"
+                    )
+                index = self._cursor
+                logger.debug(
+                    f"Request {key[:12]} not recorded, serving the response "
+                    f"recorded at position {index}"
+                )
+            self._served.add(index)
+            return self.cassette.entries[index]
+
+    def _replay(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]],
+        tools: Optional[List[Dict[str, Any]]],
+    ) -> Tuple[ChatCompletion, float]:
+        entry = self._next_entry(request_key(messages, tools, response_format))
+        delay = self.latency + self.latency_scale * entry.get("latency", 0.0)
+        return ChatCompletion.model_validate(entry["response"]), delay
+
+    def _run(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> ChatCompletion:
+        response, delay = self._replay(messages, response_format, tools)
+        if delay > 0:
+            time.sleep(delay)
+        return response
+
+    async def _arun(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ) -> ChatCompletion:
+        response, delay = self._replay(messages, response_format, tools)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return response
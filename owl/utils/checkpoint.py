@@ -0,0 +1,311 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from camel.agents import ChatAgent
+from camel.logger import get_logger
+from camel.memories import MemoryRecord
+from camel.messages import BaseMessage, FunctionCallingMessage
+from camel.societies import RolePlaying
+from camel.types import RoleType
+
+from .history_store import ChatHistoryStore, load_payloads
+
+logger = get_logger(__name__)
+
+_MESSAGE_TYPES = {
+    "BaseMessage": BaseMessage,
+    "FunctionCallingMessage": FunctionCallingMessage,
+}
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, Enum):
+        return obj.value
+    # Tool results may hold arbitrary objects, keep their text form
+    return str(obj)
+
+
+def message_to_dict(message: BaseMessage) -> Dict[str, Any]:
+    r"""Convert a message to a JSON serializable dictionary."""
+    return {"__class__": message.__class__.__name__, **asdict(message)}
+
+
+def message_from_dict(message_dict: Dict[str, Any]) -> BaseMessage:
+    r"""Reconstruct a message converted by :func:`message_to_dict`."""
+    kwargs = dict(message_dict)
+    message_cls = _MESSAGE_TYPES[kwargs.pop("__class__", "BaseMessage")]
+    # The role type is stored by value in JSON
+    kwargs["role_type"] = RoleType(kwargs["role_type"])
+    return message_cls(**kwargs)
+
+
+def dump_memory(agent: ChatAgent) -> List[Dict[str, Any]]:
+    r"""Dump the memory records of an agent to dictionaries."""
+    return [
+        context_record.memory_record.to_dict()
+        for context_record in agent.memory.retrieve()
+    ]
+
+
+def load_memory(agent: ChatAgent, records: List[Dict[str, Any]]) -> None:
+    r"""Replace the memory of an agent by records dumped by
+    :func:`dump_memory`."""
+    memory_records = []
+    for record in records:
+        message = message_from_dict(record["message"])
+        memory_records.append(
+            MemoryRecord.from_dict({**record, "message": message_to_dict(message)})
+        )
+    agent.memory.clear()
+    agent.memory.write_records(memory_records)
+
+
+@dataclass
+class SocietyCheckpoint:
+    r"""The state of a society after a completed round.
+
+    Args:
+        checkpoint_id (str): The ID of the checkpoint.
+        round_index (int): The index of the last completed round.
+        input_msg (Dict[str, Any], optional): The message starting the next
+            round, :obj:`None` once the society is finished.
+        chat_history (List[Dict[str, Any]]): The entries of the completed
+            rounds, with the results spilled by a :obj:`ChatHistoryStore` as
+            references to its payload file.
+        token_info (Dict[str, int]): The token counts of the completed rounds.
+        assistant_memory (List[Dict[str, Any]]): The memory records of the
+            assistant agent.
+        user_memory (List[Dict[str, Any]]): The memory records of the user
+            agent.
+        termination_reason (str, optional): Why the society stopped, or
+            :obj:`None` if it can be resumed. (default: :obj:`None`)
+        updated_at (float): The time the checkpoint was taken.
+        token_ledger (Dict[str, Any]): The full account of the
+            :obj:`TokenLedger` of the society, with its estimates and its
+            counts per model. Empty in the checkpoints of earlier versions.
+        payload_path (str, optional): The payload file of the
+            :obj:`ChatHistoryStore` of the society, :obj:`None` if its
+            history is a list. (default: :obj:`None`)
+    """
+
+    checkpoint_id: str
+    round_index: int
+    input_msg: Optional[Dict[str, Any]]
+    chat_history: List[Dict[str, Any]]
+    token_info: Dict[str, int]
+    assistant_memory: List[Dict[str, Any]] = field(default_factory=list)
+    user_memory: List[Dict[str, Any]] = field(default_factory=list)
+    termination_reason: Optional[str] = None
+    updated_at: float = field(default_factory=time.time)
+    token_ledger: Dict[str, Any] = field(default_factory=dict)
+    payload_path: Optional[str] = None
+
+    @classmethod
+    def capture(
+        cls,
+        checkpoint_id: str,
+        society: RolePlaying,
+        round_index: int,
+        input_msg: Optional[BaseMessage],
+        chat_history: Union[List[Dict[str, Any]], ChatHistoryStore],
+        token_info: Dict[str, int],
+        termination_reason: Optional[str] = None,
+        token_ledger: Optional[Dict[str, Any]] = None,
+    ) -> "SocietyCheckpoint":
+        r"""Capture the state of a society. The results spilled by a
+        :obj:`ChatHistoryStore` are not read back, the checkpoint references
+        them."""
+        payload_path = None
+        if isinstance(chat_history, ChatHistoryStore):
+            payload_path = str(chat_history.path)
+            records = chat_history.dump_records()
+        else:
+            records = list(chat_history)
+        return cls(
+            checkpoint_id=checkpoint_id,
+            round_index=round_index,
+            input_msg=message_to_dict(input_msg) if input_msg else None,
+            chat_history=records,
+            token_info=dict(token_info),
+            assistant_memory=dump_memory(society.assistant_agent),
+            user_memory=dump_memory(society.user_agent),
+            termination_reason=termination_reason,
+            token_ledger=dict(token_ledger or {}),
+            payload_path=payload_path,
+        )
+
+    def restore_chat_history(
+        self, chat_history: Union[List[Dict[str, Any]], ChatHistoryStore]
+    ) -> None:
+        r"""Append the entries of the checkpoint to the chat history of the
+        resumed society.
+
+        Args:
+            chat_history (Union[List[Dict[str, Any]], ChatHistoryStore]): The
+                empty history of the society. A store using the payload file
+                of the checkpoint keeps the references to the spilled results,
+                which are read from the file otherwise.
+        """
+        if self.payload_path is None:
+            chat_history.extend(self.chat_history)
+        elif isinstance(chat_history, ChatHistoryStore):
+            chat_history.load_records(self.chat_history, self.payload_path)
+        else:
+            chat_history.extend(load_payloads(self.chat_history, self.payload_path))
+
+    def restore(self, society: RolePlaying) -> Optional[BaseMessage]:
+        r"""Restore the agent memories of a society.
+
+        Args:
+            society (RolePlaying): A society built with the same agents,
+                models and tools as the checkpointed one.
+
+        Returns:
+            Optional[BaseMessage]: The message starting the next round.
+        """
+        load_memory(society.assistant_agent, self.assistant_memory)
+        load_memory(society.user_agent, self.user_memory)
+        return message_from_dict(self.input_msg) if self.input_msg else None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False, default=_json_default)
+
+    @classmethod
+    def from_json(cls, data: str) -> "SocietyCheckpoint":
+        return cls(**json.loads(data))
+
+
+class BaseCheckpointStore(ABC):
+    r"""Base class of the stores keeping the latest checkpoint of each
+    society."""
+
+    @abstractmethod
+    def save(self, checkpoint: SocietyCheckpoint) -> None:
+        r"""Save a checkpoint, replacing the previous one with the same ID."""
+        pass
+
+    @abstractmethod
+    def load(self, checkpoint_id: str) -> Optional[SocietyCheckpoint]:
+        r"""Load a checkpoint, or return :obj:`None` if there is none."""
+        pass
+
+    @abstractmethod
+    def delete(self, checkpoint_id: str) -> None:
+        r"""Delete a checkpoint if it exists."""
+        pass
+
+
+class DirectoryCheckpointStore(BaseCheckpointStore):
+    r"""Store each checkpoint as a JSON file in a local directory.
+
+    Files are replaced atomically, so a crash while saving leaves the
+    previous checkpoint intact.
+
+    Args:
+        directory (Union[str, Path]): The directory of the checkpoints.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, checkpoint_id: str) -> Path:
+        return self.directory / f"{checkpoint_id}.json"
+
+    def save(self, checkpoint: SocietyCheckpoint) -> None:
+        path = self._path(checkpoint.checkpoint_id)
+        tmp_path = path.with_suffix(f".json.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(checkpoint.to_json())
+        os.replace(tmp_path, path)
+
+    def load(self, checkpoint_id: str) -> Optional[SocietyCheckpoint]:
+        path = self._path(checkpoint_id)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return SocietyCheckpoint.from_json(f.read())
+
+    def delete(self, checkpoint_id: str) -> None:
+        self._path(checkpoint_id).unlink(missing_ok=True)
+
+
+class SQLiteCheckpointStore(BaseCheckpointStore):
+    r"""Store the checkpoints in a SQLite database, one row per society.
+
+    Args:
+        path (Union[str, Path]): The path of the database file.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "checkpoint_id TEXT PRIMARY KEY, "
+                "round_index INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "data TEXT NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save(self, checkpoint: SocietyCheckpoint) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(checkpoint_id, round_index, updated_at, data) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    checkpoint.checkpoint_id,
+                    checkpoint.round_index,
+                    checkpoint.updated_at,
+                    checkpoint.to_json(),
+                ),
+            )
+
+    def load(self, checkpoint_id: str) -> Optional[SocietyCheckpoint]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM checkpoints WHERE checkpoint_id = ?",
+                (checkpoint_id,),
+            ).fetchone()
+        return SocietyCheckpoint.from_json(row[0]) if row else None
+
+    def delete(self, checkpoint_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "DELETE FROM checkpoints WHERE checkpoint_id = ?",
+                (checkpoint_id,),
+            )
@@ -15,8 +15,9 @@ import sys
 
 sys.path.append("../")
 
+import importlib
 import re
-from typing import Optional
+from typing import Callable, Optional, Union
 from camel.logger import get_logger
 
 logger = get_logger(__name__)
@@ -34,3 +35,25 @@ def extract_pattern(content: str, pattern: str) -> Optional[str]:
     except Exception as e:
         logger.warning(f"Error extracting answer: {e}, current content: {content}")
         return None
+
+
+def resolve_import(target: Union[str, Callable]) -> Callable:
+    r"""Resolve a function given by its import path, e.g.
+    `"package.module:name"`, so that it can be named in the arguments sent
+    to worker processes.
+
+    Args:
+        target (Union[str, Callable]): The import path, or the function
+            itself, returned as is.
+
+    Returns:
+        Callable: The function.
+    """
+    if callable(target):
+        return target
+    module_name, _, attribute = target.partition(":")
+    if not attribute:
+        raise ValueError(
+            f"Invalid import path {target!r}, expected 'package.module:name'."
+        )
+    return getattr(importlib.import_module(module_name), attribute)
@@ -0,0 +1,220 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import re
+from typing import Callable, List, Optional, Pattern, Tuple
+
+from camel.logger import get_logger
+from camel.messages import OpenAIMessage
+from camel.utils import BaseTokenCounter
+
+logger = get_logger(__name__)
+
+# The auxiliary information block and the tool reminder appended by
+# `OwlRolePlaying.step` to every instruction sent to the assistant
+AUXILIARY_INFORMATION_PATTERN = re.compile(
+    r"\s*Here are auxiliary information about the overall task.*?"
+    r"</auxiliary_information>\s*If there are available tools.*?"
+    r"which tool you have called\.\s*",
+    re.DOTALL,
+)
+
+# The reminder appended by `OwlRolePlaying.step` to every reply sent back to
+# the user agent
+NEXT_INSTRUCTION_REMINDER_PATTERN = re.compile(
+    r"\s*Provide me with the next instruction and input.*?"
+    r"end our conversation\.\s*",
+    re.DOTALL,
+)
+
+DEFAULT_BOILERPLATE_PATTERNS = [
+    AUXILIARY_INFORMATION_PATTERN,
+    NEXT_INSTRUCTION_REMINDER_PATTERN,
+]
+
+
+class ContextCompactor:
+    r"""Compact the prompt of an agent before it is sent to the model.
+
+    The conversation after the system message is split into rounds, each
+    round starting with an incoming (`user`) message. The last
+    :obj:`keep_last_rounds` rounds are kept verbatim. In older rounds the
+    boilerplate repeated by :obj:`OwlRolePlaying` on every message is dropped
+    and the tool results are replaced by short summaries. If the prompt is
+    still above :obj:`token_budget`, the older messages are truncated further
+    and finally the oldest rounds are dropped.
+
+    The agent memory is left untouched, only the prompt is compacted.
+
+    Args:
+        token_budget (int, optional): The prompt token budget of the agent.
+            :obj:`None` only applies the round based compaction.
+            (default: :obj:`None`)
+        keep_last_rounds (int, optional): The number of most recent rounds
+            kept verbatim. (default: :obj:`2`)
+        tool_result_max_chars (int, optional): The maximum length of the
+            summary replacing a stale tool result. (default: :obj:`500`)
+        message_max_chars (int, optional): The maximum length of an older
+            message when the prompt is above the budget. (default: :obj:`1000`)
+        boilerplate_patterns (List[Pattern], optional): The patterns removed
+            from the messages of older rounds.
+            (default: :obj:`DEFAULT_BOILERPLATE_PATTERNS`)
+        summarizer (Callable[[str], str], optional): A function producing the
+            summary of a stale tool result. By default the head of the result
+            is kept. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        keep_last_rounds: int = 2,
+        tool_result_max_chars: int = 500,
+        message_max_chars: int = 1000,
+        boilerplate_patterns: Optional[List[Pattern]] = None,
+        summarizer: Optional[Callable[[str], str]] = None,
+    ):
+        self.token_budget = token_budget
+        self.keep_last_rounds = keep_last_rounds
+        self.tool_result_max_chars = tool_result_max_chars
+        self.message_max_chars = message_max_chars
+        self.boilerplate_patterns = (
+            boilerplate_patterns
+            if boilerplate_patterns is not None
+            else DEFAULT_BOILERPLATE_PATTERNS
+        )
+        self.summarizer = summarizer
+
+    def compact(
+        self,
+        messages: List[OpenAIMessage],
+        token_counter: BaseTokenCounter,
+        num_tokens: Optional[int] = None,
+    ) -> Tuple[List[OpenAIMessage], int]:
+        r"""Compact the messages of a prompt.
+
+        Args:
+            messages (List[OpenAIMessage]): The prompt in OpenAI format.
+            token_counter (BaseTokenCounter): The token counter of the model.
+            num_tokens (int, optional): The number of tokens of
+                :obj:`messages`, if already known. (default: :obj:`None`)
+
+        Returns:
+            Tuple[List[OpenAIMessage], int]: The compacted prompt and its
+                number of tokens.
+        """
+        if num_tokens is None:
+            num_tokens = token_counter.count_tokens_from_messages(messages)
+
+        head, rounds = self._split_rounds(messages)
+        num_old = max(len(rounds) - self.keep_last_rounds, 0)
+        if num_old == 0:
+            return messages, num_tokens
+
+        old_rounds = [
+            [self._compact_message(message) for message in round_messages]
+            for round_messages in rounds[:num_old]
+        ]
+        recent_rounds = rounds[num_old:]
+
+        compacted = self._join(head, old_rounds, recent_rounds)
+        compacted_tokens = token_counter.count_tokens_from_messages(compacted)
+
+        if self.token_budget is None or compacted_tokens <= self.token_budget:
+            return compacted, compacted_tokens
+
+        # Still above the budget: truncate the older messages ...
+        old_rounds = [
+            [
+                self._truncate_message(message, self.message_max_chars)
+                for message in round_messages
+            ]
+            for round_messages in old_rounds
+        ]
+        compacted = self._join(head, old_rounds, recent_rounds)
+        compacted_tokens = token_counter.count_tokens_from_messages(compacted)
+
+        # ... and then drop the oldest rounds
+        while compacted_tokens > self.token_budget and old_rounds:
+            old_rounds.pop(0)
+            compacted = self._join(head, old_rounds, recent_rounds)
+            compacted_tokens = token_counter.count_tokens_from_messages(compacted)
+
+        if compacted_tokens > self.token_budget:
+            logger.warning(
+                f"Prompt of {compacted_tokens} tokens is above the budget of "
+                f"{self.token_budget} tokens after compaction."
+            )
+        return compacted, compacted_tokens
+
+    def _split_rounds(
+        self, messages: List[OpenAIMessage]
+    ) -> Tuple[List[OpenAIMessage], List[List[OpenAIMessage]]]:
+        head: List[OpenAIMessage] = []
+        rounds: List[List[OpenAIMessage]] = []
+        for message in messages:
+            if message.get("role") == "user":
+                rounds.append([message])
+            elif rounds:
+                rounds[-1].append(message)
+            else:
+                head.append(message)
+        return head, rounds
+
+    def _join(
+        self,
+        head: List[OpenAIMessage],
+        old_rounds: List[List[OpenAIMessage]],
+        recent_rounds: List[List[OpenAIMessage]],
+    ) -> List[OpenAIMessage]:
+        compacted = list(head)
+        for round_messages in old_rounds + recent_rounds:
+            compacted.extend(round_messages)
+        return compacted
+
+    def _compact_message(self, message: OpenAIMessage) -> OpenAIMessage:
+        content = message.get("content")
+        if not isinstance(content, str) or not content:
+            return message
+
+        if message.get("role") == "tool":
+            return {**message, "content": self._summarize(content)}
+
+        for pattern in self.boilerplate_patterns:
+            content = pattern.sub("\n", content)
+        content = content.rstrip()
+        if content == message["content"]:
+            return message
+        return {**message, "content": content}
+
+    def _summarize(self, content: str) -> str:
+        if len(content) <= self.tool_result_max_chars:
+            return content
+        if self.summarizer is not None:
+            return self.summarizer(content)
+        return (
+            f"{content[: self.tool_result_max_chars]}\n"
+            f"[... {len(content) - self.tool_result_max_chars} more characters "
+            f"of this earlier tool result were omitted]"
+        )
+
+    def _truncate_message(
+        self, message: OpenAIMessage, max_chars: int
+    ) -> OpenAIMessage:
+        content = message.get("content")
+        if not isinstance(content, str) or len(content) <= max_chars:
+            return message
+        return {
+            **message,
+            "content": f"{content[:max_chars]}\n[... truncated]",
+        }
@@ -0,0 +1,573 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel
+
+from camel.agents import ChatAgent
+from camel.agents._types import ModelResponse, ToolCallRequest
+from camel.logger import get_logger
+from camel.messages import OpenAIMessage
+from camel.models.model_manager import ModelProcessingError
+from camel.messages.base import BaseMessage
+from camel.models import BaseModelBackend
+from camel.responses import ChatAgentResponse
+from camel.types import ChatCompletionChunk, OpenAIBackendRole
+from camel.types.agents import ToolCallingRecord
+
+from .cancellation import CancellationError, CancelToken
+from .context_compaction import ContextCompactor
+from .model_routing import ModelRouter, RoutingState
+from .token_accounting import ContextGuard
+from .tool_dispatch import ToolDispatcher
+
+logger = get_logger(__name__)
+
+
+class OwlChatAgent(ChatAgent):
+    r"""A :obj:`ChatAgent` whose step loop hands every batch of tool calls
+    emitted by one model response to a :obj:`ToolDispatcher`, so that
+    independent tools run concurrently instead of one after another.
+
+    With a :obj:`ContextCompactor` the prompt is compacted before every
+    model call, and the number of prompt tokens saved during a step is
+    reported as `prompt_tokens_saved` in the info of the response. The
+    duration of every tool call is reported as `tool_call_durations`, keyed
+    by tool call ID.
+
+    With a :obj:`ModelRouter` the model of every step is chosen by the
+    router, from the role of the agent, the input message and the failure
+    signals observed in the previous steps.
+
+    Every model call is timed and reported as `llm_calls` in the info of the
+    response, with its tokens, its time to first token when streaming and
+    its retries. Failed model calls are retried :obj:`model_retries` times.
+    The start time of every tool call is reported as `tool_call_start_times`.
+
+    With a :obj:`ContextGuard` the prompt of every model call is estimated
+    locally after compaction, and reduced if it would overflow the context
+    window of the model. The estimate is reported as
+    `estimated_prompt_tokens` in `llm_calls`, and the tokens removed are
+    counted in `prompt_tokens_saved`.
+
+    When the `stop_event` of the agent is set, the step terminates before the
+    next model call or tool call. When it is a :obj:`CancelToken`, the
+    in-flight async model and tool calls are cancelled too.
+
+    Without a dispatcher, a compactor, a router and retries the agent
+    behaves like :obj:`ChatAgent`.
+
+    Args:
+        tool_dispatcher (ToolDispatcher, optional): The dispatcher used to run
+            the tool calls. (default: :obj:`None`)
+        context_compactor (ContextCompactor, optional): The compactor applied
+            to the prompt before every model call. (default: :obj:`None`)
+        context_guard (ContextGuard, optional): The pre-flight check keeping
+            the prompt of every model call within the context window.
+            (default: :obj:`None`)
+        model_router (ModelRouter, optional): The router selecting the model
+            of every step. (default: :obj:`None`)
+        reasoning_task (bool, optional): Whether the task of the agent was
+            classified as a reasoning task by the router.
+            (default: :obj:`False`)
+        model_retries (int, optional): The number of retries of a failed
+            model call. (default: :obj:`0`)
+        retry_delay (float, optional): The delay in seconds before the first
+            retry, doubled for each further retry. (default: :obj:`1.0`)
+        *args: Positional arguments passed to :obj:`ChatAgent`.
+        **kwargs: Keyword arguments passed to :obj:`ChatAgent`.
+    """
+
+    def __init__(
+        self,
+        *args,
+        tool_dispatcher: Optional[ToolDispatcher] = None,
+        context_compactor: Optional[ContextCompactor] = None,
+        context_guard: Optional[ContextGuard] = None,
+        model_router: Optional[ModelRouter] = None,
+        reasoning_task: bool = False,
+        model_retries: int = 0,
+        retry_delay: float = 1.0,
+        **kwargs,
+    ) -> None:
+        # Set before `ChatAgent.__init__`, which calls `reset`
+        self.model_router = model_router
+        self._routing_state = RoutingState(reasoning_task=reasoning_task)
+        self._routed_model: Optional[BaseModelBackend] = None
+        super().__init__(*args, **kwargs)
+        self.tool_dispatcher = tool_dispatcher
+        self.context_compactor = context_compactor
+        self.context_guard = context_guard
+        self._estimated_prompt_tokens: Optional[int] = None
+        self.model_retries = model_retries
+        self.retry_delay = retry_delay
+        self._prompt_tokens_saved = 0
+        self._tool_call_durations: Dict[str, float] = {}
+        self._tool_call_start_times: Dict[str, float] = {}
+        self._llm_calls: List[Dict[str, Any]] = []
+        self._first_chunk_time: Optional[float] = None
+
+        if model_router is not None:
+            for model in model_router.models:
+                # `ModelManager` logs the index of the current model
+                if model not in self.model_backend.models:
+                    self.model_backend.models.append(model)
+            self.model_backend.add_strategy(
+                "routed",
+                lambda manager: self._routed_model or manager.models[0],
+            )
+
+    def reset(self):
+        super().reset()
+        self._routing_state = RoutingState(
+            reasoning_task=self._routing_state.reasoning_task
+        )
+
+    def _route(self, input_message: BaseMessage) -> None:
+        r"""Select the model of the step if a router is configured."""
+        if self.model_router is None:
+            return
+        self._routed_model = self.model_router.select_model(
+            self.role_type, input_message.content, self._routing_state
+        )
+
+    def _stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    async def _cancellable(self, awaitable):
+        r"""Await a model or tool call, cancelling it with the token of the
+        agent."""
+        if isinstance(self.stop_event, CancelToken):
+            return await self.stop_event.run(awaitable)
+        return await awaitable
+
+    def _compact_context(
+        self, openai_messages: List[OpenAIMessage], num_tokens: int
+    ) -> Tuple[List[OpenAIMessage], int]:
+        r"""Compact the prompt if a compactor is configured."""
+        if self.context_compactor is None:
+            return openai_messages, num_tokens
+        compacted, compacted_tokens = self.context_compactor.compact(
+            openai_messages, self.model_backend.token_counter, num_tokens
+        )
+        self._prompt_tokens_saved += max(num_tokens - compacted_tokens, 0)
+        return compacted, compacted_tokens
+
+    def _guard_context(
+        self, openai_messages: List[OpenAIMessage], num_tokens: int
+    ) -> Tuple[List[OpenAIMessage], int]:
+        r"""Reduce the prompt to the context window of the model of the
+        call if a guard is configured."""
+        self._estimated_prompt_tokens = None
+        if self.context_guard is None:
+            return openai_messages, num_tokens
+        model = self._routed_model or self.model_backend.current_model
+        result = self.context_guard.fit(openai_messages, model)
+        self._estimated_prompt_tokens = result.tokens
+        if not result.reduced:
+            return openai_messages, num_tokens
+        self._prompt_tokens_saved += result.estimated_tokens - result.tokens
+        return result.messages, min(num_tokens, result.tokens)
+
+    def _record_llm_call(
+        self,
+        start_time: float,
+        retries: int,
+        response: Optional[ModelResponse] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        usage = response.usage_dict if response is not None else {}
+        self._llm_calls.append(
+            {
+                "model": str(self.model_backend.model_type),
+                "start_time": start_time,
+                "latency": time.time() - start_time,
+                "time_to_first_token": (
+                    self._first_chunk_time - start_time
+                    if self._first_chunk_time is not None
+                    else None
+                ),
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+                "estimated_prompt_tokens": self._estimated_prompt_tokens,
+                "retries": retries,
+                "error": error,
+            }
+        )
+
+    def _get_model_response(
+        self,
+        openai_messages: List[OpenAIMessage],
+        num_tokens: int,
+        response_format: Optional[Type[BaseModel]] = None,
+        tool_schemas: Optional[List[Dict[str, Any]]] = None,
+    ) -> ModelResponse:
+        openai_messages, num_tokens = self._compact_context(openai_messages, num_tokens)
+        openai_messages, num_tokens = self._guard_context(openai_messages, num_tokens)
+        start_time = time.time()
+        retries = 0
+        while True:
+            self._first_chunk_time = None
+            try:
+                response = super()._get_model_response(
+                    openai_messages, num_tokens, response_format, tool_schemas
+                )
+            except ModelProcessingError as e:
+                if retries < self.model_retries and not self._stopped():
+                    retries += 1
+                    logger.warning(
+                        f"Retrying the model call ({retries}/"
+                        f"{self.model_retries}) after error: {e}"
+                    )
+                    time.sleep(self.retry_delay * 2 ** (retries - 1))
+                    continue
+                self._record_llm_call(start_time, retries, error=str(e))
+                raise
+            self._record_llm_call(start_time, retries, response)
+            return response
+
+    async def _aget_model_response(
+        self,
+        openai_messages: List[OpenAIMessage],
+        num_tokens: int,
+        response_format: Optional[Type[BaseModel]] = None,
+        tool_schemas: Optional[List[Dict[str, Any]]] = None,
+    ) -> ModelResponse:
+        openai_messages, num_tokens = self._compact_context(openai_messages, num_tokens)
+        openai_messages, num_tokens = self._guard_context(openai_messages, num_tokens)
+        start_time = time.time()
+        retries = 0
+        while True:
+            self._first_chunk_time = None
+            try:
+                response = await self._cancellable(
+                    super()._aget_model_response(
+                        openai_messages, num_tokens, response_format, tool_schemas
+                    )
+                )
+            except ModelProcessingError as e:
+                if retries < self.model_retries and not self._stopped():
+                    retries += 1
+                    logger.warning(
+                        f"Retrying the model call ({retries}/"
+                        f"{self.model_retries}) after error: {e}"
+                    )
+                    await asyncio.sleep(self.retry_delay * 2 ** (retries - 1))
+                    continue
+                self._record_llm_call(start_time, retries, error=str(e))
+                raise
+            self._record_llm_call(start_time, retries, response)
+            return response
+
+    def _handle_chunk(
+        self,
+        chunk: ChatCompletionChunk,
+        content_dict: defaultdict,
+        finish_reasons_dict: defaultdict,
+        output_messages: List[BaseMessage],
+    ) -> None:
+        if self._first_chunk_time is None:
+            self._first_chunk_time = time.time()
+        super()._handle_chunk(chunk, content_dict, finish_reasons_dict, output_messages)
+
+    def _convert_to_chatagent_response(
+        self,
+        response: ModelResponse,
+        tool_call_records: List[ToolCallingRecord],
+        num_tokens: int,
+        external_tool_call_requests: Optional[List[ToolCallRequest]],
+    ) -> ChatAgentResponse:
+        chat_agent_response = super()._convert_to_chatagent_response(
+            response, tool_call_records, num_tokens, external_tool_call_requests
+        )
+        chat_agent_response.info["prompt_tokens_saved"] = self._prompt_tokens_saved
+        chat_agent_response.info["tool_call_durations"] = dict(
+            self._tool_call_durations
+        )
+        chat_agent_response.info["tool_call_start_times"] = dict(
+            self._tool_call_start_times
+        )
+        chat_agent_response.info["llm_calls"] = list(self._llm_calls)
+        if self.model_router is not None:
+            self.model_router.observe(tool_call_records, self._routing_state)
+            chat_agent_response.info["model_escalated"] = self._routing_state.escalated
+        return chat_agent_response
+
+    def _step_terminate(
+        self,
+        num_tokens: int,
+        tool_calls: List[ToolCallingRecord],
+        termination_reason: str,
+    ) -> ChatAgentResponse:
+        response = super()._step_terminate(num_tokens, tool_calls, termination_reason)
+        # The calls made before the termination are still accounted
+        response.info["llm_calls"] = list(self._llm_calls)
+        return response
+
+    def _execute_tool(self, tool_call_request: ToolCallRequest) -> ToolCallingRecord:
+        self._tool_call_start_times[tool_call_request.tool_call_id] = time.time()
+        start = time.monotonic()
+        tool_call_record = super()._execute_tool(tool_call_request)
+        self._tool_call_durations[tool_call_request.tool_call_id] = (
+            time.monotonic() - start
+        )
+        return tool_call_record
+
+    async def _aexecute_tool(
+        self, tool_call_request: ToolCallRequest
+    ) -> ToolCallingRecord:
+        self._tool_call_start_times[tool_call_request.tool_call_id] = time.time()
+        start = time.monotonic()
+        tool_call_record = await super()._aexecute_tool(tool_call_request)
+        self._tool_call_durations[tool_call_request.tool_call_id] = (
+            time.monotonic() - start
+        )
+        return tool_call_record
+
+    def _split_tool_calls(
+        self, tool_call_requests: List[ToolCallRequest]
+    ) -> Tuple[List[ToolCallRequest], List[ToolCallRequest]]:
+        r"""Split the tool calls of a model response into the internal ones,
+        executed by the agent, and the external ones, returned to the caller.
+        """
+        internal, external = [], []
+        for tool_call_request in tool_call_requests:
+            if tool_call_request.tool_name in self._external_tool_schemas:
+                external.append(tool_call_request)
+            else:
+                internal.append(tool_call_request)
+        return internal, external
+
+    def _execute_tools(
+        self, tool_call_requests: List[ToolCallRequest]
+    ) -> List[ToolCallingRecord]:
+        r"""Execute a batch of internal tool calls."""
+        if not tool_call_requests:
+            return []
+        if self.tool_dispatcher is None:
+            records = []
+            for request in tool_call_requests:
+                if self._stopped():
+                    break
+                records.append(self._execute_tool(request))
+            return records
+        if self._stopped():
+            return []
+        # Even a single call goes through the dispatcher, which applies the
+        # timeouts of the tools
+        return self.tool_dispatcher.dispatch(self, tool_call_requests)
+
+    async def _aexecute_tools(
+        self, tool_call_requests: List[ToolCallRequest]
+    ) -> List[ToolCallingRecord]:
+        r"""Asynchronously execute a batch of internal tool calls."""
+        if not tool_call_requests:
+            return []
+        if self.tool_dispatcher is None:
+            records = []
+            for request in tool_call_requests:
+                if self._stopped():
+                    break
+                records.append(await self._cancellable(self._aexecute_tool(request)))
+            return records
+        # Even a single sync tool goes through the dispatcher so that it does
+        # not block the event loop
+        return await self._cancellable(
+            self.tool_dispatcher.adispatch(self, tool_call_requests)
+        )
+
+    def step(
+        self,
+        input_message: Union[BaseMessage, str],
+        response_format: Optional[Type[BaseModel]] = None,
+    ) -> ChatAgentResponse:
+        r"""Executes a single step in the chat session, generating a response
+        to the input message. Follows :meth:`ChatAgent.step`, except that the
+        tool calls of one model response are executed as a batch.
+
+        Args:
+            input_message (Union[BaseMessage, str]): The input message for the
+                agent.
+            response_format (Optional[Type[BaseModel]], optional): A Pydantic
+                model defining the expected structure of the response.
+                (default: :obj:`None`)
+
+        Returns:
+            ChatAgentResponse: Contains output messages, a termination status
+                flag, and session information.
+        """
+        if isinstance(input_message, str):
+            input_message = BaseMessage.make_user_message(
+                role_name="User", content=input_message
+            )
+
+        self.update_memory(input_message, OpenAIBackendRole.USER)
+        self._prompt_tokens_saved = 0
+        self._tool_call_durations = {}
+        self._tool_call_start_times = {}
+        self._llm_calls = []
+        self._route(input_message)
+
+        tool_call_records: List[ToolCallingRecord] = []
+        external_tool_call_requests: Optional[List[ToolCallRequest]] = None
+
+        while True:
+            try:
+                openai_messages, num_tokens = self.memory.get_context()
+            except RuntimeError as e:
+                return self._step_terminate(
+                    e.args[1], tool_call_records, "max_tokens_exceeded"
+                )
+
+            if self._stopped():
+                return self._step_terminate(
+                    num_tokens, tool_call_records, "termination_triggered"
+                )
+
+            response = self._get_model_response(
+                openai_messages,
+                num_tokens,
+                response_format,
+                self._get_full_tool_schemas(),
+            )
+
+            if self._stopped():
+                return self._step_terminate(
+                    num_tokens, tool_call_records, "termination_triggered"
+                )
+
+            if tool_call_requests := response.tool_call_requests:
+                internal, external = self._split_tool_calls(tool_call_requests)
+                tool_call_records.extend(self._execute_tools(internal))
+
+                if external:
+                    external_tool_call_requests = external
+                    break
+
+                if self.single_iteration:
+                    break
+
+                continue
+
+            break
+
+        self._format_response_if_needed(response, response_format)
+        self._record_final_output(response.output_messages)
+
+        return self._convert_to_chatagent_response(
+            response,
+            tool_call_records,
+            num_tokens,
+            external_tool_call_requests,
+        )
+
+    async def astep(
+        self,
+        input_message: Union[BaseMessage, str],
+        response_format: Optional[Type[BaseModel]] = None,
+    ) -> ChatAgentResponse:
+        r"""Performs a single step in the chat session by generating a response
+        to the input message. Follows :meth:`ChatAgent.astep`, except that the
+        tool calls of one model response are executed concurrently.
+
+        Args:
+            input_message (Union[BaseMessage, str]): The input message to the
+                agent.
+            response_format (Optional[Type[BaseModel]], optional): A pydantic
+                model class used to generate a structured response by LLM.
+                (default: :obj:`None`)
+
+        Returns:
+            ChatAgentResponse: A struct containing the output messages,
+                a boolean indicating whether the chat session has terminated,
+                and information about the chat session.
+        """
+        if isinstance(input_message, str):
+            input_message = BaseMessage.make_user_message(
+                role_name="User", content=input_message
+            )
+
+        self.update_memory(input_message, OpenAIBackendRole.USER)
+        self._prompt_tokens_saved = 0
+        self._tool_call_durations = {}
+        self._tool_call_start_times = {}
+        self._llm_calls = []
+        self._route(input_message)
+
+        tool_call_records: List[ToolCallingRecord] = []
+        external_tool_call_requests: Optional[List[ToolCallRequest]] = None
+
+        while True:
+            try:
+                openai_messages, num_tokens = self.memory.get_context()
+            except RuntimeError as e:
+                return self._step_terminate(
+                    e.args[1], tool_call_records, "max_tokens_exceeded"
+                )
+
+            if self._stopped():
+                return self._step_terminate(
+                    num_tokens, tool_call_records, "termination_triggered"
+                )
+
+            try:
+                response = await self._aget_model_response(
+                    openai_messages,
+                    num_tokens,
+                    response_format,
+                    self._get_full_tool_schemas(),
+                )
+            except CancellationError:
+                return self._step_terminate(
+                    num_tokens, tool_call_records, "termination_triggered"
+                )
+
+            if self._stopped():
+                return self._step_terminate(
+                    num_tokens, tool_call_records, "termination_triggered"
+                )
+
+            if tool_call_requests := response.tool_call_requests:
+                internal, external = self._split_tool_calls(tool_call_requests)
+                try:
+                    tool_call_records.extend(await self._aexecute_tools(internal))
+                except CancellationError:
+                    return self._step_terminate(
+                        num_tokens, tool_call_records, "termination_triggered"
+                    )
+
+                if external:
+                    external_tool_call_requests = external
+                    break
+
+                if self.single_iteration:
+                    break
+
+                continue
+
+            break
+
+        await self._aformat_response_if_needed(response, response_format)
+        self._record_final_output(response.output_messages)
+
+        return self._convert_to_chatagent_response(
+            response,
+            tool_call_records,
+            num_tokens,
+            external_tool_call_requests,
+        )
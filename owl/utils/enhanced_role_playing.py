@@ -12,18 +12,42 @@
 # limitations under the License.
 # ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
 
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
 import threading
+import time
 
 
-from camel.agents import ChatAgent
 from camel.responses import ChatAgentResponse
 from camel.messages.base import BaseMessage
 from camel.societies import RolePlaying
 from camel.logger import get_logger
 
 
-from copy import deepcopy
+from copy import copy
+
+from .cancellation import CancelToken, release_tool_resources
+from .checkpoint import BaseCheckpointStore, SocietyCheckpoint
+from .context_compaction import ContextCompactor
+from .enhanced_chat_agent import OwlChatAgent
+from .experience import Experience, ExperienceStore
+from .model_routing import ModelRouter
+from .round_control import BaseRoundController, RoundAction
+from .society_events import (
+    AssistantReplyEvent,
+    RoundCompletedEvent,
+    RoundControlEvent,
+    RoundTelemetryEvent,
+    SocietyEvent,
+    SocietyTerminatedEvent,
+    TokenUsageEvent,
+    ToolCallEvent,
+    UserInstructionEvent,
+)
+from .history_store import ChatHistoryStore
+from .telemetry import RoundTelemetry, SocietyTelemetry
+from .token_accounting import ContextGuard, TokenLedger
+from .tool_cache import ToolCache
+from .tool_dispatch import ToolDispatcher
 
 logger = get_logger(__name__)
 
@@ -40,21 +64,66 @@ class OwlRolePlaying(RolePlaying):
 
         self.output_language = kwargs.get("output_language", None)
 
+        # Runs the tool calls of one assistant response concurrently
+        self.tool_dispatcher: Optional[ToolDispatcher] = kwargs.pop(
+            "tool_dispatcher", None
+        )
+        # Compacts the prompt of both agents, can be overridden per agent in
+        # the agent kwargs
+        self.context_compactor: Optional[ContextCompactor] = kwargs.pop(
+            "context_compactor", None
+        )
+        # Keeps the prompt of every model call of both agents within the
+        # context window of the model
+        self.context_guard: Optional[ContextGuard] = kwargs.pop("context_guard", None)
+        # Also receives the token usage of the runs of the society, e.g. to
+        # account the usage of several societies
+        self.token_ledger: Optional[TokenLedger] = kwargs.pop("token_ledger", None)
+        # Routes the agents, and each step, to the planner, strong or
+        # reasoning model
+        self.model_router: Optional[ModelRouter] = kwargs.pop("model_router", None)
+        # Answers the idempotent tool calls of the assistant from the results
+        # of earlier rounds and tasks
+        self.tool_cache: Optional[ToolCache] = kwargs.pop("tool_cache", None)
+        # Injects the plans of similar solved tasks in the user agent prompt,
+        # and records the run once finished
+        self.experience_store: Optional[ExperienceStore] = kwargs.pop(
+            "experience_store", None
+        )
+        # Stops the agents, a `CancelToken` also cancels their async model
+        # and tool calls
+        self.stop_event: Optional[Union[threading.Event, CancelToken]] = kwargs.pop(
+            "stop_event", None
+        )
+        # Closes the browsers and code sandboxes of the tools once the society
+        # is cancelled, which would break the calls of other societies sharing
+        # the toolkits
+        self.release_tools_on_cancel: bool = kwargs.pop("release_tools_on_cancel", True)
+
+        # RolePlaying builds agents with its own system messages, which are
+        # replaced below, so skip building them twice
+        self._skip_init_agents = True
         super().__init__(**kwargs)
+        self._skip_init_agents = False
 
         init_user_sys_msg, init_assistant_sys_msg = self._construct_gaia_sys_msgs()
 
-        self.assistant_agent: ChatAgent
-        self.user_agent: ChatAgent
+        self.experiences: List[Tuple[Experience, float]] = []
+        if self.experience_store is not None:
+            self.experiences = self.experience_store.retrieve(self.task_prompt)
+        if self.experiences:
+            logger.info(f"Injecting the plans of {len(self.experiences)} similar tasks")
+            init_user_sys_msg = init_user_sys_msg.create_new_instance(
+                init_user_sys_msg.content
+                + self.experience_store.format_prompt(self.experiences)
+            )
+
+        self.assistant_agent: OwlChatAgent
+        self.user_agent: OwlChatAgent
         self.assistant_sys_msg: Optional[BaseMessage]
         self.user_sys_msg: Optional[BaseMessage]
 
-        # self.is_reasoning_task = self._judge_if_reasoning_task(self.task_prompt)
-
-        # if self.is_reasoning_task:
-        #     logger.info("The task is judged as a reasoning or coding task. The assistant agent will use the reasoning model O3-MINI.")
-        # else:
-        #     logger.info("The assistant agent will use the default model.")
+        self.is_reasoning_task = self._judge_if_reasoning_task(self.task_prompt)
 
         self._init_agents(
             init_assistant_sys_msg,
@@ -62,7 +131,8 @@ class OwlRolePlaying(RolePlaying):
             assistant_agent_kwargs=self.assistant_agent_kwargs,
             user_agent_kwargs=self.user_agent_kwargs,
             output_language=self.output_language,
-            # is_reasoning_task=self.is_reasoning_task
+            is_reasoning_task=self.is_reasoning_task,
+            stop_event=self.stop_event,
         )
 
     def _init_agents(
@@ -73,7 +143,7 @@ class OwlRolePlaying(RolePlaying):
         user_agent_kwargs: Optional[Dict] = None,
         output_language: Optional[str] = None,
         is_reasoning_task: bool = False,
-        stop_event: Optional[threading.Event] = None,
+        stop_event: Optional[Union[threading.Event, CancelToken]] = None,
     ) -> None:
         r"""Initialize assistant and user agents with their system messages.
 
@@ -88,7 +158,14 @@ class OwlRolePlaying(RolePlaying):
                 pass to the user agent. (default: :obj:`None`)
             output_language (str, optional): The language to be output by the
                 agents. (default: :obj:`None`)
+            is_reasoning_task (bool, optional): Whether the task is a
+                reasoning or coding task, for the model router.
+                (default: :obj:`False`)
+            stop_event (Union[threading.Event, CancelToken], optional): The
+                event stopping both agents. (default: :obj:`None`)
         """
+        if self._skip_init_agents:
+            return
         if self.model is not None:
             if assistant_agent_kwargs is None:
                 assistant_agent_kwargs = {"model": self.model}
@@ -99,46 +176,52 @@ class OwlRolePlaying(RolePlaying):
             elif "model" not in user_agent_kwargs:
                 user_agent_kwargs.update(dict(model=self.model))
 
-        # # If the task is a reasoning task, the assistant agent should use the reasoning model O3-MINI
-        # if is_reasoning_task:
-        #     assistant_agent_kwargs['model'] = ModelFactory.create(
-        #         model_platform=ModelPlatformType.OPENAI,
-        #         model_type=ModelType.O3_MINI,
-        #     )
+        if self.tool_cache is not None and (assistant_agent_kwargs or {}).get("tools"):
+            assistant_agent_kwargs = {
+                **assistant_agent_kwargs,
+                "tools": self.tool_cache.wrap_tools(assistant_agent_kwargs["tools"]),
+            }
 
-        self.assistant_agent = ChatAgent(
+        self.assistant_agent = OwlChatAgent(
             init_assistant_sys_msg,
             output_language=output_language,
-            **(assistant_agent_kwargs or {}),
+            **{
+                "tool_dispatcher": self.tool_dispatcher,
+                "context_compactor": self.context_compactor,
+                "context_guard": self.context_guard,
+                "model_router": self.model_router,
+                "reasoning_task": is_reasoning_task,
+                "stop_event": stop_event,
+                **(assistant_agent_kwargs or {}),
+            },
         )
         self.assistant_sys_msg = self.assistant_agent.system_message
 
-        self.user_agent = ChatAgent(
+        self.user_agent = OwlChatAgent(
             init_user_sys_msg,
             output_language=output_language,
-            **(user_agent_kwargs or {}),
+            **{
+                "context_compactor": self.context_compactor,
+                "context_guard": self.context_guard,
+                "model_router": self.model_router,
+                "stop_event": stop_event,
+                **(user_agent_kwargs or {}),
+            },
         )
         self.user_sys_msg = self.user_agent.system_message
 
-    # def _judge_if_reasoning_task(self, question: str) -> bool:
-    #     r"""Judge if the question is a reasoning task."""
-
-    #     LLM = OpenAIModel(model_type=ModelType.O3_MINI)
-    #     prompt = f"""
-    #     Please judge whether the following question is a reasoning or coding task, which can be solved by reasoning without leveraging external resources, or is suitable for writing code to solve the task.
-    #     If it is a reasoning or coding task, please return only "yes".
-    #     If it is not a reasoning or coding task, please return only "no".
-    #     Note:
-    #     - If the question required some world knowledge to answer the question, please carefully judge it, because the model's own knowledge is often unreliable.
-    #     - If it is suitable for writing codes (e.g. process excel files, write simulation codes, etc.), in most cases, it can be considered as a coding task.
-    #     Question: <question>{question}</question>
-    #     """
-    #     messages = [{"role": "user", "content": prompt}]
-    #     resp = LLM.run(messages)
-    #     if 'yes' in resp.choices[0].message.content.lower():
-    #         return True
-    #     else:
-    #         return False
+    def _judge_if_reasoning_task(self, question: str) -> bool:
+        r"""Judge if the question is a reasoning task, with the classifier of
+        the model router."""
+        if self.model_router is None:
+            return False
+        is_reasoning_task = self.model_router.is_reasoning_task(question)
+        if is_reasoning_task:
+            logger.info(
+                "The task is judged as a reasoning or coding task. The "
+                "assistant agent will use the reasoning model."
+            )
+        return is_reasoning_task
 
     def _construct_gaia_sys_msgs(self):
         user_system_prompt = f"""
@@ -213,6 +296,69 @@ Please note that our overall task may be very complicated. Here are some tips th
 
         return user_sys_msg, assistant_sys_msg
 
+    def final_answer_prompt(self) -> str:
+        r"""The request for the final answer of the task, sent to the
+        assistant once the conversation ends."""
+        return f"""\n
+            Now please make a final answer of the original task based on our conversation : <task>{self.task_prompt}</task>
+            """
+
+    def _final_answer_message(self, note: str) -> BaseMessage:
+        return BaseMessage.make_user_message(
+            role_name=self.user_role_name,
+            content=f"{note}{self.final_answer_prompt()}",
+        )
+
+    def _final_answer_responses(
+        self, user_msg: BaseMessage, assistant_response: ChatAgentResponse
+    ) -> Tuple[ChatAgentResponse, ChatAgentResponse]:
+        user_response = ChatAgentResponse(msgs=[user_msg], terminated=False, info={})
+        if assistant_response.terminated or assistant_response.msgs is None:
+            return (
+                ChatAgentResponse(
+                    msgs=[],
+                    terminated=assistant_response.terminated,
+                    info=assistant_response.info,
+                ),
+                user_response,
+            )
+        return (
+            ChatAgentResponse(
+                msgs=[self._reduce_message_options(assistant_response.msgs)],
+                terminated=assistant_response.terminated,
+                info=assistant_response.info,
+            ),
+            user_response,
+        )
+
+    def final_step(self, note: str = "") -> Tuple[ChatAgentResponse, ChatAgentResponse]:
+        r"""Ask the assistant for the final answer of the task, without
+        waiting for the user agent to end the conversation.
+
+        Args:
+            note (str, optional): Why the final answer is requested, sent
+                before the request. (default: :obj:`""`)
+
+        Returns:
+            Tuple[ChatAgentResponse, ChatAgentResponse]: The response of the
+                assistant, and a response of the user agent holding the
+                request.
+        """
+        user_msg = self._final_answer_message(note)
+        return self._final_answer_responses(
+            user_msg, self.assistant_agent.step(user_msg)
+        )
+
+    async def afinal_step(
+        self, note: str = ""
+    ) -> Tuple[ChatAgentResponse, ChatAgentResponse]:
+        r"""Asynchronously ask the assistant for the final answer of the task,
+        see :meth:`final_step`."""
+        user_msg = self._final_answer_message(note)
+        return self._final_answer_responses(
+            user_msg, await self.assistant_agent.astep(user_msg)
+        )
+
     def step(
         self, assistant_msg: BaseMessage
     ) -> Tuple[ChatAgentResponse, ChatAgentResponse]:
@@ -228,7 +374,7 @@ Please note that our overall task may be very complicated. Here are some tips th
             )
         user_msg = self._reduce_message_options(user_response.msgs)
 
-        modified_user_msg = deepcopy(user_msg)
+        modified_user_msg = copy(user_msg)
 
         if "TASK_DONE" not in user_msg.content:
             modified_user_msg.content += f"""\n
@@ -241,9 +387,7 @@ Please note that our overall task may be very complicated. Here are some tips th
 
         else:
             # The task is done, and the assistant agent need to give the final answer about the original task
-            modified_user_msg.content += f"""\n
-            Now please make a final answer of the original task based on our conversation : <task>{self.task_prompt}</task>
-            """
+            modified_user_msg.content += self.final_answer_prompt()
 
         # process assistant's response
         assistant_response = self.assistant_agent.step(modified_user_msg)
@@ -260,7 +404,7 @@ Please note that our overall task may be very complicated. Here are some tips th
             )
         assistant_msg = self._reduce_message_options(assistant_response.msgs)
 
-        modified_assistant_msg = deepcopy(assistant_msg)
+        modified_assistant_msg = copy(assistant_msg)
         if "TASK_DONE" not in user_msg.content:
             modified_assistant_msg.content += f"""\n
                 Provide me with the next instruction and input (if needed) based on my response and our current task: <task>{self.task_prompt}</task>
@@ -298,7 +442,7 @@ Please note that our overall task may be very complicated. Here are some tips th
             )
         user_msg = self._reduce_message_options(user_response.msgs)
 
-        modified_user_msg = deepcopy(user_msg)
+        modified_user_msg = copy(user_msg)
 
         if "TASK_DONE" not in user_msg.content:
             modified_user_msg.content += f"""\n
@@ -311,9 +455,7 @@ Please note that our overall task may be very complicated. Here are some tips th
 
         else:
             # The task is done, and the assistant agent need to give the final answer about the original task
-            modified_user_msg.content += f"""\n
-            Now please make a final answer of the original task based on our conversation : <task>{self.task_prompt}</task>
-            """
+            modified_user_msg.content += self.final_answer_prompt()
 
         assistant_response = await self.assistant_agent.astep(modified_user_msg)
         if assistant_response.terminated or assistant_response.msgs is None:
@@ -329,7 +471,7 @@ Please note that our overall task may be very complicated. Here are some tips th
             )
         assistant_msg = self._reduce_message_options(assistant_response.msgs)
 
-        modified_assistant_msg = deepcopy(assistant_msg)
+        modified_assistant_msg = copy(assistant_msg)
         if "TASK_DONE" not in user_msg.content:
             modified_assistant_msg.content += f"""\n
                 Provide me with the next instruction and input (if needed) based on my response and our current task: <task>{self.task_prompt}</task>
@@ -356,6 +498,25 @@ class OwlGAIARolePlaying(OwlRolePlaying):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+    def final_answer_prompt(self) -> str:
+        r"""The request for the final answer of the task, in the format
+        expected by GAIA."""
+        return f"""\n
+            Now please make a final answer of the original task based on our conversation : <task>{self.task_prompt}</task>
+            Please pay special attention to the format in which the answer is presented.
+            You should first analyze the answer format required by the question and then output the final answer that meets the format requirements. 
+            Your response should include the following content:
+            - `analysis`: enclosed by <analysis> </analysis>, a detailed analysis of the reasoning result.
+            - `final_answer`: enclosed by <final_answer> </final_answer>, the final answer to the question.
+            Here are some hint about the final answer:
+            <hint>
+            Your final answer must be output exactly in the format specified by the question. It should be a number OR as few words as possible OR a comma separated list of numbers and/or strings:
+            - If you are asked for a number, don't use comma to write your number neither use units such as $ or percent sign unless specified otherwise. 
+            - If you are asked for a string, don't use articles, neither abbreviations (e.g. for cities), and write the digits in plain text unless specified otherwise. 
+            - If you are asked for a comma separated list, apply the above rules depending of whether the element to be put in the list is a number or a string.
+            </hint>
+            """
+
     def step(
         self, assistant_msg: BaseMessage
     ) -> Tuple[ChatAgentResponse, ChatAgentResponse]:
@@ -371,7 +532,7 @@ class OwlGAIARolePlaying(OwlRolePlaying):
             )
         user_msg = self._reduce_message_options(user_response.msgs)
 
-        modified_user_msg = deepcopy(user_msg)
+        modified_user_msg = copy(user_msg)
 
         if "TASK_DONE" not in user_msg.content:
             modified_user_msg.content += f"""\n
@@ -384,21 +545,7 @@ class OwlGAIARolePlaying(OwlRolePlaying):
 
         else:
             # The task is done, and the assistant agent need to give the final answer about the original task
-            modified_user_msg.content += f"""\n
-            Now please make a final answer of the original task based on our conversation : <task>{self.task_prompt}</task>
-            Please pay special attention to the format in which the answer is presented.
-            You should first analyze the answer format required by the question and then output the final answer that meets the format requirements. 
-            Your response should include the following content:
-            - `analysis`: enclosed by <analysis> </analysis>, a detailed analysis of the reasoning result.
-            - `final_answer`: enclosed by <final_answer> </final_answer>, the final answer to the question.
-            Here are some hint about the final answer:
-            <hint>
-            Your final answer must be output exactly in the format specified by the question. It should be a number OR as few words as possible OR a comma separated list of numbers and/or strings:
-            - If you are asked for a number, don't use comma to write your number neither use units such as $ or percent sign unless specified otherwise. 
-            - If you are asked for a string, don't use articles, neither abbreviations (e.g. for cities), and write the digits in plain text unless specified otherwise. 
-            - If you are asked for a comma separated list, apply the above rules depending of whether the element to be put in the list is a number or a string.
-            </hint>
-            """
+            modified_user_msg.content += self.final_answer_prompt()
 
         # process assistant's response
         assistant_response = self.assistant_agent.step(modified_user_msg)
@@ -415,7 +562,7 @@ class OwlGAIARolePlaying(OwlRolePlaying):
             )
         assistant_msg = self._reduce_message_options(assistant_response.msgs)
 
-        modified_assistant_msg = deepcopy(assistant_msg)
+        modified_assistant_msg = copy(assistant_msg)
         if "TASK_DONE" not in user_msg.content:
             modified_assistant_msg.content += f"""\n
                 Provide me with the next instruction and input (if needed) based on my response and our current task: <task>{self.task_prompt}</task>
@@ -439,133 +586,672 @@ class OwlGAIARolePlaying(OwlRolePlaying):
         )
 
 
-def run_society(
-    society: OwlRolePlaying,
-    round_limit: int = 15,
-) -> Tuple[str, List[dict], dict]:
-    overall_completion_token_count = 0
-    overall_prompt_token_count = 0
-
-    chat_history = []
-    init_prompt = """
+INIT_PROMPT = """
     Now please give me instructions to solve over overall task step by step. If the task requires some specific knowledge, please instruct me to use tools to complete the task.
         """
-    input_msg = society.init_chat(init_prompt)
-    for _round in range(round_limit):
-        assistant_response, user_response = society.step(input_msg)
-        # Check if usage info is available before accessing it
-        if assistant_response.info.get("usage") and user_response.info.get("usage"):
-            overall_completion_token_count += assistant_response.info["usage"].get(
-                "completion_tokens", 0
-            ) + user_response.info["usage"].get("completion_tokens", 0)
-            overall_prompt_token_count += assistant_response.info["usage"].get(
-                "prompt_tokens", 0
-            ) + user_response.info["usage"].get("prompt_tokens", 0)
 
-        # convert tool call to dict
-        tool_call_records: List[dict] = []
-        if assistant_response.info.get("tool_calls"):
-            for tool_call in assistant_response.info["tool_calls"]:
-                tool_call_records.append(tool_call.as_dict())
 
-        _data = {
-            "user": user_response.msg.content
-            if hasattr(user_response, "msg") and user_response.msg
-            else "",
-            "assistant": assistant_response.msg.content
-            if hasattr(assistant_response, "msg") and assistant_response.msg
-            else "",
-            "tool_calls": tool_call_records,
-        }
+class _SocietyRun:
+    r"""Book-keeping shared by the sync and async society loops: turns the
+    responses of each round into events and accumulates the chat history and
+    the token counts."""
 
-        chat_history.append(_data)
-        logger.info(
-            f"Round #{_round} user_response:\n {user_response.msgs[0].content if user_response.msgs and len(user_response.msgs) > 0 else ''}"
-        )
-        logger.info(
-            f"Round #{_round} assistant_response:\n {assistant_response.msgs[0].content if assistant_response.msgs and len(assistant_response.msgs) > 0 else ''}"
+    def __init__(
+        self,
+        society: RolePlaying,
+        checkpoint_store: Optional[BaseCheckpointStore] = None,
+        checkpoint_id: Optional[str] = None,
+        round_controller: Optional[BaseRoundController] = None,
+        telemetry: Optional[SocietyTelemetry] = None,
+        history_store: Optional[ChatHistoryStore] = None,
+        cancel_token: Optional[CancelToken] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        if checkpoint_store is not None and checkpoint_id is None:
+            raise ValueError("A `checkpoint_id` is required to save checkpoints.")
+        self.society = society
+        self.checkpoint_store = checkpoint_store
+        self.checkpoint_id = checkpoint_id
+        self.round_controller = round_controller
+        # The note of the final answer requested by the round controller
+        self.final_answer_note: Optional[str] = None
+        self.telemetry = telemetry
+        self.round_start_time = time.time()
+
+        self.chat_history: Union[List[dict], ChatHistoryStore] = (
+            history_store if history_store is not None else []
         )
+        self.ledger = TokenLedger(parent=getattr(society, "token_ledger", None))
+        self.start_round = 0
+        self.termination_reason: Optional[str] = None
 
-        if (
-            assistant_response.terminated
-            or user_response.terminated
-            or "TASK_DONE" in user_response.msg.content
+        if cancel_token is None and isinstance(
+            getattr(society, "stop_event", None), CancelToken
         ):
-            break
+            cancel_token = society.stop_event
+        if cancel_token is None and timeout is not None:
+            cancel_token = CancelToken()
+        if cancel_token is not None:
+            if timeout is None:
+                # Restart the timer of a deadline stopped by a previous run
+                timeout = cancel_token.remaining()
+            if timeout is not None:
+                cancel_token.limit(timeout)
+        self.cancel_token = cancel_token
+        self._cancel_callbacks: List[Callable[[], object]] = []
+
+    def start(self) -> Optional[BaseMessage]:
+        r"""Start the society, or resume it from its last checkpoint.
+
+        Returns:
+            Optional[BaseMessage]: The message starting the first round to
+                run, :obj:`None` if the checkpointed society is finished.
+        """
+        if self.round_controller is not None:
+            self.round_controller.reset()
+        if self.cancel_token is not None:
+            self._attach_cancel_token(self.cancel_token)
 
-        input_msg = assistant_response.msg
+        checkpoint = None
+        if self.checkpoint_store is not None:
+            checkpoint = self.checkpoint_store.load(self.checkpoint_id)
+        if checkpoint is None:
+            return self.society.init_chat(INIT_PROMPT)
 
-    answer = chat_history[-1]["assistant"]
-    token_info = {
-        "completion_token_count": overall_completion_token_count,
-        "prompt_token_count": overall_prompt_token_count,
-    }
+        logger.info(
+            f"Resuming society {self.checkpoint_id} after round "
+            f"#{checkpoint.round_index}"
+        )
+        checkpoint.restore_chat_history(self.chat_history)
+        self.ledger.restore(checkpoint.token_info, checkpoint.token_ledger)
+        self.start_round = checkpoint.round_index + 1
+        self.termination_reason = checkpoint.termination_reason
+        if self.round_controller is not None:
+            # Rebuild the fingerprints of the rounds run before the checkpoint
+            decision = None
+            for record in self.chat_history:
+                decision = self.round_controller.observe(record)
+            if decision is not None and decision.action == RoundAction.FINAL_ANSWER:
+                self.final_answer_note = decision.prompt
+        return checkpoint.restore(self.society)
+
+    def _attach_cancel_token(self, cancel_token: CancelToken) -> None:
+        r"""Make the token stop both agents, and release the browsers and
+        code sandboxes of the assistant once it is cancelled, unless its
+        toolkits are shared."""
+        assistant_agent = self.society.assistant_agent
+        for agent in (self.society.user_agent, assistant_agent):
+            agent.stop_event = cancel_token
+        if not getattr(self.society, "release_tools_on_cancel", True):
+            return
+        self._cancel_callbacks.append(
+            cancel_token.on_cancel(
+                lambda: release_tool_resources(assistant_agent.tool_dict.values())
+            )
+        )
 
-    return answer, chat_history, token_info
+    def close(self) -> None:
+        r"""Stop the deadline timer of the token, and remove the callbacks of
+        the run, so that they do not release the tools after it ended."""
+        if self.cancel_token is not None:
+            self.cancel_token.close(self._cancel_callbacks)
+        self._cancel_callbacks = []
+
+    @property
+    def cancel_reason(self) -> Optional[str]:
+        r"""`cancelled` or `deadline` once the token of the run was
+        cancelled, :obj:`None` otherwise."""
+        if self.cancel_token is None:
+            return None
+        return self.cancel_token.reason
+
+    def save_checkpoint(
+        self,
+        round_index: int,
+        input_msg: Optional[BaseMessage],
+        termination_reason: Optional[str] = None,
+    ) -> None:
+        if self.checkpoint_store is None:
+            return
+        self.checkpoint_store.save(
+            SocietyCheckpoint.capture(
+                self.checkpoint_id,
+                self.society,
+                round_index,
+                input_msg,
+                self.chat_history,
+                self.token_info,
+                termination_reason,
+                token_ledger=self.ledger.to_dict(),
+            )
+        )
 
+    @property
+    def token_info(self) -> Dict[str, int]:
+        return self.ledger.token_info
 
-async def arun_society(
-    society: OwlRolePlaying,
-    round_limit: int = 15,
-) -> Tuple[str, List[dict], dict]:
-    overall_completion_token_count = 0
-    overall_prompt_token_count = 0
+    def begin_round(self) -> None:
+        self.round_start_time = time.time()
 
-    chat_history = []
-    init_prompt = """
-    Now please give me instructions to solve over overall task step by step. If the task requires some specific knowledge, please instruct me to use tools to complete the task.
+    def process_round(
+        self,
+        round_index: int,
+        assistant_response: ChatAgentResponse,
+        user_response: ChatAgentResponse,
+    ) -> Tuple[List[SocietyEvent], Optional[str]]:
+        r"""Process the responses of a round started by :meth:`begin_round`.
+
+        Returns:
+            Tuple[List[SocietyEvent], Optional[str]]: The events of the round
+                and the termination reason, or :obj:`None` if the society
+                should continue.
         """
-    input_msg = society.init_chat(init_prompt)
-    for _round in range(round_limit):
-        assistant_response, user_response = await society.astep(input_msg)
-        # Check if usage info is available before accessing it
-        if assistant_response.info.get("usage") and user_response.info.get("usage"):
-            overall_prompt_token_count += assistant_response.info["usage"].get(
-                "completion_tokens", 0
-            )
-            overall_prompt_token_count += assistant_response.info["usage"].get(
-                "prompt_tokens", 0
-            ) + user_response.info["usage"].get("prompt_tokens", 0)
+        events: List[SocietyEvent] = []
+
+        user_content = (
+            user_response.msg.content
+            if hasattr(user_response, "msg") and user_response.msg
+            else ""
+        )
+        assistant_content = (
+            assistant_response.msg.content
+            if hasattr(assistant_response, "msg") and assistant_response.msg
+            else ""
+        )
+        if user_content:
+            events.append(UserInstructionEvent(round_index, user_content))
 
         # convert tool call to dict
         tool_call_records: List[dict] = []
-        if assistant_response.info.get("tool_calls"):
-            for tool_call in assistant_response.info["tool_calls"]:
-                tool_call_records.append(tool_call.as_dict())
+        tool_call_durations = assistant_response.info.get("tool_call_durations", {})
+        for tool_call in assistant_response.info.get("tool_calls") or []:
+            tool_call_records.append(tool_call.as_dict())
+            events.append(
+                ToolCallEvent(
+                    round_index,
+                    tool_name=tool_call.tool_name,
+                    args=tool_call.args,
+                    result=tool_call.result,
+                    tool_call_id=tool_call.tool_call_id,
+                    duration=tool_call_durations.get(tool_call.tool_call_id),
+                )
+            )
+
+        if assistant_content:
+            events.append(AssistantReplyEvent(round_index, assistant_content))
+
+        # The ledger accounts every model call of the steps, the `usage` of
+        # a response only holds its last one
+        prompt_tokens, completion_tokens, prompt_tokens_saved = 0, 0, 0
+        for response in (assistant_response, user_response):
+            response_prompt, response_completion = self.ledger.record_response(response)
+            prompt_tokens += response_prompt
+            completion_tokens += response_completion
+            prompt_tokens_saved += response.info.get("prompt_tokens_saved", 0)
+        events.append(
+            TokenUsageEvent(
+                round_index,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                prompt_tokens_saved=prompt_tokens_saved,
+            )
+        )
+
+        round_telemetry = RoundTelemetry.from_responses(
+            round_index,
+            self.round_start_time,
+            time.time(),
+            assistant_response,
+            user_response,
+        )
+        if self.telemetry is not None:
+            self.telemetry.record_round(round_telemetry)
+        events.append(RoundTelemetryEvent(round_index, round_telemetry.to_dict()))
 
         _data = {
-            "user": user_response.msg.content
-            if hasattr(user_response, "msg") and user_response.msg
-            else "",
-            "assistant": assistant_response.msg.content
-            if hasattr(assistant_response, "msg") and assistant_response.msg
-            else "",
+            "user": user_content,
+            "assistant": assistant_content,
             "tool_calls": tool_call_records,
         }
+        self.chat_history.append(_data)
+        events.append(RoundCompletedEvent(round_index, _data))
 
-        chat_history.append(_data)
+        if prompt_tokens_saved:
+            logger.info(
+                f"Round #{round_index} context compaction saved "
+                f"{prompt_tokens_saved} prompt tokens"
+            )
+        # Formatted lazily, the contents can be large
+        logger.info("Round #%d user_response:\n %s", round_index, user_content)
         logger.info(
-            f"Round #{_round} user_response:\n {user_response.msgs[0].content if user_response.msgs and len(user_response.msgs) > 0 else ''}"
+            "Round #%d assistant_response:\n %s", round_index, assistant_content
         )
-        logger.info(
-            f"Round #{_round} assistant_response:\n {assistant_response.msgs[0].content if assistant_response.msgs and len(assistant_response.msgs) > 0 else ''}"
+
+        if assistant_response.terminated or user_response.terminated:
+            return events, "terminated"
+        if "TASK_DONE" in user_content or "任务已完成" in user_content:
+            return events, "task_done"
+        return events, None
+
+    def account_interrupted_round(
+        self,
+        assistant_response: ChatAgentResponse,
+        user_response: ChatAgentResponse,
+    ) -> None:
+        r"""Account the model calls of a round interrupted by cancellation,
+        which is not recorded otherwise."""
+        for response in (assistant_response, user_response):
+            self.ledger.record_response(response)
+
+    def control_round(
+        self,
+        round_index: int,
+        input_msg: BaseMessage,
+        events: List[SocietyEvent],
+    ) -> Tuple[BaseMessage, Optional[str]]:
+        r"""Let the round controller decide how the society goes on after a
+        round which did not end it. When it requests the final answer, the
+        next round asks the assistant for it directly, and ends the society
+        with the `final_answer` reason.
+
+        Returns:
+            Tuple[BaseMessage, Optional[str]]: The message starting the next
+                round, possibly with a nudge for the user agent, and the
+                termination reason, or :obj:`None` if the society should
+                continue.
+        """
+        if self.final_answer_note is not None:
+            # The round was the final answer requested by the controller
+            return input_msg, "final_answer"
+        if self.round_controller is None:
+            return input_msg, None
+
+        decision = self.round_controller.observe(self.chat_history[-1])
+        if decision.action == RoundAction.CONTINUE:
+            return input_msg, None
+
+        logger.warning(
+            f"Round #{round_index}: {decision.reason}, "
+            f"requesting {decision.action.value}"
+        )
+        events.append(
+            RoundControlEvent(
+                round_index, action=decision.action.value, reason=decision.reason
+            )
+        )
+        if decision.action == RoundAction.FINAL_ANSWER:
+            # The next round asks the assistant directly
+            self.final_answer_note = decision.prompt
+            return input_msg, None
+        return (
+            input_msg.create_new_instance(f"{input_msg.content}\n{decision.prompt}"),
+            None,
         )
 
-        # Check other termination conditions
-        if (
-            assistant_response.terminated
-            or user_response.terminated
-            or "TASK_DONE" in user_response.msg.content
-            or "任务已完成" in user_response.msg.content
-        ):
-            break
+    def terminate(self, round_index: int, reason: str) -> SocietyTerminatedEvent:
+        self.close()
+        if self.telemetry is not None:
+            self.telemetry.finish(reason)
+        experience_store = getattr(self.society, "experience_store", None)
+        if experience_store is not None:
+            experience_store.record(
+                self.society.task_prompt,
+                self.chat_history,
+                self.token_info,
+                success=reason == "task_done",
+                used_experience=bool(getattr(self.society, "experiences", None)),
+            )
+        return SocietyTerminatedEvent(
+            round_index,
+            reason=reason,
+            answer=self.chat_history[-1]["assistant"] if self.chat_history else "",
+            chat_history=self.chat_history,
+            token_info=self.token_info,
+        )
 
-        input_msg = assistant_response.msg
 
-    answer = chat_history[-1]["assistant"]
-    token_info = {
-        "completion_token_count": overall_completion_token_count,
-        "prompt_token_count": overall_prompt_token_count,
-    }
+def stream_society(
+    society: OwlRolePlaying,
+    round_limit: int = 15,
+    checkpoint_store: Optional[BaseCheckpointStore] = None,
+    checkpoint_id: Optional[str] = None,
+    round_controller: Optional[BaseRoundController] = None,
+    telemetry: Optional[SocietyTelemetry] = None,
+    history_store: Optional[ChatHistoryStore] = None,
+    cancel_token: Optional[CancelToken] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[SocietyEvent]:
+    r"""Run a society and yield the events of each round as soon as the round
+    is completed.
+
+    Args:
+        society (OwlRolePlaying): The society to run.
+        round_limit (int, optional): The maximum number of rounds.
+            (default: :obj:`15`)
+        checkpoint_store (BaseCheckpointStore, optional): The store in which
+            the state of the society is saved after each round. If it holds a
+            checkpoint for :obj:`checkpoint_id`, the society is resumed from
+            it. (default: :obj:`None`)
+        checkpoint_id (str, optional): The ID of the checkpoint of the
+            society, required with :obj:`checkpoint_store`.
+            (default: :obj:`None`)
+        round_controller (BaseRoundController, optional): The controller
+            detecting loops and stalls, which asks the society to re-plan or
+            to give its final answer. (default: :obj:`None`)
+        telemetry (SocietyTelemetry, optional): The collector exporting the
+            telemetry of each round. The telemetry is also yielded as
+            :obj:`RoundTelemetryEvent`. (default: :obj:`None`)
+        history_store (ChatHistoryStore, optional): The store receiving the
+            chat history, which keeps large tool results on disk. By default
+            the history is a list. (default: :obj:`None`)
+        cancel_token (CancelToken, optional): The token stopping the society
+            when cancelled. It is checked between rounds, and by the agents
+            before each model and tool call, and cancels their in-flight
+            async calls. The browsers and code sandboxes of the tools are
+            then released, unless the society has `release_tools_on_cancel`
+            off, as the societies of a :obj:`SocietyFactory` do. The
+            interrupted round is not recorded, so that a checkpointed society
+            can be resumed from the last completed round. (default: the
+            `stop_event` of the society if it is a :obj:`CancelToken`)
+        timeout (float, optional): The deadline of the society in seconds,
+            after which it stops with the `deadline` reason.
+            (default: :obj:`None`)
+
+    Yields:
+        SocietyEvent: The events of each round, ended by a
+            :obj:`SocietyTerminatedEvent`.
+    """
+    run = _SocietyRun(
+        society,
+        checkpoint_store,
+        checkpoint_id,
+        round_controller,
+        telemetry,
+        history_store,
+        cancel_token,
+        timeout,
+    )
+    try:
+        input_msg = run.start()
+        reason = run.termination_reason or "round_limit"
+        _round = run.start_round - 1
+        if input_msg is not None:
+            for _round in range(run.start_round, round_limit):
+                if run.cancel_reason is not None:
+                    reason = run.cancel_reason
+                    _round -= 1
+                    break
+                run.begin_round()
+                if run.final_answer_note is not None:
+                    assistant_response, user_response = society.final_step(
+                        run.final_answer_note
+                    )
+                else:
+                    assistant_response, user_response = society.step(input_msg)
+                if run.cancel_reason is not None:
+                    # The round was interrupted, and is not recorded
+                    run.account_interrupted_round(assistant_response, user_response)
+                    reason = run.cancel_reason
+                    _round -= 1
+                    break
+                events, termination_reason = run.process_round(
+                    _round, assistant_response, user_response
+                )
+                if termination_reason is None:
+                    input_msg, termination_reason = run.control_round(
+                        _round, assistant_response.msg, events
+                    )
+                if termination_reason is not None:
+                    run.save_checkpoint(_round, None, termination_reason)
+                    yield from events
+                    reason = termination_reason
+                    break
+
+                run.save_checkpoint(_round, input_msg)
+                yield from events
+
+        yield run.terminate(_round, reason)
+    finally:
+        # An exception or an iteration left early also ends the run
+        run.close()
+
+
+async def astream_society(
+    society: OwlRolePlaying,
+    round_limit: int = 15,
+    checkpoint_store: Optional[BaseCheckpointStore] = None,
+    checkpoint_id: Optional[str] = None,
+    round_controller: Optional[BaseRoundController] = None,
+    telemetry: Optional[SocietyTelemetry] = None,
+    history_store: Optional[ChatHistoryStore] = None,
+    cancel_token: Optional[CancelToken] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[SocietyEvent]:
+    r"""Asynchronously run a society and yield the events of each round as
+    soon as the round is completed. Leaving the iteration early stops the
+    society after the current round.
+
+    Args:
+        society (OwlRolePlaying): The society to run.
+        round_limit (int, optional): The maximum number of rounds.
+            (default: :obj:`15`)
+        checkpoint_store (BaseCheckpointStore, optional): The store in which
+            the state of the society is saved after each round. If it holds a
+            checkpoint for :obj:`checkpoint_id`, the society is resumed from
+            it. (default: :obj:`None`)
+        checkpoint_id (str, optional): The ID of the checkpoint of the
+            society, required with :obj:`checkpoint_store`.
+            (default: :obj:`None`)
+        round_controller (BaseRoundController, optional): The controller
+            detecting loops and stalls, which asks the society to re-plan or
+            to give its final answer. (default: :obj:`None`)
+        telemetry (SocietyTelemetry, optional): The collector exporting the
+            telemetry of each round. The telemetry is also yielded as
+            :obj:`RoundTelemetryEvent`. (default: :obj:`None`)
+        history_store (ChatHistoryStore, optional): The store receiving the
+            chat history, which keeps large tool results on disk. By default
+            the history is a list. (default: :obj:`None`)
+        cancel_token (CancelToken, optional): The token stopping the society
+            when cancelled. It is checked between rounds, and by the agents
+            before each model and tool call, and cancels their in-flight
+            async calls. The browsers and code sandboxes of the tools are
+            then released, unless the society has `release_tools_on_cancel`
+            off, as the societies of a :obj:`SocietyFactory` do. The
+            interrupted round is not recorded, so that a checkpointed society
+            can be resumed from the last completed round. (default: the
+            `stop_event` of the society if it is a :obj:`CancelToken`)
+        timeout (float, optional): The deadline of the society in seconds,
+            after which it stops with the `deadline` reason.
+            (default: :obj:`None`)
+
+    Yields:
+        SocietyEvent: The events of each round, ended by a
+            :obj:`SocietyTerminatedEvent`.
+    """
+    run = _SocietyRun(
+        society,
+        checkpoint_store,
+        checkpoint_id,
+        round_controller,
+        telemetry,
+        history_store,
+        cancel_token,
+        timeout,
+    )
+    try:
+        input_msg = run.start()
+        reason = run.termination_reason or "round_limit"
+        _round = run.start_round - 1
+        if input_msg is not None:
+            for _round in range(run.start_round, round_limit):
+                if run.cancel_reason is not None:
+                    reason = run.cancel_reason
+                    _round -= 1
+                    break
+                run.begin_round()
+                if run.final_answer_note is not None:
+                    assistant_response, user_response = await society.afinal_step(
+                        run.final_answer_note
+                    )
+                else:
+                    assistant_response, user_response = await society.astep(input_msg)
+                if run.cancel_reason is not None:
+                    # The round was interrupted, and is not recorded
+                    run.account_interrupted_round(assistant_response, user_response)
+                    reason = run.cancel_reason
+                    _round -= 1
+                    break
+                events, termination_reason = run.process_round(
+                    _round, assistant_response, user_response
+                )
+                if termination_reason is None:
+                    input_msg, termination_reason = run.control_round(
+                        _round, assistant_response.msg, events
+                    )
+                if termination_reason is not None:
+                    run.save_checkpoint(_round, None, termination_reason)
+                    for event in events:
+                        yield event
+                    reason = termination_reason
+                    break
+
+                run.save_checkpoint(_round, input_msg)
+                for event in events:
+                    yield event
+
+        yield run.terminate(_round, reason)
+    finally:
+        # An exception or an iteration left early also ends the run
+        run.close()
+
+
+def _society_result(event: SocietyTerminatedEvent) -> Tuple[str, List[dict], dict]:
+    # The history is returned as a list, a store only lives as long as the
+    # run which filled it is used
+    chat_history = event.chat_history
+    if isinstance(chat_history, ChatHistoryStore):
+        chat_history = chat_history.to_list()
+    return event.answer, chat_history, event.token_info
+
+
+def run_society(
+    society: OwlRolePlaying,
+    round_limit: int = 15,
+    checkpoint_store: Optional[BaseCheckpointStore] = None,
+    checkpoint_id: Optional[str] = None,
+    round_controller: Optional[BaseRoundController] = None,
+    telemetry: Optional[SocietyTelemetry] = None,
+    history_store: Optional[ChatHistoryStore] = None,
+    cancel_token: Optional[CancelToken] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[str, List[dict], dict]:
+    for event in stream_society(
+        society,
+        round_limit,
+        checkpoint_store,
+        checkpoint_id,
+        round_controller,
+        telemetry,
+        history_store,
+        cancel_token,
+        timeout,
+    ):
+        if isinstance(event, SocietyTerminatedEvent):
+            return _society_result(event)
+    raise RuntimeError("The society stopped without a termination event.")
 
-    return answer, chat_history, token_info
+
+async def arun_society(
+    society: OwlRolePlaying,
+    round_limit: int = 15,
+    checkpoint_store: Optional[BaseCheckpointStore] = None,
+    checkpoint_id: Optional[str] = None,
+    round_controller: Optional[BaseRoundController] = None,
+    telemetry: Optional[SocietyTelemetry] = None,
+    history_store: Optional[ChatHistoryStore] = None,
+    cancel_token: Optional[CancelToken] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[str, List[dict], dict]:
+    async for event in astream_society(
+        society,
+        round_limit,
+        checkpoint_store,
+        checkpoint_id,
+        round_controller,
+        telemetry,
+        history_store,
+        cancel_token,
+        timeout,
+    ):
+        if isinstance(event, SocietyTerminatedEvent):
+            return _society_result(event)
+    raise RuntimeError("The society stopped without a termination event.")
+
+
+def resume_society(
+    checkpoint_id: str,
+    society: OwlRolePlaying,
+    checkpoint_store: BaseCheckpointStore,
+    round_limit: int = 15,
+    round_controller: Optional[BaseRoundController] = None,
+    telemetry: Optional[SocietyTelemetry] = None,
+    history_store: Optional[ChatHistoryStore] = None,
+) -> Tuple[str, List[dict], dict]:
+    r"""Continue a society from the last round saved in its checkpoint.
+
+    Args:
+        checkpoint_id (str): The ID of the checkpoint of the society.
+        society (OwlRolePlaying): A society built with the same agents,
+            models and tools as the checkpointed one.
+        checkpoint_store (BaseCheckpointStore): The store holding the
+            checkpoint.
+        round_limit (int, optional): The maximum number of rounds, counting
+            the rounds run before the checkpoint. (default: :obj:`15`)
+        round_controller (BaseRoundController, optional): The controller
+            detecting loops and stalls. (default: :obj:`None`)
+        telemetry (SocietyTelemetry, optional): The collector exporting the
+            telemetry of each round. (default: :obj:`None`)
+        history_store (ChatHistoryStore, optional): The store receiving the
+            chat history, which is still returned as a list.
+            (default: :obj:`None`)
+
+    Returns:
+        Tuple[str, List[dict], dict]: The answer, the chat history and the
+            token info of the whole run.
+    """
+    if checkpoint_store.load(checkpoint_id) is None:
+        raise ValueError(f"No checkpoint found for `{checkpoint_id}`.")
+    return run_society(
+        society,
+        round_limit,
+        checkpoint_store,
+        checkpoint_id,
+        round_controller,
+        telemetry,
+        history_store,
+    )
+
+
+async def aresume_society(
+    checkpoint_id: str,
+    society: OwlRolePlaying,
+    checkpoint_store: BaseCheckpointStore,
+    round_limit: int = 15,
+    round_controller: Optional[BaseRoundController] = None,
+    telemetry: Optional[SocietyTelemetry] = None,
+    history_store: Optional[ChatHistoryStore] = None,
+) -> Tuple[str, List[dict], dict]:
+    r"""Asynchronously continue a society from the last round saved in its
+    checkpoint. See :func:`resume_society`.
+    """
+    if checkpoint_store.load(checkpoint_id) is None:
+        raise ValueError(f"No checkpoint found for `{checkpoint_id}`.")
+    return await arun_society(
+        society,
+        round_limit,
+        checkpoint_store,
+        checkpoint_id,
+        round_controller,
+        telemetry,
+        history_store,
+    )
@@ -0,0 +1,338 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import json
+import re
+import threading
+import zlib
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from camel.embeddings import BaseEmbedding
+from camel.logger import get_logger
+
+logger = get_logger(__name__)
+
+EXPERIENCE_PROMPT = """
+===== EXPERIENCE FROM SIMILAR TASKS =====
+The following plans solved tasks similar to ours before. Reuse the steps which fit our task, skip the ones which are not needed, and adapt the rest. Do not assume their results hold for our task, they have to be obtained again.
+{plans}
+"""
+
+
+def normalize_task(task: str) -> str:
+    r"""Lower-case a task and keep only its words."""
+    return " ".join(re.findall(r"\w+", task.lower()))
+
+
+class HashingEmbedding(BaseEmbedding[str]):
+    r"""A local embedding hashing the words and word pairs of the normalized
+    text into a fixed number of buckets. It needs no model, and matches
+    tasks sharing most of their wording.
+
+    Args:
+        dim (int, optional): The number of buckets. (default: :obj:`1024`)
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed_list(self, objs: List[str], **kwargs: Any) -> List[List[float]]:
+        vectors = []
+        for text in objs:
+            words = normalize_task(text).split()
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            vector = [0.0] * self.dim
+            for feature in features:
+                vector[zlib.crc32(feature.encode("utf-8")) % self.dim] += 1.0
+            vectors.append(vector)
+        return vectors
+
+    def get_output_dim(self) -> int:
+        return self.dim
+
+
+@dataclass
+class PlanStep:
+    r"""A round of a successful run.
+
+    Args:
+        instruction (str): The condensed instruction of the user agent.
+        tools (List[str]): The tools called by the assistant.
+    """
+
+    instruction: str
+    tools: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Experience:
+    r"""A completed run of a society.
+
+    Args:
+        task (str): The task of the society.
+        plan (List[PlanStep]): The rounds of the run.
+        success (bool): Whether the task was completed.
+        rounds (int): The number of rounds of the run.
+        tokens (int): The prompt and completion tokens of the run.
+        used_experience (bool): Whether experience was injected in the run.
+    """
+
+    task: str
+    plan: List[PlanStep]
+    success: bool
+    rounds: int
+    tokens: int
+    used_experience: bool = False
+
+    @classmethod
+    def from_chat_history(
+        cls,
+        task: str,
+        chat_history: Sequence[Dict[str, Any]],
+        token_info: Optional[Dict[str, int]] = None,
+        success: bool = True,
+        used_experience: bool = False,
+        max_instruction_chars: int = 200,
+    ) -> "Experience":
+        r"""Condense the chat history of a run into a plan."""
+        plan = []
+        for record in chat_history:
+            user = record.get("user") or ""
+            if "TASK_DONE" in user:
+                continue
+            match = re.search(r"Instruction:\s*(.+)", user)
+            instruction = (match.group(1) if match else user).strip()
+            instruction = instruction.splitlines()[0] if instruction else ""
+            if not instruction:
+                continue
+            tools = []
+            for tool_call in record.get("tool_calls") or []:
+                name = tool_call.get("tool_name") or tool_call.get("func_name")
+                if name and name not in tools:
+                    tools.append(name)
+            plan.append(PlanStep(instruction[:max_instruction_chars], tools))
+        token_info = token_info or {}
+        return cls(
+            task=task,
+            plan=plan,
+            success=success,
+            rounds=len(chat_history),
+            tokens=token_info.get("completion_token_count", 0)
+            + token_info.get("prompt_token_count", 0),
+            used_experience=used_experience,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Experience":
+        data = dict(data)
+        data["plan"] = [PlanStep(**step) for step in data.get("plan", [])]
+        return cls(**data)
+
+    def format_plan(self) -> str:
+        lines = [f"Similar task: {self.task.strip()}"]
+        for index, step in enumerate(self.plan, 1):
+            tools = f" (tools: {', '.join(step.tools)})" if step.tools else ""
+            lines.append(f"{index}. {step.instruction}{tools}")
+        return "\n".join(lines)
+
+
+class ExperienceStore:
+    r"""Index the plans of successful runs, to retrieve the ones of tasks
+    similar to a new task.
+
+    The tasks are embedded by :obj:`embedding`, by default a local
+    :obj:`HashingEmbedding` of their normalized text, and searched by cosine
+    similarity in an in-memory index. The runs are appended to the JSON lines
+    file :obj:`path` with their task embedding, and reloaded from it.
+
+    Runs which used retrieved experience are recorded too, so that
+    :meth:`stats` can compare the rounds and tokens of the runs with and
+    without experience.
+
+    Args:
+        path (Union[str, Path], optional): The file persisting the runs.
+            (default: :obj:`None`)
+        embedding (BaseEmbedding, optional): The embedding of the tasks.
+            (default: :obj:`HashingEmbedding()`)
+        top_k (int, optional): The maximum number of plans retrieved.
+            (default: :obj:`2`)
+        min_similarity (float, optional): The minimum cosine similarity of a
+            retrieved task. (default: :obj:`0.6`)
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        embedding: Optional[BaseEmbedding] = None,
+        top_k: int = 2,
+        min_similarity: float = 0.6,
+    ):
+        self.path = Path(path) if path else None
+        self.embedding = embedding or HashingEmbedding()
+        self.embedding_name = type(self.embedding).__name__
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+
+        self._lock = threading.Lock()
+        self.experiences: List[Experience] = []
+        self._vectors = np.zeros((0, self.embedding.get_output_dim()))
+        self._indexed: List[int] = []
+        if self.path is not None and self.path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        assert self.path is not None
+        experiences: List[Experience] = []
+        vectors: List[Optional[List[float]]] = []
+        missing: List[int] = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                vector = data.pop("vector", None)
+                if data.pop("embedding", None) != self.embedding_name:
+                    vector = None
+                if vector is None:
+                    missing.append(len(experiences))
+                experiences.append(Experience.from_dict(data))
+                vectors.append(vector)
+        if missing:
+            embedded = self.embedding.embed_list([experiences[i].task for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        for experience, vector in zip(experiences, vectors):
+            self._add(experience, vector)
+
+    def _normalize(self, vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=float)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _add(self, experience: Experience, vector: List[float]) -> None:
+        self.experiences.append(experience)
+        if experience.success and experience.plan:
+            self._vectors = np.vstack([self._vectors, self._normalize(vector)])
+            self._indexed.append(len(self.experiences) - 1)
+
+    def record(
+        self,
+        task: str,
+        chat_history: Sequence[Dict[str, Any]],
+        token_info: Optional[Dict[str, int]] = None,
+        success: bool = True,
+        used_experience: bool = False,
+    ) -> Experience:
+        r"""Record a completed run. Only the plans of successful runs are
+        retrieved.
+
+        Args:
+            task (str): The task of the society.
+            chat_history (Sequence[Dict[str, Any]]): The chat history of the
+                run.
+            token_info (Dict[str, int], optional): The token counts of the
+                run. (default: :obj:`None`)
+            success (bool, optional): Whether the task was completed.
+                (default: :obj:`True`)
+            used_experience (bool, optional): Whether experience was injected
+                in the run. (default: :obj:`False`)
+
+        Returns:
+            Experience: The recorded run.
+        """
+        experience = Experience.from_chat_history(
+            task, chat_history, token_info, success, used_experience
+        )
+        vector = self.embedding.embed(task)
+        with self._lock:
+            self._add(experience, vector)
+            if self.path is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(
+                        json.dumps(
+                            {
+                                **experience.to_dict(),
+                                "embedding": self.embedding_name,
+                                "vector": list(vector),
+                            },
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    )
+        return experience
+
+    def retrieve(
+        self, task: str, top_k: Optional[int] = None
+    ) -> List[Tuple[Experience, float]]:
+        r"""Retrieve the successful runs of the tasks most similar to a task.
+
+        Args:
+            task (str): The new task.
+            top_k (int, optional): The maximum number of runs.
+                (default: :obj:`self.top_k`)
+
+        Returns:
+            List[Tuple[Experience, float]]: The runs and the similarity of
+                their task, most similar first.
+        """
+        top_k = top_k or self.top_k
+        with self._lock:
+            if not self._indexed:
+                return []
+            vectors, indexed = self._vectors, list(self._indexed)
+        similarities = vectors @ self._normalize(self.embedding.embed(task))
+        order = np.argsort(-similarities)[:top_k]
+        return [
+            (self.experiences[indexed[i]], float(similarities[i]))
+            for i in order
+            if similarities[i] >= self.min_similarity
+        ]
+
+    def format_prompt(self, experiences: List[Tuple[Experience, float]]) -> str:
+        r"""The condensed plans of retrieved runs, for the system prompt of
+        the user agent."""
+        plans = "\n\n".join(experience.format_plan() for experience, _ in experiences)
+        return EXPERIENCE_PROMPT.format(plans=plans)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        r"""The number of runs, success rate, mean rounds and mean tokens of
+        the runs with and without injected experience."""
+        with self._lock:
+            experiences = list(self.experiences)
+        stats = {}
+        for key, used in (("with_experience", True), ("without_experience", False)):
+            runs = [e for e in experiences if e.used_experience == used]
+            successful = [e for e in runs if e.success]
+            stats[key] = {
+                "runs": len(runs),
+                "success_rate": len(successful) / len(runs) if runs else 0.0,
+                "mean_rounds": (
+                    sum(e.rounds for e in successful) / len(successful)
+                    if successful
+                    else 0.0
+                ),
+                "mean_tokens": (
+                    sum(e.tokens for e in successful) / len(successful)
+                    if successful
+                    else 0.0
+                ),
+            }
+        return stats
@@ -0,0 +1,373 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from camel.logger import get_logger
+from camel.models import BaseModelBackend
+from camel.societies import RolePlaying
+
+from .enhanced_role_playing import arun_society
+
+logger = get_logger(__name__)
+
+PLAN_PROMPT = """
+You are planning how to solve a task with several assistants working in parallel.
+Break the task into at most {max_subtasks} self-contained sub-tasks. A sub-task which does not need the result of another one must not depend on it, so that they can be solved at the same time. Only split the task when its parts are really independent: a task which must be solved step by step is a single sub-task.
+Reply only with a JSON list, each item having the keys:
+- "id": a short unique identifier,
+- "task": the full description of the sub-task, understandable without the original task,
+- "depends_on": the list of the ids of the sub-tasks whose results are needed.
+Task: <task>{task}</task>
+"""
+
+MERGE_PROMPT = """
+The following sub-tasks were solved separately to answer the task below. Combine their results into the final answer of the task. If the results disagree or some sub-tasks failed, say so and give the best answer you can.
+Task: <task>{task}</task>
+{results}
+"""
+
+DEPENDENCY_RESULTS_PROMPT = """
+Here are the results of previous sub-tasks you may need:
+{results}
+"""
+
+
+@dataclass
+class SubTask:
+    r"""A sub-task of a fan-out run.
+
+    Args:
+        id (str): The identifier of the sub-task.
+        task (str): The description of the sub-task.
+        depends_on (List[str]): The ids of the sub-tasks whose results are
+            needed. (default: :obj:`[]`)
+        status (str): `pending`, `done`, `failed` or `skipped`.
+            (default: :obj:`"pending"`)
+        answer (str): The answer of the society which solved it.
+        chat_history (List[dict]): The chat history of that society.
+        token_info (Dict[str, int]): The token counts of that society.
+    """
+
+    id: str
+    task: str
+    depends_on: List[str] = field(default_factory=list)
+    status: str = "pending"
+    answer: str = ""
+    chat_history: List[dict] = field(default_factory=list)
+    token_info: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class TaskPlan:
+    r"""A task broken into a DAG of sub-tasks.
+
+    Args:
+        task (str): The original task.
+        subtasks (List[SubTask]): The sub-tasks, in the order of the plan.
+    """
+
+    task: str
+    subtasks: List[SubTask]
+
+    def __post_init__(self):
+        ids = [subtask.id for subtask in self.subtasks]
+        if len(set(ids)) != len(ids):
+            raise ValueError(f"Duplicate sub-task ids in plan: {ids}")
+        for subtask in self.subtasks:
+            unknown = set(subtask.depends_on) - set(ids)
+            if unknown:
+                raise ValueError(
+                    f"Sub-task `{subtask.id}` depends on unknown sub-tasks "
+                    f"{sorted(unknown)}"
+                )
+        self.topological_order()
+
+    def get(self, subtask_id: str) -> SubTask:
+        return next(subtask for subtask in self.subtasks if subtask.id == subtask_id)
+
+    def topological_order(self) -> List[SubTask]:
+        r"""Order the sub-tasks so that each comes after its dependencies.
+
+        Raises:
+            ValueError: If the dependencies have a cycle.
+        """
+        order: List[SubTask] = []
+        placed: set = set()
+        remaining = list(self.subtasks)
+        while remaining:
+            ready = [s for s in remaining if set(s.depends_on) <= placed]
+            if not ready:
+                raise ValueError(
+                    "Cyclic dependencies between sub-tasks "
+                    f"{[subtask.id for subtask in remaining]}"
+                )
+            for subtask in ready:
+                order.append(subtask)
+                placed.add(subtask.id)
+                remaining.remove(subtask)
+        return order
+
+    @classmethod
+    def single(cls, task: str) -> "TaskPlan":
+        r"""The plan solving the task in one society."""
+        return cls(task, [SubTask(id="task", task=task)])
+
+    @classmethod
+    def from_response(cls, task: str, content: str) -> "TaskPlan":
+        r"""Parse the JSON list of sub-tasks replied by the planner.
+
+        Raises:
+            ValueError: If the reply is not a valid plan.
+        """
+        match = re.search(r"\[.*\]", content, re.DOTALL)
+        if match is None:
+            raise ValueError(f"No JSON list in the plan: {content}")
+        items = json.loads(match.group(0))
+        return cls(
+            task,
+            [
+                SubTask(
+                    id=str(item["id"]),
+                    task=str(item["task"]),
+                    depends_on=[str(dep) for dep in item.get("depends_on") or []],
+                )
+                for item in items
+            ],
+        )
+
+
+def _usage(response: Any) -> Dict[str, int]:
+    usage = getattr(response, "usage", None)
+    return {
+        "completion_token_count": getattr(usage, "completion_tokens", 0) or 0,
+        "prompt_token_count": getattr(usage, "prompt_tokens", 0) or 0,
+    }
+
+
+def _add_tokens(total: Dict[str, int], token_info: Dict[str, int]) -> None:
+    for key, value in token_info.items():
+        total[key] = total.get(key, 0) + value
+
+
+async def aplan_task(
+    task: str, model: BaseModelBackend, max_subtasks: int = 5
+) -> Tuple[TaskPlan, Dict[str, int]]:
+    r"""Ask a model to break a task into a DAG of sub-tasks. A reply which is
+    not a valid plan falls back to solving the task in one society.
+
+    Args:
+        task (str): The task.
+        model (BaseModelBackend): The planner model.
+        max_subtasks (int, optional): The maximum number of sub-tasks.
+            (default: :obj:`5`)
+
+    Returns:
+        Tuple[TaskPlan, Dict[str, int]]: The plan and the token counts of
+            the planner.
+    """
+    response = await model.arun(
+        [
+            {
+                "role": "user",
+                "content": PLAN_PROMPT.format(task=task, max_subtasks=max_subtasks),
+            }
+        ],
+        tools=[],
+    )
+    content = response.choices[0].message.content or ""
+    try:
+        plan = TaskPlan.from_response(task, content)
+        if not plan.subtasks or len(plan.subtasks) > max_subtasks:
+            raise ValueError(f"Expected 1 to {max_subtasks} sub-tasks")
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Invalid plan, solving the task in one society: {e}")
+        plan = TaskPlan.single(task)
+    return plan, _usage(response)
+
+
+def _format_results(subtasks: List[SubTask]) -> str:
+    return "\n".join(
+        f'<subtask id="{subtask.id}" status="{subtask.status}">\n'
+        f"Task: {subtask.task}\nResult: {subtask.answer}\n</subtask>"
+        for subtask in subtasks
+    )
+
+
+async def _amerge(
+    plan: TaskPlan, model: BaseModelBackend
+) -> Tuple[str, Dict[str, int]]:
+    if len(plan.subtasks) == 1:
+        return plan.subtasks[0].answer, {}
+    results = _format_results(plan.subtasks)
+    # No tools, even if the model is configured with some
+    response = await model.arun(
+        [
+            {
+                "role": "user",
+                "content": MERGE_PROMPT.format(task=plan.task, results=results),
+            }
+        ],
+        tools=[],
+    )
+    return response.choices[0].message.content or "", _usage(response)
+
+
+async def arun_fan_out(
+    task: str,
+    society_factory: Callable[[str], RolePlaying],
+    planner_model: BaseModelBackend,
+    merge_model: Optional[BaseModelBackend] = None,
+    max_concurrency: int = 3,
+    max_subtasks: int = 5,
+    round_limit: int = 15,
+) -> Tuple[str, List[dict], dict]:
+    r"""Solve a task by fanning it out to societies running concurrently.
+
+    The planner model breaks the task into a DAG of sub-tasks. Each
+    sub-task is solved by its own society, built by :obj:`society_factory`
+    and run with :func:`arun_society`, as soon as its dependencies are
+    solved, with at most :obj:`max_concurrency` societies at a time. The
+    answers of the dependencies are appended to the task of a sub-task.
+    The merge model finally combines the answers into the answer of the
+    task. A sub-task whose society fails is marked as failed and the
+    sub-tasks depending on it are skipped.
+
+    The societies share the event loop: give them a :obj:`ToolDispatcher`
+    so that their sync tools run in threads instead of blocking it.
+
+    Args:
+        task (str): The task.
+        society_factory (Callable[[str], RolePlaying]): Builds the society
+            solving a sub-task from its description, like the
+            `construct_society` functions of the examples.
+        planner_model (BaseModelBackend): The model breaking the task into
+            sub-tasks.
+        merge_model (BaseModelBackend, optional): The model combining the
+            answers of the sub-tasks. (default: :obj:`planner_model`)
+        max_concurrency (int, optional): The maximum number of societies
+            running at the same time. (default: :obj:`3`)
+        max_subtasks (int, optional): The maximum number of sub-tasks.
+            (default: :obj:`5`)
+        round_limit (int, optional): The round limit of each society.
+            (default: :obj:`15`)
+
+    Returns:
+        Tuple[str, List[dict], dict]: The answer, the chat history and the
+            token info, like :func:`run_society`. The chat history holds the
+            rounds of all societies, each entry having a `subtask` key, and
+            a last entry for the merge step.
+    """
+    if merge_model is None:
+        merge_model = planner_model
+
+    token_info: Dict[str, int] = {
+        "completion_token_count": 0,
+        "prompt_token_count": 0,
+    }
+    plan, planner_tokens = await aplan_task(task, planner_model, max_subtasks)
+    _add_tokens(token_info, planner_tokens)
+    logger.info(
+        f"Task planned as {len(plan.subtasks)} sub-tasks: "
+        f"{[(subtask.id, subtask.depends_on) for subtask in plan.subtasks]}"
+    )
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _solve(subtask: SubTask) -> None:
+        dependencies = [plan.get(dep) for dep in subtask.depends_on]
+        if any(dep.status != "done" for dep in dependencies):
+            subtask.status = "skipped"
+            subtask.answer = "Skipped because a sub-task it depends on failed."
+            return
+
+        prompt = subtask.task
+        if dependencies:
+            prompt += DEPENDENCY_RESULTS_PROMPT.format(
+                results=_format_results(dependencies)
+            )
+        async with semaphore:
+            logger.info(f"Solving sub-task `{subtask.id}`")
+            try:
+                society = society_factory(prompt)
+                answer, chat_history, subtask_tokens = await arun_society(
+                    society, round_limit=round_limit
+                )
+            except Exception as e:
+                logger.error(f"Sub-task `{subtask.id}` failed: {e}")
+                subtask.status = "failed"
+                subtask.answer = f"Failed: {e}"
+                return
+        subtask.status = "done"
+        subtask.answer = answer
+        subtask.chat_history = list(chat_history)
+        subtask.token_info = subtask_tokens
+
+    # Start every sub-task as soon as all its dependencies are finished
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def _schedule(subtask: SubTask) -> None:
+        await asyncio.gather(*[tasks[dep] for dep in subtask.depends_on])
+        await _solve(subtask)
+
+    for subtask in plan.topological_order():
+        tasks[subtask.id] = asyncio.create_task(_schedule(subtask))
+    await asyncio.gather(*tasks.values())
+
+    answer, merge_tokens = await _amerge(plan, merge_model)
+    _add_tokens(token_info, merge_tokens)
+
+    chat_history: List[dict] = []
+    for subtask in plan.subtasks:
+        _add_tokens(token_info, subtask.token_info)
+        chat_history.extend(
+            {"subtask": subtask.id, **record} for record in subtask.chat_history
+        )
+    if len(plan.subtasks) > 1:
+        chat_history.append(
+            {
+                "subtask": "merge",
+                "user": _format_results(plan.subtasks),
+                "assistant": answer,
+                "tool_calls": [],
+            }
+        )
+    return answer, chat_history, token_info
+
+
+def run_fan_out(
+    task: str,
+    society_factory: Callable[[str], RolePlaying],
+    planner_model: BaseModelBackend,
+    merge_model: Optional[BaseModelBackend] = None,
+    max_concurrency: int = 3,
+    max_subtasks: int = 5,
+    round_limit: int = 15,
+) -> Tuple[str, List[dict], dict]:
+    r"""Synchronous version of :func:`arun_fan_out`."""
+    return asyncio.run(
+        arun_fan_out(
+            task,
+            society_factory,
+            planner_model,
+            merge_model,
+            max_concurrency,
+            max_subtasks,
+            round_limit,
+        )
+    )
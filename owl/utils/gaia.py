@@ -15,20 +15,30 @@ import sys
 
 sys.path.append("../")
 
+import hashlib
 import json
+import queue
 import random
 import re
 import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Literal, Optional, Union, Tuple
+from typing import Any, Callable, Dict, List, Literal, Optional, Set, Union, Tuple
 
 from tqdm import tqdm
 from camel.benchmarks import BaseBenchmark
 from camel.tasks import Task
 from camel.logger import get_logger
+from camel.toolkits import FunctionTool
 
+from .attachments import AttachmentCache, ExtractedAttachment, extract_attachments
+from .cancellation import release_tool_resources
 from .common import extract_pattern
-from .enhanced_role_playing import run_society, OwlGAIARolePlaying
+from .enhanced_role_playing import stream_society, OwlGAIARolePlaying
+from .result_store import ResultStore
+from .society_events import RoundTelemetryEvent, SocietyTerminatedEvent
 
 logger = get_logger(__name__)
 
@@ -40,9 +50,13 @@ class GAIABenchmark(BaseBenchmark):
 
     Args:
         data_dir (str): The directory to save the data.
-        save_to (str): The file to save the results.
-        processes (int, optional): The number of processes to use.
-            (default: :obj:`1`)
+        save_to (str): The path of the results. They are stored in a
+            :obj:`ResultStore` at this path with the `.jsonl` suffix, see
+            :attr:`result_store_path`. The JSON list written at this path
+            with the `.json` suffix by earlier versions is imported into an
+            empty store.
+        processes (int, optional): The default number of tasks run in
+            parallel by :meth:`run`. (default: :obj:`1`)
     """
 
     def __init__(
@@ -55,11 +69,21 @@ class GAIABenchmark(BaseBenchmark):
 
         Args:
             data_dir (str): The directory to save the data.
-            save_to (str): The file to save the results.
-            processes (int, optional): The number of processes to use for
-                parallel processing. (default: :obj:`1`)
+            save_to (str): The path of the results. They are stored in a
+                :obj:`ResultStore` at this path with the `.jsonl` suffix, see
+                :attr:`result_store_path`. The JSON list written at this path
+                with the `.json` suffix by earlier versions is imported into an
+                empty store.
+            processes (int, optional): The default number of tasks run in
+                parallel by :meth:`run`. (default: :obj:`1`)
         """
         super().__init__("gaia", data_dir, save_to, processes)
+        self.result_store: Optional[ResultStore] = None
+        self._completed_task_ids: Set[str] = set()
+        self.attachments: Dict[str, ExtractedAttachment] = {}
+        self.max_attachment_chars = 20000
+        self.shard_index = 0
+        self.num_shards = 1
 
     def download(self):
         r"""Download the GAIA dataset."""
@@ -72,11 +96,66 @@ class GAIABenchmark(BaseBenchmark):
             local_dir_use_symlinks=True,
         )
 
+    @property
+    def result_store_path(self) -> Path:
+        r"""The JSONL file of the :obj:`ResultStore` of the results, next to
+        :obj:`save_to`, with the shard in its name when the tasks are
+        sharded."""
+        if self.num_shards > 1:
+            return self.shard_store_path(self.shard_index, self.num_shards)
+        return Path(self.save_to).with_suffix(".jsonl")
+
+    def shard_store_path(self, shard_index: int, num_shards: int) -> Path:
+        r"""The JSONL file of the results of a shard, next to
+        :obj:`save_to`."""
+        return Path(self.save_to).with_suffix(
+            f".shard-{shard_index}-of-{num_shards}.jsonl"
+        )
+
+    @staticmethod
+    def shard_tasks(
+        tasks: List[Dict[str, Any]], shard_index: int, num_shards: int
+    ) -> List[Dict[str, Any]]:
+        r"""The tasks of a shard, out of :obj:`num_shards` shards.
+
+        The tasks of each level are ordered by a hash of their `task_id`, and
+        dealt to the shards in turn, continuing from one level to the next.
+        The assignment only depends on the set of tasks, so that each
+        machine given the same dataset snapshot and selection computes the
+        same shards, and each shard gets the same number of tasks of each
+        level, give or take one.
+
+        Args:
+            tasks (List[Dict[str, Any]]): The tasks.
+            shard_index (int): The index of the shard, from 0.
+            num_shards (int): The number of shards.
+
+        Returns:
+            List[Dict[str, Any]]: The tasks of the shard, in their order in
+                :obj:`tasks`.
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(
+                f"Invalid shard {shard_index} of {num_shards}, expected "
+                f"0 <= shard_index < num_shards."
+            )
+        by_level: Dict[Any, List[str]] = {}
+        for task in tasks:
+            by_level.setdefault(task["Level"], []).append(str(task["task_id"]))
+        selected: Set[str] = set()
+        position = 0
+        for level in sorted(by_level):
+            for task_id in sorted(
+                by_level[level],
+                key=lambda task_id: hashlib.sha256(task_id.encode()).hexdigest(),
+            ):
+                if position % num_shards == shard_index:
+                    selected.add(task_id)
+                position += 1
+        return [task for task in tasks if str(task["task_id"]) in selected]
+
     def _check_task_completed(self, task_id: str) -> bool:
-        for data in self._results:
-            if data["task_id"] == task_id:
-                return True
-        return False
+        return task_id in self._completed_task_ids
 
     def dump_tasks(self, save_path: str, datas):
         constructed_data = []
@@ -131,6 +210,80 @@ class GAIABenchmark(BaseBenchmark):
                     self._data[label].append(data)
         return self
 
+    def preprocess_attachments(
+        self,
+        on: Literal["valid", "test"] = "valid",
+        level: Union[int, List[int], Literal["all"]] = "all",
+        cache_dir: str = "tmp/attachments",
+        processes: Optional[int] = None,
+        model_factory: Optional[Union[str, Callable]] = None,
+        summarizer: Optional[Callable[[str], str]] = None,
+        max_chars: int = 20000,
+    ) -> Dict[str, ExtractedAttachment]:
+        r"""Extract the attachments of the tasks of a split in parallel,
+        before running them.
+
+        The societies of the tasks are then given the content of their
+        attachment in their task prompt, or its summary when it is longer
+        than :obj:`max_chars`, instead of spending rounds extracting it.
+
+        Args:
+            on (Literal["valid", "test"], optional): The split.
+                (default: :obj:`"valid"`)
+            level (Union[int, List[int], Literal["all"]], optional): The
+                levels of the tasks. (default: :obj:`"all"`)
+            cache_dir (str, optional): The directory of the
+                :obj:`AttachmentCache`, reused by the next runs.
+                (default: :obj:`"tmp/attachments"`)
+            processes (int, optional): The number of processes extracting the
+                attachments. (default: the number of CPUs)
+            model_factory (Union[str, Callable], optional): The function
+                building the model captioning the images in each process.
+                (default: the default model of camel)
+            summarizer (Callable[[str], str], optional): The function
+                summarizing the contents longer than :obj:`max_chars`, e.g.
+                a :func:`model_summarizer`. (default: :obj:`None`)
+            max_chars (int, optional): The maximum length of a content given
+                in full to a society. (default: :obj:`20000`)
+
+        Returns:
+            Dict[str, ExtractedAttachment]: The extracted content of each
+                attachment path.
+        """
+        levels = self._parse_levels(level)
+        paths = [
+            str(data["file_name"])
+            for data in self._data[on]
+            if data["file_name"] and data["Level"] in levels
+        ]
+        self.max_attachment_chars = max_chars
+        self.attachments.update(
+            extract_attachments(
+                paths,
+                AttachmentCache(cache_dir),
+                processes=processes,
+                model_factory=model_factory,
+                summarizer=summarizer,
+                summarize_above=max_chars,
+            )
+        )
+        logger.info(f"{len(self.attachments)} attachments pre-extracted.")
+        return self.attachments
+
+    def _parse_levels(self, level: Union[int, List[int], Literal["all"]]) -> List[int]:
+        levels = (
+            [1, 2, 3]
+            if level == "all"
+            else [level]
+            if isinstance(level, int)
+            else level
+        )
+        if not all(isinstance(level, int) and level in [1, 2, 3] for level in levels):
+            raise ValueError(
+                f"Invalid value for `level`: {level}, expected 1, 2, 3 " "or 'all'."
+            )
+        return levels
+
     @property
     def train(self):
         r"""Get the training set."""
@@ -148,24 +301,84 @@ class GAIABenchmark(BaseBenchmark):
         subset: Optional[int] = None,
         idx: Optional[List[int]] = None,
         save_result: bool = False,
+        workers: Optional[int] = None,
+        tools_factory: Optional[Callable[[Path], List[FunctionTool]]] = None,
+        workspace_dir: str = "tmp/gaia_workers",
+        round_limit: int = 15,
+        shard_index: int = 0,
+        num_shards: int = 1,
     ) -> Dict[str, Any]:
+        r"""Run the benchmark.
+
+        With several workers, the tasks are solved in parallel by threads,
+        the model calls of the societies being I/O bound. Each worker builds
+        its own tools with :obj:`tools_factory`, given a directory of its
+        own, so that the browsers and output files of parallel tasks do not
+        collide, and reuses them for the tasks it runs one after another.
+
+        The tasks whose attachment was extracted by
+        :meth:`preprocess_attachments` are given its content.
+
+        A run can be split across machines, each running one shard of the
+        selected tasks, see :meth:`shard_tasks`, and saving its results to
+        its own store. The stores of the shards are then merged with
+        `python -m owl.utils.results_cli merge`.
+
+        Args:
+            user_role_name (str): The name of the user role.
+            assistant_role_name (str): The name of the assistant role.
+            user_agent_kwargs (dict): The arguments of the user agents.
+            assistant_agent_kwargs (dict): The arguments of the assistant
+                agents.
+            on (Literal["train", "valid", "test"]): The set to run on.
+            level (Union[int, List[int], Literal["all"]]): The levels of the
+                tasks.
+            randomize (bool, optional): Whether to shuffle the tasks.
+                (default: :obj:`False`)
+            subset (int, optional): The number of tasks to run.
+                (default: :obj:`None`)
+            idx (List[int], optional): The indices of the tasks to run.
+                (default: :obj:`None`)
+            save_result (bool, optional): Whether to append the result of
+                each task to the :obj:`ResultStore` at
+                :obj:`result_store_path`, and skip the tasks already in it.
+                The results of previous runs are loaded without their
+                histories. A result file of an earlier version next to
+                :obj:`save_to` is imported into an empty store. Use
+                `python -m owl.utils.results_cli export` to write the
+                results as a JSON list. (default: :obj:`False`)
+            workers (int, optional): The number of tasks run in parallel.
+                (default: the `processes` of the benchmark)
+            tools_factory (Callable[[Path], List[FunctionTool]], optional):
+                The function building the tools of a worker in its directory,
+                replacing the `tools` of :obj:`assistant_agent_kwargs`.
+                (default: :obj:`None`)
+            workspace_dir (str, optional): The directory holding the
+                directories of the workers.
+                (default: :obj:`"tmp/gaia_workers"`)
+            round_limit (int, optional): The maximum number of rounds of each
+                society. (default: :obj:`15`)
+            shard_index (int, optional): The index of the shard to run, from
+                0. (default: :obj:`0`)
+            num_shards (int, optional): The number of shards the tasks are
+                split into. With several shards, the results are saved to
+                :meth:`shard_store_path`. (default: :obj:`1`)
+
+        Returns:
+            Dict[str, Any]: The summary of the results.
+        """
         # Validate inputs
         if on not in ["valid", "test"]:
             raise ValueError(
                 f"Invalid value for `on`: {on}, expected 'valid' or 'test'."
             )
-
-        levels = (
-            [1, 2, 3]
-            if level == "all"
-            else [level]
-            if isinstance(level, int)
-            else level
-        )
-        if not all(isinstance(level, int) and level in [1, 2, 3] for level in levels):
+        if num_shards > 1 and randomize:
             raise ValueError(
-                f"Invalid value for `level`: {level}, expected 1, 2, 3 " "or 'all'."
+                "`randomize` cannot be used with shards, which must be "
+                "computed from the same selection of tasks on every machine."
             )
+
+        levels = self._parse_levels(level)
         logger.info(f"Running benchmark on {on} set at levels {levels}.")
         datas = [data for data in self._data[on] if data["Level"] in levels]
         # Shuffle and subset data if necessary
@@ -179,89 +392,235 @@ class GAIABenchmark(BaseBenchmark):
             if len(idx) != 0:
                 datas = [datas[i] for i in idx]
 
+        self.shard_index, self.num_shards = shard_index, num_shards
+        datas = self.shard_tasks(datas, shard_index, num_shards)
+        if num_shards > 1:
+            logger.info(f"Running shard {shard_index} of {num_shards}.")
+
         logger.info(f"Number of tasks: {len(datas)}")
 
         self._results = []
 
+        # The store of a previous run is not appended to by this one
+        if self.result_store is not None:
+            self.result_store.close()
+            self.result_store = None
         if save_result:
-            try:
-                with open(self.save_to, "r", encoding="utf-8") as f:
-                    self._results = json.load(f)
-                f.close()
-            except Exception as e:
-                logger.warning(e)
-                # raise FileNotFoundError(f"{self.save_to} does not exist.")
+            self.result_store = ResultStore(self.result_store_path)
+            legacy_path = Path(self.save_to).with_suffix(".json")
+            if len(self.result_store) == 0 and num_shards == 1 and legacy_path.exists():
+                count = self.result_store.import_json(legacy_path)
+                logger.info(
+                    f"Imported {count} results from {legacy_path} into "
+                    f"{self.result_store.path}."
+                )
+            # The tasks which failed with an error are run again
+            self._results = [
+                result
+                for result in self.result_store.results()
+                if not result.get("error")
+            ]
+        self._completed_task_ids = {result["task_id"] for result in self._results}
         datas = [
             data for data in datas if not self._check_task_completed(data["task_id"])
         ]
         logger.info(f"Number of tasks to be processed: {len(datas)}")
+
+        workers = max(1, min(workers or self.processes, len(datas) or 1))
+        if workers > 1 and tools_factory is None:
+            logger.warning(
+                "Running tasks in parallel without a `tools_factory`, the "
+                "toolkits and their browser and output directories are shared "
+                "by all the tasks."
+            )
+        slots: "queue.Queue[int]" = queue.Queue()
+        for slot in range(workers):
+            slots.put(slot)
+        worker_tools: Dict[int, List[FunctionTool]] = {}
+        results_lock = threading.Lock()
+        correct = sum(result["score"] for result in self._results)
+
+        def process(task: Dict[str, Any]) -> None:
+            # Each worker slot keeps its own toolkits, used by one task at a
+            # time
+            slot = slots.get()
+            try:
+                kwargs = assistant_agent_kwargs
+                if tools_factory is not None:
+                    if slot not in worker_tools:
+                        worker_dir = Path(workspace_dir) / f"worker_{slot}"
+                        worker_dir.mkdir(parents=True, exist_ok=True)
+                        worker_tools[slot] = list(tools_factory(worker_dir))
+                    kwargs = {**assistant_agent_kwargs, "tools": worker_tools[slot]}
+                result_info = self._run_task(
+                    task,
+                    user_role_name,
+                    assistant_role_name,
+                    user_agent_kwargs,
+                    kwargs,
+                    round_limit,
+                )
+            finally:
+                slots.put(slot)
+
+            nonlocal correct
+            with results_lock:
+                self._results.append(result_info)
+                if not result_info.get("error"):
+                    self._completed_task_ids.add(result_info["task_id"])
+                if self.result_store is not None:
+                    self.result_store.append(result_info)
+                correct += result_info["score"]
+                progress.set_postfix(correct=correct)
+                progress.update()
+
         # Process tasks
-        for task in tqdm(datas, desc="Running"):
-            if_prepared_task, info = self._prepare_task(task)
-            if not if_prepared_task:
-                _result_info = {
-                    "task_id": task["task_id"],
-                    "question": task["Question"],
-                    "level": task["Level"],
-                    "model_answer": None,
-                    "ground_truth": None,
-                    "score": 0,
-                    "history": None,
-                }
-                self._results.append(_result_info)
-                continue
+        with tqdm(total=len(datas), desc="Running") as progress:
             try:
-                logger.info(f"Task Question: {task['Question']}")
-                logger.info(f"Required tools: {task['Annotator Metadata']['Tools']}")
+                if workers == 1:
+                    for task in datas:
+                        process(task)
+                else:
+                    with ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix="gaia-worker"
+                    ) as executor:
+                        for future in [
+                            executor.submit(process, task) for task in datas
+                        ]:
+                            future.result()
+            finally:
+                for tools in worker_tools.values():
+                    release_tool_resources(tools)
 
-                task_kwargs = {
-                    "task_prompt": task["Question"],
-                    "with_task_specify": False,
-                }
+        return self._generate_summary()
 
-                society = OwlGAIARolePlaying(
-                    **task_kwargs,
-                    user_role_name=user_role_name,
-                    user_agent_kwargs=user_agent_kwargs,
-                    assistant_role_name=assistant_role_name,
-                    assistant_agent_kwargs=assistant_agent_kwargs,
-                )
+    def _run_task(
+        self,
+        task: Dict[str, Any],
+        user_role_name: str,
+        assistant_role_name: str,
+        user_agent_kwargs: dict,
+        assistant_agent_kwargs: dict,
+        round_limit: int = 15,
+    ) -> Dict[str, Any]:
+        r"""Solve a task with a society, and score its answer.
 
-                raw_answer, chat_history, token_info = run_society(society)
-                try:
-                    answer = extract_pattern(raw_answer, "final_answer")
-                except Exception as e:
-                    logger.error(
-                        f"Error in extracting final answer from text {raw_answer}: {e}"
-                    )
-                    answer = None
+        Besides the answer, the result records the wall time of the task,
+        why its society stopped, and the token usage and tool calls of each
+        round, read by :mod:`owl.utils.benchmark_report`.
 
-                logger.info(
-                    f"Model answer: {answer}, Ground truth: {task['Final answer']}"
-                )
+        Returns:
+            Dict[str, Any]: The result of the task, with an `error` key if the
+                society failed.
+        """
+        if_prepared_task, info = self._prepare_task(task)
+        if not if_prepared_task:
+            return {
+                "task_id": task["task_id"],
+                "question": task["Question"],
+                "level": task["Level"],
+                "model_answer": None,
+                "ground_truth": None,
+                "score": 0,
+                "history": None,
+            }
+        start_time = time.time()
+        rounds: List[Dict[str, Any]] = []
+        try:
+            logger.info(f"Task Question: {task['Question']}")
+            logger.info(f"Required tools: {task['Annotator Metadata']['Tools']}")
 
-                _result_info = {
-                    "task_id": task["task_id"],
-                    "question": task["Question"]
-                    + "Please decompose the task into several sub-tasks and find the answer step-by-step.",
-                    "level": task["Level"],
-                    "model_answer": answer,
-                    "ground_truth": task["Final answer"],
-                    "score": self.question_scorer(answer, task["Final answer"]),
-                    "token_info": token_info,
-                    "history": chat_history,
-                }
-                self._results.append(_result_info)
+            task_prompt = task["Question"]
+            attachment = self.attachments.get(task["file_name"] or "")
+            attachment_prompt = (
+                attachment.to_prompt(self.max_attachment_chars) if attachment else None
+            )
+            if attachment_prompt:
+                task_prompt += attachment_prompt
 
+            task_kwargs = {
+                "task_prompt": task_prompt,
+                "with_task_specify": False,
+            }
+
+            society = OwlGAIARolePlaying(
+                **task_kwargs,
+                user_role_name=user_role_name,
+                user_agent_kwargs=user_agent_kwargs,
+                assistant_role_name=assistant_role_name,
+                assistant_agent_kwargs=assistant_agent_kwargs,
+            )
+
+            terminated = None
+            for event in stream_society(society, round_limit=round_limit):
+                if isinstance(event, RoundTelemetryEvent):
+                    rounds.append(self._round_usage(event.telemetry))
+                elif isinstance(event, SocietyTerminatedEvent):
+                    terminated = event
+            raw_answer = terminated.answer
+            try:
+                answer = extract_pattern(raw_answer, "final_answer")
             except Exception as e:
-                logger.error(f"Error in processing task: {e}")
+                logger.error(
+                    f"Error in extracting final answer from text {raw_answer}: {e}"
+                )
+                answer = None
+
+            logger.info(f"Model answer: {answer}, Ground truth: {task['Final answer']}")
+
+            return {
+                "task_id": task["task_id"],
+                "question": task["Question"]
+                + "Please decompose the task into several sub-tasks and find the answer step-by-step.",
+                "level": task["Level"],
+                "model_answer": answer,
+                "ground_truth": task["Final answer"],
+                "score": (
+                    self.question_scorer(answer, task["Final answer"])
+                    if answer is not None
+                    else False
+                ),
+                "token_info": terminated.token_info,
+                "wall_time": time.time() - start_time,
+                "termination_reason": terminated.reason,
+                "rounds": rounds,
+                "history": terminated.chat_history,
+            }
 
-            if save_result:
-                with open(self.save_to, "w") as f:
-                    json.dump(self._results, f, indent=4, ensure_ascii=False)
-                f.close()
+        except Exception as e:
+            logger.error(f"Error in processing task: {e}")
+            return {
+                "task_id": task["task_id"],
+                "question": task["Question"],
+                "level": task["Level"],
+                "model_answer": None,
+                "ground_truth": task["Final answer"],
+                "score": 0,
+                "wall_time": time.time() - start_time,
+                "rounds": rounds,
+                "error": f"{type(e).__name__}: {e}",
+                "history": None,
+            }
 
-        return self._generate_summary()
+    @staticmethod
+    def _round_usage(telemetry: Dict[str, Any]) -> Dict[str, Any]:
+        r"""The usage of a round kept in the results, from its telemetry."""
+        return {
+            "round_index": telemetry["round_index"],
+            "duration": telemetry["duration"],
+            "prompt_tokens": telemetry["prompt_tokens"],
+            "completion_tokens": telemetry["completion_tokens"],
+            "llm_calls": len(telemetry["llm_calls"]),
+            "llm_latency": telemetry["llm_latency"],
+            "tool_calls": [
+                {
+                    "tool_name": call["tool_name"],
+                    "duration": call["duration"],
+                    "error": call["error"],
+                }
+                for call in telemetry["tool_calls"]
+            ],
+        }
 
     def _prepare_task(self, task: Dict[str, Any]) -> Tuple[bool, str]:
         r"""Prepare the task by validating and enriching its data."""
@@ -0,0 +1,291 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Deque, Dict, List, Optional, Type
+
+from camel.logger import get_logger
+from camel.messages import OpenAIMessage
+from camel.models import BaseModelBackend, ModelFactory
+from camel.utils import BaseTokenCounter
+from pydantic import BaseModel
+
+logger = get_logger(__name__)
+
+
+class HedgedModelBackend(BaseModelBackend):
+    r"""Send each request to an ordered list of backends, the first one
+    being the primary.
+
+    Failover: when a backend fails, the request is sent to the next one,
+    and the error is only raised once all of them failed.
+
+    Hedging: when :obj:`hedge_percentile` is set and a request takes longer
+    than this percentile of the recent latencies, a duplicate is sent to
+    the next backend, and so on, and the first successful response wins.
+    With :meth:`arun`, the requests still running are then cancelled. With
+    :meth:`run`, they run in a thread pool and their responses are
+    discarded, as threads cannot be cancelled.
+
+    Args:
+        models (List[BaseModelBackend]): The backends, primary first.
+        hedge_percentile (float, optional): The latency percentile after
+            which a request is hedged, e.g. `0.95`, :obj:`None` to disable
+            hedging. (default: :obj:`None`)
+        hedge_after (float, optional): The hedging delay in seconds until
+            :obj:`min_samples` latencies were observed. (default: :obj:`30.0`)
+        min_samples (int, optional): The number of latencies observed before
+            the percentile is used. (default: :obj:`20`)
+        failover (bool, optional): Whether to send a failed request to the
+            next backend. (default: :obj:`True`)
+        latency_window (int, optional): The number of latencies the
+            percentile is computed over. (default: :obj:`200`)
+    """
+
+    def __init__(
+        self,
+        models: List[BaseModelBackend],
+        hedge_percentile: Optional[float] = None,
+        hedge_after: float = 30.0,
+        min_samples: int = 20,
+        failover: bool = True,
+        latency_window: int = 200,
+    ):
+        if not models:
+            raise ValueError("At least one model is required.")
+        self.models = models
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.failover = failover
+        super().__init__(
+            model_type=models[0].model_type,
+            model_config_dict=models[0].model_config_dict,
+        )
+
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_configs(
+        cls, configs: List[Dict[str, Any]], **kwargs
+    ) -> "HedgedModelBackend":
+        r"""Build the backends with :obj:`ModelFactory`.
+
+        Args:
+            configs (List[Dict[str, Any]]): The arguments of
+                :meth:`ModelFactory.create` of each backend, primary first.
+            **kwargs: The other arguments of the backend.
+
+        Returns:
+            HedgedModelBackend: The backend.
+        """
+        return cls([ModelFactory.create(**config) for config in configs], **kwargs)
+
+    @property
+    def token_counter(self) -> BaseTokenCounter:
+        return self.models[0].token_counter
+
+    @property
+    def token_limit(self) -> int:
+        return min(model.token_limit for model in self.models)
+
+    @property
+    def stream(self) -> bool:
+        return self.models[0].stream
+
+    def check_model_config(self):
+        pass
+
+    def hedge_delay(self) -> Optional[float]:
+        r"""The delay in seconds after which a request is hedged,
+        :obj:`None` if hedging is disabled."""
+        if self.hedge_percentile is None or len(self.models) < 2:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.hedge_after
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(self.hedge_percentile * len(ordered)))
+        return ordered[index]
+
+    def _record(self, index: int, latency: float, hedged: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(latency)
+            if hedged:
+                self.hedged += 1
+                if index > 0:
+                    self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        r"""The number of requests, of hedged requests, of hedged requests
+        won by a secondary backend, and of failovers."""
+        hedge_delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "failovers": self.failovers,
+                "hedge_delay": hedge_delay,
+            }
+
+    def _on_error(self, index: int, error: Exception, has_next: bool) -> None:
+        logger.warning(f"Model {self.models[index].model_type} failed: {error}")
+        if has_next and self.failover:
+            with self._lock:
+                self.failovers += 1
+
+    def _run(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._run_failover(messages, response_format, tools)
+
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        thread_name_prefix="owl-hedged-model"
+                    )
+        start_time = time.monotonic()
+        pending: Dict[Future, int] = {}
+        launched_at = start_time
+        next_index = 0
+        hedged = False
+        errors: List[Exception] = []
+
+        def launch() -> None:
+            nonlocal next_index, launched_at
+            assert self._executor is not None
+            future = self._executor.submit(
+                self.models[next_index].run, messages, response_format, tools or []
+            )
+            pending[future] = next_index
+            next_index += 1
+            launched_at = time.monotonic()
+
+        launch()
+        while pending:
+            timeout = None
+            if next_index < len(self.models):
+                timeout = max(0.0, launched_at + delay - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                hedged = True
+                continue
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    has_next = next_index < len(self.models)
+                    self._on_error(index, e, has_next)
+                    errors.append(e)
+                    if has_next and self.failover and not pending:
+                        launch()
+                    continue
+                for other in pending:
+                    other.cancel()
+                self._record(index, time.monotonic() - start_time, hedged)
+                return response
+        raise errors[-1]
+
+    def _run_failover(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]],
+        tools: Optional[List[Dict[str, Any]]],
+    ):
+        start_time = time.monotonic()
+        for index, model in enumerate(self.models):
+            try:
+                response = model.run(messages, response_format, tools or [])
+            except Exception as e:
+                has_next = index + 1 < len(self.models)
+                self._on_error(index, e, has_next)
+                if has_next and self.failover:
+                    continue
+                raise
+            self._record(index, time.monotonic() - start_time, False)
+            return response
+
+    async def _arun(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        delay = self.hedge_delay()
+        start_time = time.monotonic()
+        pending: Dict[asyncio.Task, int] = {}
+        launched_at = start_time
+        next_index = 0
+        hedged = False
+        errors: List[Exception] = []
+
+        def launch() -> None:
+            nonlocal next_index, launched_at
+            task = asyncio.create_task(
+                self.models[next_index].arun(messages, response_format, tools or [])
+            )
+            pending[task] = next_index
+            next_index += 1
+            launched_at = time.monotonic()
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if delay is not None and next_index < len(self.models):
+                    timeout = max(0.0, launched_at + delay - time.monotonic())
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    hedged = True
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        has_next = next_index < len(self.models)
+                        self._on_error(index, e, has_next)
+                        errors.append(e)
+                        if has_next and self.failover and not pending:
+                            launch()
+                        continue
+                    self._record(index, time.monotonic() - start_time, hedged)
+                    return response
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,285 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import json
+import os
+import tempfile
+import threading
+import weakref
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+
+@dataclass(frozen=True)
+class PayloadRef:
+    r"""A reference to a tool result spilled to the payload file of a
+    :obj:`ChatHistoryStore`.
+
+    Args:
+        offset (int): The offset of the payload in the file.
+        length (int): The length of the payload in bytes.
+    """
+
+    offset: int
+    length: int
+
+    def __str__(self) -> str:
+        return f"<payload of {self.length} bytes at offset {self.offset}>"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"__payload_ref__": [self.offset, self.length]}
+
+    @classmethod
+    def from_dict(cls, data: Any) -> Optional["PayloadRef"]:
+        r"""The reference converted by :meth:`to_dict`, or :obj:`None` if the
+        data is not one."""
+        if isinstance(data, dict) and "__payload_ref__" in data:
+            offset, length = data["__payload_ref__"]
+            return cls(offset, length)
+        return None
+
+
+def _read_payload(file: IO[bytes], ref: PayloadRef) -> Any:
+    file.seek(ref.offset)
+    return json.loads(file.read(ref.length).decode("utf-8"))
+
+
+def _map_results(
+    records: Iterable[Dict[str, Any]], convert: Callable[[Any], Any]
+) -> List[Dict[str, Any]]:
+    return [
+        {
+            **record,
+            "tool_calls": [
+                {**call, "result": convert(call.get("result"))}
+                for call in record.get("tool_calls") or []
+            ],
+        }
+        for record in records
+    ]
+
+
+def load_payloads(
+    records: Iterable[Dict[str, Any]], path: Union[str, Path]
+) -> List[Dict[str, Any]]:
+    r"""Read back the results of entries dumped by
+    :meth:`ChatHistoryStore.dump_records`.
+
+    Args:
+        records (Iterable[Dict[str, Any]]): The dumped entries.
+        path (Union[str, Path]): The payload file of the store.
+
+    Returns:
+        List[Dict[str, Any]]: The entries, with their tool results.
+    """
+    with open(path, "rb") as file:
+
+        def convert(result: Any) -> Any:
+            ref = PayloadRef.from_dict(result)
+            return result if ref is None else _read_payload(file, ref)
+
+        return _map_results(records, convert)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ChatHistoryStore(Sequence):
+    r"""An append-only chat history keeping large tool results on disk.
+
+    The entries of the history, with the `user`, `assistant` and
+    `tool_calls` keys, stay in memory, except for the tool results larger
+    than :obj:`spill_threshold` bytes. Those are appended to a payload file
+    and replaced by a :obj:`PayloadRef` holding their offset, so the memory
+    used by a society no longer grows with the pages and documents its tools
+    return.
+
+    The store is a read-only sequence of entries: indexing and iterating
+    load the spilled results back, one entry at a time. Use
+    :meth:`iter_metadata` to go through the entries without reading the
+    payload file, and :meth:`to_list` to get a plain list.
+
+    The checkpoints of a society keep the spilled results as references to
+    the payload file, so resuming it needs the file: give a :obj:`path` to
+    the stores of checkpointed societies.
+
+    Args:
+        path (Union[str, Path], optional): The payload file. By default a
+            temporary file, deleted with the store, is used.
+            (default: :obj:`None`)
+        spill_threshold (int, optional): The size in bytes of the JSON
+            encoded tool results above which they are spilled to disk.
+            (default: :obj:`4096`)
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        spill_threshold: int = 4096,
+    ):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="owl-history-", suffix=".jsonl")
+            os.close(fd)
+            self._finalizer: Optional[weakref.finalize] = weakref.finalize(
+                self, _remove_file, str(path)
+            )
+        else:
+            self._finalizer = None
+        self.path = Path(path)
+        self.spill_threshold = spill_threshold
+
+        self._records: List[Dict[str, Any]] = []
+        self._file = open(self.path, "ab+")
+        self._lock = threading.Lock()
+        self.spilled_bytes = 0
+
+    def append(self, record: Dict[str, Any]) -> None:
+        r"""Append an entry, spilling its large tool results to disk.
+
+        Args:
+            record (Dict[str, Any]): The entry of a round.
+        """
+        tool_calls = [
+            self._spill(tool_call) for tool_call in record.get("tool_calls") or []
+        ]
+        self._records.append({**record, "tool_calls": tool_calls})
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.append(record)
+
+    def _spill(self, tool_call: Dict[str, Any]) -> Dict[str, Any]:
+        payload = json.dumps(
+            tool_call.get("result"), ensure_ascii=False, default=str
+        ).encode("utf-8")
+        if len(payload) <= self.spill_threshold:
+            return tool_call
+
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            # One payload per line keeps the file readable on its own
+            self._file.write(payload + b"\n")
+            self._file.flush()
+            self.spilled_bytes += len(payload)
+        return {**tool_call, "result": PayloadRef(offset, len(payload))}
+
+    def load_payload(self, ref: PayloadRef) -> Any:
+        r"""Read a spilled tool result.
+
+        Args:
+            ref (PayloadRef): The reference of the result.
+
+        Returns:
+            Any: The tool result.
+        """
+        with self._lock:
+            return _read_payload(self._file, ref)
+
+    def _load(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        tool_calls = record["tool_calls"]
+        if not any(isinstance(call.get("result"), PayloadRef) for call in tool_calls):
+            return record
+        return {
+            **record,
+            "tool_calls": [
+                {**call, "result": self.load_payload(call["result"])}
+                if isinstance(call.get("result"), PayloadRef)
+                else call
+                for call in tool_calls
+            ],
+        }
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._load(record) for record in self._records[index]]
+        return self._load(self._records[index])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for record in self._records:
+            yield self._load(record)
+
+    def iter_metadata(self) -> Iterator[Dict[str, Any]]:
+        r"""Iterate over the entries without reading the spilled results,
+        which are left as :obj:`PayloadRef`."""
+        return iter(self._records)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        r"""Load the whole history as a list of entries."""
+        return list(self)
+
+    def dump_records(self) -> List[Dict[str, Any]]:
+        r"""The entries in a JSON serializable form, without reading the
+        payload file: the spilled results are dumped as references.
+
+        Returns:
+            List[Dict[str, Any]]: The entries, read back by
+                :meth:`load_records` or :func:`load_payloads`.
+        """
+
+        def convert(result: Any) -> Any:
+            return result.to_dict() if isinstance(result, PayloadRef) else result
+
+        return _map_results(self._records, convert)
+
+    def load_records(
+        self,
+        records: Iterable[Dict[str, Any]],
+        path: Optional[Union[str, Path]] = None,
+    ) -> None:
+        r"""Append entries dumped by :meth:`dump_records`.
+
+        Args:
+            records (Iterable[Dict[str, Any]]): The dumped entries.
+            path (Union[str, Path], optional): The payload file of the store
+                which dumped them. Their references are kept if it is the file
+                of this store, otherwise their results are read from it and
+                spilled again. (default: the file of this store)
+        """
+        if path is not None and Path(path).resolve() != self.path.resolve():
+            self.extend(load_payloads(records, path))
+            return
+
+        def convert(result: Any) -> Any:
+            ref = PayloadRef.from_dict(result)
+            return result if ref is None else ref
+
+        self._records.extend(_map_results(records, convert))
+
+    def close(self) -> None:
+        r"""Close the payload file, and delete it if it is temporary."""
+        self._file.close()
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __enter__(self) -> "ChatHistoryStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return (
+            f"ChatHistoryStore({len(self)} entries, "
+            f"{self.spilled_bytes} bytes spilled to {self.path})"
+        )
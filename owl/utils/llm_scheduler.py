@@ -0,0 +1,491 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
+
+from camel.logger import get_logger
+from camel.messages import OpenAIMessage
+from camel.models import BaseModelBackend
+from camel.types import ChatCompletion
+from camel.utils import BaseTokenCounter
+from pydantic import BaseModel
+
+logger = get_logger(__name__)
+
+
+class RequestPriority(IntEnum):
+    r"""The lanes of the scheduler, lower values are served first."""
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+@dataclass
+class RateLimit:
+    r"""The limits of a provider and model.
+
+    Args:
+        requests_per_minute (float, optional): The request rate,
+            :obj:`None` for no limit. (default: :obj:`None`)
+        tokens_per_minute (float, optional): The token rate, :obj:`None` for
+            no limit. (default: :obj:`None`)
+        max_concurrency (int, optional): The upper bound of the adaptive
+            concurrency limit. (default: :obj:`16`)
+        min_concurrency (int, optional): The lower bound of the adaptive
+            concurrency limit. (default: :obj:`1`)
+        latency_target (float, optional): The latency in seconds above which
+            the concurrency limit is decreased, :obj:`None` to only react to
+            rate limit errors. (default: :obj:`None`)
+    """
+
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_concurrency: int = 16
+    min_concurrency: int = 1
+    latency_target: Optional[float] = None
+
+
+class TokenBucket:
+    r"""A token bucket refilled continuously at :obj:`rate_per_minute`,
+    holding at most a minute worth of tokens. Not thread-safe."""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def delay(self, amount: float, now: float) -> float:
+        r"""The time in seconds until :obj:`amount` tokens are available."""
+        self._refill(now)
+        # Requests larger than the bucket wait for a full bucket
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        # May go negative, which delays the next requests
+        self.tokens -= amount
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    r"""Whether an error of a provider client is a rate limit error."""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    if type(error).__name__ == "RateLimitError":
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message
+
+
+class _Waiter:
+    def __init__(self, priority: int, tokens: float):
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self._event = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_event: Optional[asyncio.Event] = None
+
+    def bind_loop(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._async_event = asyncio.Event()
+
+    def wake(self) -> None:
+        if self._loop is not None and self._async_event is not None:
+            self._loop.call_soon_threadsafe(self._async_event.set)
+        else:
+            self._event.set()
+
+    def wait(self, timeout: Optional[float]) -> None:
+        self._event.wait(timeout)
+        self._event.clear()
+
+    async def await_(self, timeout: Optional[float]) -> None:
+        assert self._async_event is not None
+        try:
+            await asyncio.wait_for(self._async_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._async_event.clear()
+
+
+class _Lane:
+    r"""The state of the scheduler for one provider and model."""
+
+    def __init__(self, limit: RateLimit, metrics_window: int):
+        self.config = limit
+        self.request_bucket = (
+            TokenBucket(limit.requests_per_minute)
+            if limit.requests_per_minute
+            else None
+        )
+        self.token_bucket = (
+            TokenBucket(limit.tokens_per_minute) if limit.tokens_per_minute else None
+        )
+        self.concurrency = float(limit.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.waiters: List[Tuple[int, int, _Waiter]] = []
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.queue_times: Deque[float] = deque(maxlen=metrics_window)
+        self.latencies: Deque[float] = deque(maxlen=metrics_window)
+
+    def admission_delay(self, waiter: _Waiter, now: float) -> Optional[float]:
+        r"""The time until the waiter can be admitted, :obj:`None` if it has
+        to wait for a request to finish."""
+        if self.waiters[0][2] is not waiter:
+            return None
+        if self.in_flight >= max(int(self.concurrency), 1):
+            return None
+        delay = max(0.0, self.paused_until - now)
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.delay(1, now))
+        if self.token_bucket is not None:
+            delay = max(delay, self.token_bucket.delay(waiter.tokens, now))
+        return delay
+
+    def admit(self, now: float) -> _Waiter:
+        _, _, waiter = heapq.heappop(self.waiters)
+        if self.request_bucket is not None:
+            self.request_bucket.consume(1, now)
+        if self.token_bucket is not None:
+            self.token_bucket.consume(waiter.tokens, now)
+        self.in_flight += 1
+        self.requests += 1
+        self.queue_times.append(now - waiter.enqueued_at)
+        return waiter
+
+
+def _percentile(values: Deque[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMScheduler:
+    r"""Schedule the model requests of all the societies of a process.
+
+    Requests are grouped in lanes by provider and model. Each lane admits
+    requests in priority order, interactive before batch, within:
+
+    - a token bucket of requests per minute and one of tokens per minute,
+      the tokens of a request being estimated from its messages and
+      corrected with the usage of its response,
+    - an adaptive concurrency limit, increased by one per window of
+      successful requests, halved on rate limit errors and lowered by a
+      tenth for each request slower than the latency target.
+
+    A rate limit error also pauses the lane for :obj:`rate_limit_pause`
+    seconds, so that the retries of all the agents do not hit the provider
+    at once.
+
+    Use :func:`get_default_scheduler` to share a scheduler across the
+    process, and :obj:`ScheduledModelBackend` to route a model through it.
+
+    Args:
+        limits (Dict[str, RateLimit], optional): The limits of each model,
+            keyed by model type. (default: :obj:`None`)
+        default_limit (RateLimit, optional): The limits of the other models.
+            (default: :obj:`RateLimit()`)
+        rate_limit_pause (float, optional): The pause of a lane after a rate
+            limit error, in seconds. (default: :obj:`5.0`)
+        metrics_window (int, optional): The number of requests the queueing
+            time and latency percentiles are computed over.
+            (default: :obj:`1000`)
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, RateLimit]] = None,
+        default_limit: Optional[RateLimit] = None,
+        rate_limit_pause: float = 5.0,
+        metrics_window: int = 1000,
+    ):
+        self.limits = limits or {}
+        self.default_limit = default_limit or RateLimit()
+        self.rate_limit_pause = rate_limit_pause
+        self.metrics_window = metrics_window
+        self._lanes: Dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def _lane(self, key: str, model_type: str) -> _Lane:
+        lane = self._lanes.get(key)
+        if lane is None:
+            limit = self.limits.get(model_type, self.default_limit)
+            lane = self._lanes[key] = _Lane(limit, self.metrics_window)
+        return lane
+
+    def _enqueue(
+        self, key: str, model_type: str, priority: int, tokens: float
+    ) -> Tuple[_Lane, _Waiter]:
+        waiter = _Waiter(priority, tokens)
+        with self._lock:
+            lane = self._lane(key, model_type)
+            heapq.heappush(lane.waiters, (priority, next(self._counter), waiter))
+        return lane, waiter
+
+    def _try_admit(self, lane: _Lane, waiter: _Waiter) -> Optional[float]:
+        r"""Admit the waiter if possible, else return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            delay = lane.admission_delay(waiter, now)
+            if delay == 0.0:
+                lane.admit(now)
+                self._wake_head(lane)
+                return 0.0
+            # Bounded, as the head of the lane may change
+            return 1.0 if delay is None else min(delay, 1.0)
+
+    def _wake_head(self, lane: _Lane) -> None:
+        if lane.waiters:
+            lane.waiters[0][2].wake()
+
+    def _cancel(self, lane: _Lane, waiter: _Waiter) -> None:
+        with self._lock:
+            lane.waiters = [w for w in lane.waiters if w[2] is not waiter]
+            heapq.heapify(lane.waiters)
+            self._wake_head(lane)
+
+    def acquire(
+        self, key: str, model_type: str, priority: int, tokens: float
+    ) -> Tuple[_Lane, _Waiter]:
+        r"""Wait until a request can be sent, blocking the thread."""
+        lane, waiter = self._enqueue(key, model_type, priority, tokens)
+        try:
+            while True:
+                delay = self._try_admit(lane, waiter)
+                if delay == 0.0:
+                    return lane, waiter
+                waiter.wait(delay)
+        except BaseException:
+            self._cancel(lane, waiter)
+            raise
+
+    async def aacquire(
+        self, key: str, model_type: str, priority: int, tokens: float
+    ) -> Tuple[_Lane, _Waiter]:
+        r"""Wait until a request can be sent, without blocking the loop."""
+        lane, waiter = self._enqueue(key, model_type, priority, tokens)
+        waiter.bind_loop()
+        try:
+            while True:
+                delay = self._try_admit(lane, waiter)
+                if delay == 0.0:
+                    return lane, waiter
+                await waiter.await_(delay)
+        except BaseException:
+            self._cancel(lane, waiter)
+            raise
+
+    def release(
+        self,
+        lane: _Lane,
+        waiter: _Waiter,
+        latency: float,
+        used_tokens: Optional[int] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        r"""Report the outcome of a request and free its slot."""
+        with self._lock:
+            now = time.monotonic()
+            lane.in_flight -= 1
+            config = lane.config
+            if used_tokens is not None and lane.token_bucket is not None:
+                lane.token_bucket.consume(used_tokens - waiter.tokens, now)
+
+            if error is not None and is_rate_limit_error(error):
+                lane.rate_limited += 1
+                lane.concurrency = max(config.min_concurrency, lane.concurrency / 2)
+                lane.paused_until = max(lane.paused_until, now + self.rate_limit_pause)
+                logger.warning(
+                    f"Rate limited, concurrency limit lowered to "
+                    f"{int(lane.concurrency)}"
+                )
+            elif error is None:
+                lane.latencies.append(latency)
+                if (
+                    config.latency_target is not None
+                    and latency > config.latency_target
+                ):
+                    lane.concurrency = max(
+                        config.min_concurrency, lane.concurrency * 0.9
+                    )
+                else:
+                    lane.concurrency = min(
+                        config.max_concurrency,
+                        lane.concurrency + 1 / max(lane.concurrency, 1),
+                    )
+            self._wake_head(lane)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        r"""The metrics of each lane, keyed by provider and model."""
+        with self._lock:
+            return {
+                key: {
+                    "requests": lane.requests,
+                    "rate_limited": lane.rate_limited,
+                    "in_flight": lane.in_flight,
+                    "queued": len(lane.waiters),
+                    "concurrency_limit": int(lane.concurrency),
+                    "queue_time_mean": (
+                        sum(lane.queue_times) / len(lane.queue_times)
+                        if lane.queue_times
+                        else 0.0
+                    ),
+                    "queue_time_p50": _percentile(lane.queue_times, 0.5),
+                    "queue_time_p99": _percentile(lane.queue_times, 0.99),
+                    "latency_p50": _percentile(lane.latencies, 0.5),
+                    "latency_p99": _percentile(lane.latencies, 0.99),
+                }
+                for key, lane in self._lanes.items()
+            }
+
+
+_default_scheduler: Optional[LLMScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> LLMScheduler:
+    r"""The scheduler shared by the whole process."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler()
+        return _default_scheduler
+
+
+def estimate_tokens(messages: List[OpenAIMessage]) -> int:
+    r"""A rough estimate of the prompt tokens of messages, about four
+    characters per token, cheap enough to run before every request."""
+    return len(json.dumps(messages, ensure_ascii=False, default=str)) // 4
+
+
+class ScheduledModelBackend(BaseModelBackend):
+    r"""Wrap a model backend so its requests go through a
+    :obj:`LLMScheduler`.
+
+    Args:
+        model (BaseModelBackend): The scheduled model.
+        scheduler (LLMScheduler, optional): The scheduler.
+            (default: :obj:`get_default_scheduler()`)
+        priority (RequestPriority, optional): The lane of the requests.
+            (default: :obj:`RequestPriority.INTERACTIVE`)
+    """
+
+    def __init__(
+        self,
+        model: BaseModelBackend,
+        scheduler: Optional[LLMScheduler] = None,
+        priority: RequestPriority = RequestPriority.INTERACTIVE,
+    ):
+        self.model = model
+        self.scheduler = scheduler or get_default_scheduler()
+        self.priority = priority
+        super().__init__(
+            model_type=model.model_type,
+            model_config_dict=model.model_config_dict,
+        )
+        self.key = f"{type(model).__name__}:{model.model_type}:{model._url or ''}"
+
+    @property
+    def token_counter(self) -> BaseTokenCounter:
+        return self.model.token_counter
+
+    @property
+    def token_limit(self) -> int:
+        return self.model.token_limit
+
+    @property
+    def stream(self) -> bool:
+        return self.model.stream
+
+    def check_model_config(self):
+        pass
+
+    def _release(
+        self,
+        lane: _Lane,
+        waiter: _Waiter,
+        start_time: float,
+        response: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        used_tokens = None
+        if isinstance(response, ChatCompletion) and response.usage is not None:
+            used_tokens = response.usage.total_tokens
+        self.scheduler.release(
+            lane, waiter, time.monotonic() - start_time, used_tokens, error
+        )
+
+    def _run(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        lane, waiter = self.scheduler.acquire(
+            self.key,
+            str(self.model_type),
+            self.priority,
+            estimate_tokens(messages),
+        )
+        start_time = time.monotonic()
+        try:
+            response = self.model.run(messages, response_format, tools or [])
+        except BaseException as e:
+            self._release(lane, waiter, start_time, error=e)
+            raise
+        self._release(lane, waiter, start_time, response)
+        return response
+
+    async def _arun(
+        self,
+        messages: List[OpenAIMessage],
+        response_format: Optional[Type[BaseModel]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+    ):
+        lane, waiter = await self.scheduler.aacquire(
+            self.key,
+            str(self.model_type),
+            self.priority,
+            estimate_tokens(messages),
+        )
+        start_time = time.monotonic()
+        try:
+            response = await self.model.arun(messages, response_format, tools or [])
+        except BaseException as e:
+            self._release(lane, waiter, start_time, error=e)
+            raise
+        self._release(lane, waiter, start_time, response)
+        return response
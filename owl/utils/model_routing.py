@@ -0,0 +1,243 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Union
+
+from camel.logger import get_logger
+from camel.models import BaseModelBackend
+from camel.types import RoleType
+from camel.types.agents import ToolCallingRecord
+
+logger = get_logger(__name__)
+
+REASONING_TASK_PROMPT = """
+Please judge whether the following question is a reasoning or coding task, which can be solved by reasoning without leveraging external resources, or is suitable for writing code to solve the task.
+If it is a reasoning or coding task, please return only "yes".
+If it is not a reasoning or coding task, please return only "no".
+Note:
+- If the question required some world knowledge to answer the question, please carefully judge it, because the model's own knowledge is often unreliable.
+- If it is suitable for writing codes (e.g. process excel files, write simulation codes, etc.), in most cases, it can be considered as a coding task.
+Question: <question>{question}</question>
+"""
+
+
+def task_hash(task_prompt: str) -> str:
+    r"""The key of a task in the classification cache."""
+    return hashlib.sha256(task_prompt.strip().encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RoutingState:
+    r"""The routing state of one agent during a run.
+
+    Args:
+        reasoning_task (bool, optional): Whether the task was classified as a
+            reasoning or coding task. (default: :obj:`False`)
+        escalated (bool, optional): Whether the agent was escalated to the
+            reasoning model. (default: :obj:`False`)
+        failure_signals (int, optional): The number of failure signals
+            observed so far. (default: :obj:`0`)
+        seen_tool_calls (Set[str], optional): The tool calls made so far, by
+            name and arguments. (default: :obj:`set()`)
+    """
+
+    reasoning_task: bool = False
+    escalated: bool = False
+    failure_signals: int = 0
+    seen_tool_calls: Set[str] = field(default_factory=set)
+
+
+class ModelRouter:
+    r"""Route each agent of a society, and each of its steps, to the model
+    fitting the job.
+
+    The user agent, which only plans, always runs on :obj:`planner_model`.
+    The assistant runs on :obj:`strong_model`, or on :obj:`reasoning_model`
+    when the task is classified as a reasoning or coding task, or once
+    :obj:`escalation_threshold` failure signals (tool errors and tool calls
+    repeated with the same arguments) were observed. Steps of the assistant
+    whose instruction matches :obj:`easy_round` run on :obj:`planner_model`.
+
+    The task classification is made once per task by
+    :obj:`classifier_model` and cached by task hash, in memory and in
+    :obj:`cache_path` if given. A router holds no per-run state and can be
+    shared by many societies.
+
+    Any model left to :obj:`None` keeps the model the agent was configured
+    with.
+
+    Args:
+        planner_model (BaseModelBackend, optional): The fast and cheap model
+            of the user agent and of the easy rounds. (default: :obj:`None`)
+        strong_model (BaseModelBackend, optional): The default model of the
+            assistant agent. (default: :obj:`None`)
+        reasoning_model (BaseModelBackend, optional): The model of the
+            assistant for reasoning tasks and after escalation.
+            (default: :obj:`None`)
+        classifier_model (BaseModelBackend, optional): The model classifying
+            the tasks. Without it, and without :obj:`planner_model`, no task
+            is a reasoning task. (default: :obj:`planner_model`)
+        easy_round (Callable[[str], bool], optional): Whether an instruction
+            of the user agent is easy enough for :obj:`planner_model`.
+            (default: :obj:`None`)
+        escalation_threshold (int, optional): The number of failure signals
+            triggering the escalation to :obj:`reasoning_model`.
+            (default: :obj:`2`)
+        cache_path (Union[str, Path], optional): The JSON file persisting the
+            task classifications. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        planner_model: Optional[BaseModelBackend] = None,
+        strong_model: Optional[BaseModelBackend] = None,
+        reasoning_model: Optional[BaseModelBackend] = None,
+        classifier_model: Optional[BaseModelBackend] = None,
+        easy_round: Optional[Callable[[str], bool]] = None,
+        escalation_threshold: int = 2,
+        cache_path: Optional[Union[str, Path]] = None,
+    ):
+        self.planner_model = planner_model
+        self.strong_model = strong_model
+        self.reasoning_model = reasoning_model
+        self.classifier_model = classifier_model or planner_model
+        self.easy_round = easy_round
+        self.escalation_threshold = escalation_threshold
+        self.cache_path = Path(cache_path) if cache_path else None
+
+        self._lock = threading.Lock()
+        self._cache: Dict[str, bool] = {}
+        if self.cache_path is not None and self.cache_path.exists():
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                self._cache = json.load(f)
+
+    @property
+    def models(self) -> List[BaseModelBackend]:
+        r"""The models the router may route to."""
+        return [
+            model
+            for model in (self.planner_model, self.strong_model, self.reasoning_model)
+            if model is not None
+        ]
+
+    def is_reasoning_task(self, task_prompt: str) -> bool:
+        r"""Classify a task, using the cached classification if any.
+
+        Args:
+            task_prompt (str): The task of the society.
+
+        Returns:
+            bool: Whether the task is a reasoning or coding task.
+        """
+        key = task_hash(task_prompt)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        if self.classifier_model is None:
+            return False
+        try:
+            response = self.classifier_model.run(
+                [
+                    {
+                        "role": "user",
+                        "content": REASONING_TASK_PROMPT.format(question=task_prompt),
+                    }
+                ]
+            )
+            is_reasoning = "yes" in (response.choices[0].message.content or "").lower()
+        except Exception as e:
+            logger.warning(
+                f"Failed to classify the task, assuming a standard task: {e}"
+            )
+            return False
+
+        logger.info(f"Task {key[:8]} classified as a reasoning task: {is_reasoning}")
+        with self._lock:
+            self._cache[key] = is_reasoning
+            self._save_cache()
+        return is_reasoning
+
+    def _save_cache(self) -> None:
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def select_model(
+        self, role_type: RoleType, instruction: str, state: RoutingState
+    ) -> Optional[BaseModelBackend]:
+        r"""Select the model of a step.
+
+        Args:
+            role_type (RoleType): The role of the agent.
+            instruction (str): The input message of the step.
+            state (RoutingState): The routing state of the agent.
+
+        Returns:
+            Optional[BaseModelBackend]: The model of the step, or :obj:`None`
+                to keep the configured model.
+        """
+        if role_type == RoleType.USER:
+            return self.planner_model
+        if state.escalated or state.reasoning_task:
+            return self.reasoning_model or self.strong_model
+        if self.easy_round is not None and self.easy_round(instruction):
+            return self.planner_model or self.strong_model
+        return self.strong_model
+
+    def observe(
+        self, tool_call_records: List[ToolCallingRecord], state: RoutingState
+    ) -> None:
+        r"""Count the failure signals of a step and escalate the agent once
+        they reach :obj:`escalation_threshold`.
+
+        Args:
+            tool_call_records (List[ToolCallingRecord]): The tool calls of the
+                step.
+            state (RoutingState): The routing state of the agent.
+        """
+        for record in tool_call_records:
+            call = f"{record.tool_name}:{json.dumps(record.args, sort_keys=True, default=str)}"
+            if call in state.seen_tool_calls:
+                state.failure_signals += 1
+            state.seen_tool_calls.add(call)
+            if _is_error(record.result):
+                state.failure_signals += 1
+
+        if (
+            not state.escalated
+            and self.reasoning_model is not None
+            and state.failure_signals >= self.escalation_threshold
+        ):
+            state.escalated = True
+            logger.warning(
+                f"Escalating to {self.reasoning_model.model_type} after "
+                f"{state.failure_signals} failure signals"
+            )
+
+
+def _is_error(result: object) -> bool:
+    if isinstance(result, dict):
+        return "error" in result
+    return isinstance(result, str) and result.lstrip().lower().startswith("error")
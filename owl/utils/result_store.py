@@ -0,0 +1,295 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from camel.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ResultStore:
+    r"""An append-only store of the results of benchmark tasks.
+
+    Each result is appended as one line of a JSONL file, so saving a result
+    costs the same at the first task and at the thousandth. The chat
+    histories, which make most of the size of the results, are appended to
+    a side file, and the results only keep the offset and length of their
+    history in it.
+
+    The results are loaded in memory, without their histories, and indexed
+    by `task_id`. A task appended again replaces its previous result, which
+    stays in the files until :meth:`compact` rewrites them. A line truncated
+    by an interrupted run is skipped when loading.
+
+    Args:
+        path (Union[str, Path]): The JSONL file of the results. The histories
+            are stored next to it, in a file with the `.history.jsonl`
+            suffix.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.history_path = self.path.with_suffix(".history.jsonl")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            # The truncated line of an interrupted run is ended, so that the
+            # next result starts on its own line
+            self._file.write("\n")
+            self._file.flush()
+        self._history_file = open(self.history_path, "ab+")
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(
+                        f"Skipping the invalid line {line_number} of {self.path}."
+                    )
+                    continue
+                self._index[record["task_id"]] = record
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def append(self, result: Dict[str, Any]) -> None:
+        r"""Append the result of a task, with its history if any.
+
+        Args:
+            result (Dict[str, Any]): The result, with a `task_id` key.
+        """
+        record = dict(result)
+        history = record.pop("history", None)
+        with self._lock:
+            record["history_ref"] = None
+            if history is not None:
+                # The history is written first, so that a result never refers
+                # to a missing history
+                payload = json.dumps(
+                    list(history), ensure_ascii=False, default=str
+                ).encode("utf-8")
+                self._history_file.seek(0, os.SEEK_END)
+                offset = self._history_file.tell()
+                self._history_file.write(payload + b"\n")
+                self._history_file.flush()
+                record["history_ref"] = {"offset": offset, "length": len(payload)}
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+            self._index[record["task_id"]] = record
+
+    def load_history(self, record: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        r"""Read the history of a result.
+
+        Args:
+            record (Dict[str, Any]): The result, as returned by :meth:`get`
+                or :meth:`results`.
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: The chat history of the task.
+        """
+        ref = record.get("history_ref")
+        if ref is None:
+            return None
+        with self._lock:
+            self._history_file.seek(ref["offset"])
+            payload = self._history_file.read(ref["length"])
+        return json.loads(payload.decode("utf-8"))
+
+    def _with_history(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        result = _without_ref(record)
+        result["history"] = self.load_history(record)
+        return result
+
+    def get(self, task_id: str, with_history: bool = False) -> Optional[Dict[str, Any]]:
+        r"""Get the latest result of a task.
+
+        Args:
+            task_id (str): The ID of the task.
+            with_history (bool, optional): Whether to read its history.
+                (default: :obj:`False`)
+
+        Returns:
+            Optional[Dict[str, Any]]: The result, :obj:`None` if the task has
+                none.
+        """
+        record = self._index.get(task_id)
+        if record is None or not with_history:
+            return record
+        return self._with_history(record)
+
+    def results(self, with_history: bool = False) -> Iterator[Dict[str, Any]]:
+        r"""Iterate over the latest result of each task.
+
+        Args:
+            with_history (bool, optional): Whether to read the histories, one
+                at a time. (default: :obj:`False`)
+
+        Yields:
+            Dict[str, Any]: The results, in the order of their tasks.
+        """
+        for record in list(self._index.values()):
+            yield self._with_history(record) if with_history else record
+
+    def summary(self) -> Dict[str, Any]:
+        r"""The number of tasks, of correct answers, and the accuracy."""
+        total = len(self._index)
+        correct = sum(record.get("score") or 0 for record in self._index.values())
+        return {
+            "total": total,
+            "correct": correct,
+            "accuracy": correct / total if total > 0 else 0,
+        }
+
+    def import_json(self, path: Union[str, Path]) -> int:
+        r"""Append the results of a JSON list, as written by earlier versions
+        of :obj:`GAIABenchmark`.
+
+        Args:
+            path (Union[str, Path]): The JSON file.
+
+        Returns:
+            int: The number of results imported.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+        for result in results:
+            self.append(result)
+        return len(results)
+
+    def merge(self, paths: Iterable[Union[str, Path]]) -> int:
+        r"""Append the results of other stores, e.g. those of the shards of a
+        run, with their histories.
+
+        A task found in several stores keeps its result from the last of
+        them, unless that result is an error and an earlier one is not. The
+        results already in this store unchanged are not appended again, so
+        that the shards can be merged again as they progress. The stores are
+        merged from the command line with
+        `python -m owl.utils.results_cli merge`.
+
+        Args:
+            paths (Iterable[Union[str, Path]]): The JSONL files of the stores.
+
+        Returns:
+            int: The number of results appended.
+        """
+        appended = 0
+        for path in paths:
+            with ResultStore(path) as other:
+                for record in other.results():
+                    current = self._index.get(record["task_id"])
+                    if current is not None:
+                        if record.get("error") and not current.get("error"):
+                            continue
+                        if _without_ref(current) == _without_ref(record):
+                            continue
+                    self.append(other._with_history(record))
+                    appended += 1
+        return appended
+
+    def export(self, path: Union[str, Path]) -> None:
+        r"""Write the latest result of each task, with its history, as the
+        indented JSON list written by earlier versions of
+        :obj:`GAIABenchmark`.
+
+        The results are written one at a time, to a temporary file replacing
+        :obj:`path` once complete. The store is exported from the command
+        line with `python -m owl.utils.results_cli export`.
+
+        Args:
+            path (Union[str, Path]): The JSON file.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for i, result in enumerate(self.results(with_history=True)):
+                text = json.dumps(result, indent=4, ensure_ascii=False, default=str)
+                f.write(("," if i else "") + "\n    " + text.replace("\n", "\n    "))
+            f.write("\n]" if self._index else "]")
+        os.replace(tmp_path, path)
+
+    def compact(self) -> None:
+        r"""Rewrite the files with only the latest result of each task.
+
+        The store must not be appended to by another process meanwhile. It
+        is compacted from the command line with
+        `python -m owl.utils.results_cli compact`.
+        """
+        tmp_path = self.path.with_suffix(".jsonl.tmp")
+        tmp_history_path = self.history_path.with_suffix(".tmp")
+        with self._lock:
+            records = []
+            with open(tmp_history_path, "wb") as history_file:
+                for record in self._index.values():
+                    record = dict(record)
+                    ref = record.get("history_ref")
+                    if ref is not None:
+                        self._history_file.seek(ref["offset"])
+                        payload = self._history_file.read(ref["length"])
+                        record["history_ref"] = {
+                            "offset": history_file.tell(),
+                            "length": len(payload),
+                        }
+                        history_file.write(payload + b"\n")
+                    records.append(record)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            self._file.close()
+            self._history_file.close()
+            os.replace(tmp_history_path, self.history_path)
+            os.replace(tmp_path, self.path)
+            self._index = {record["task_id"]: record for record in records}
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._history_file = open(self.history_path, "ab+")
+
+    def close(self) -> None:
+        self._file.close()
+        self._history_file.close()
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"ResultStore({len(self)} results in {self.path})"
+
+
+def _without_ref(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in record.items() if key != "history_ref"}
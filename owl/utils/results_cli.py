@@ -0,0 +1,151 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+r"""Command line tools of the benchmark results.
+
+python -m owl.utils.results_cli compact results/result.jsonl
+python -m owl.utils.results_cli export results/result.jsonl result.json
+python -m owl.utils.results_cli summary results/result.jsonl
+python -m owl.utils.results_cli report results/result.jsonl --compare \
+    results/baseline.jsonl --output-dir results/report
+python -m owl.utils.results_cli merge results/result.jsonl
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from .benchmark_report import BenchmarkReport
+from .result_store import ResultStore
+
+
+def _shard_paths(store: Path) -> List[Path]:
+    r"""The stores of the shards of a run next to its store, as written by
+    :obj:`GAIABenchmark` with `num_shards`, warning about missing shards."""
+    pattern = re.compile(re.escape(store.stem) + r"\.shard-(\d+)-of-(\d+)\.jsonl")
+    shards = {}
+    for path in store.parent.glob(f"{store.stem}.shard-*-of-*.jsonl"):
+        match = pattern.fullmatch(path.name)
+        if match:
+            shards[int(match.group(1)), int(match.group(2))] = path
+    for num_shards in {n for _, n in shards}:
+        missing = [i for i in range(num_shards) if (i, num_shards) not in shards]
+        if missing:
+            print(
+                f"Warning: missing shards {missing} of {num_shards}.", file=sys.stderr
+            )
+    return [shards[key] for key in sorted(shards, key=lambda key: (key[1], key[0]))]
+
+
+def _merge(store_path: str, shards: Sequence[str]) -> None:
+    paths = [Path(shard) for shard in shards] or _shard_paths(Path(store_path))
+    if not paths:
+        sys.exit(f"No shards found next to {store_path}.")
+    with ResultStore(store_path) as store:
+        appended = store.merge(paths)
+        print(
+            f"Merged {len(paths)} shards into {store.path}: {appended} results "
+            f"appended, {len(store)} tasks."
+        )
+        print(json.dumps(store.summary(), indent=4))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m owl.utils.results_cli",
+        description="Manage the result store of a benchmark.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact_parser = commands.add_parser(
+        "compact", help="keep only the latest result of each task"
+    )
+    compact_parser.add_argument("store", help="the JSONL file of the results")
+    export_parser = commands.add_parser(
+        "export", help="write the results with their histories as a JSON list"
+    )
+    export_parser.add_argument("store", help="the JSONL file of the results")
+    export_parser.add_argument("output", help="the JSON file to write")
+    summary_parser = commands.add_parser("summary", help="print the accuracy")
+    summary_parser.add_argument("store", help="the JSONL file of the results")
+    report_parser = commands.add_parser(
+        "report", help="write the cost and latency report of a run"
+    )
+    report_parser.add_argument(
+        "store", help="the JSONL file of the results, or a JSON list"
+    )
+    report_parser.add_argument(
+        "--compare", help="the results of a baseline run to compare to"
+    )
+    report_parser.add_argument(
+        "--output-dir", default="report", help="the directory of the report"
+    )
+    report_parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=["md", "html", "csv"],
+        default=["md", "html", "csv"],
+    )
+    merge_parser = commands.add_parser(
+        "merge", help="merge the results of shards, and print the accuracy"
+    )
+    merge_parser.add_argument(
+        "store", help="the JSONL file of the merged results, created if needed"
+    )
+    merge_parser.add_argument(
+        "shards",
+        nargs="*",
+        help="the JSONL files of the shards (default: the shards of the store)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        for path in args.shards:
+            if not Path(path).exists():
+                parser.error(f"{path} does not exist.")
+        _merge(args.store, args.shards)
+        return
+    for path in (args.store, getattr(args, "compare", None)):
+        if path is not None and not Path(path).exists():
+            parser.error(f"{path} does not exist.")
+    if args.command == "report":
+        # Runs stored under the same file name are named by their directory
+        same_name = args.compare and Path(args.compare).stem == Path(args.store).stem
+        report = BenchmarkReport.from_file(
+            args.store, name=Path(args.store).parent.name if same_name else None
+        )
+        baseline = (
+            BenchmarkReport.from_file(
+                args.compare, name=Path(args.compare).parent.name if same_name else None
+            )
+            if args.compare
+            else None
+        )
+        for path in report.write(args.output_dir, baseline, args.formats):
+            print(f"Wrote {path}.")
+        return
+    with ResultStore(args.store) as store:
+        if args.command == "compact":
+            store.compact()
+            print(f"Compacted {store.path} to {len(store)} results.")
+        elif args.command == "export":
+            store.export(args.output)
+            print(f"Exported {len(store)} results to {args.output}.")
+        else:
+            print(json.dumps(store.summary(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
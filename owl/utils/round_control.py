@@ -0,0 +1,223 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import hashlib
+import json
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from .context_compaction import AUXILIARY_INFORMATION_PATTERN
+
+REPLAN_PROMPT = """
+Note: our conversation is going in circles ({reason}). Do not repeat your previous instructions. Reconsider the task and give me an instruction taking a different approach, for example another tool, other arguments or another source of information.
+"""
+
+FINAL_ANSWER_PROMPT = """
+Note: our conversation is no longer making progress ({reason}). Do not call any more tools, and give the final answer based on the information collected so far.
+"""
+
+
+def _hash(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def normalize_instruction(content: str) -> str:
+    r"""Normalize an instruction so that rephrasings differing only by case,
+    whitespace, punctuation or the appended auxiliary information compare
+    equal."""
+    content = AUXILIARY_INFORMATION_PATTERN.sub(" ", content)
+    content = re.sub(r"[^\w\s]", " ", content.lower())
+    return " ".join(content.split())
+
+
+@dataclass(frozen=True)
+class RoundFingerprint:
+    r"""The fingerprint of a round of the society.
+
+    Args:
+        instruction (str): The hash of the normalized instruction.
+        tool_calls (Tuple[str, ...]): The tool name and argument hash of each
+            tool call.
+        results (Tuple[str, ...]): The hash of each tool result.
+    """
+
+    instruction: str
+    tool_calls: Tuple[str, ...]
+    results: Tuple[str, ...]
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "RoundFingerprint":
+        r"""Fingerprint an entry of the chat history."""
+        tool_calls = record.get("tool_calls") or []
+        return cls(
+            instruction=_hash(normalize_instruction(record.get("user", ""))),
+            tool_calls=tuple(
+                f"{tool_call.get('tool_name')}:{_hash(tool_call.get('args'))}"
+                for tool_call in tool_calls
+            ),
+            results=tuple(_hash(tool_call.get("result")) for tool_call in tool_calls),
+        )
+
+
+class RoundAction(Enum):
+    CONTINUE = "continue"
+    REPLAN = "replan"
+    FINAL_ANSWER = "final_answer"
+
+
+@dataclass
+class RoundDecision:
+    r"""What the society should do after a round.
+
+    Args:
+        action (RoundAction): The action to take.
+        reason (str, optional): Why the action is taken. (default: :obj:`""`)
+    """
+
+    action: RoundAction
+    reason: str = ""
+
+    @property
+    def prompt(self) -> str:
+        r"""The nudge appended to the next message of the user agent on
+        re-plan, or sent to the assistant with the request for the final
+        answer."""
+        if self.action == RoundAction.REPLAN:
+            return REPLAN_PROMPT.format(reason=self.reason)
+        if self.action == RoundAction.FINAL_ANSWER:
+            return FINAL_ANSWER_PROMPT.format(reason=self.reason)
+        return ""
+
+
+class BaseRoundController(ABC):
+    r"""Base class of the controllers deciding, after each round, whether a
+    society should go on as usual, re-plan or give its final answer."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        r"""Forget the rounds observed so far."""
+        pass
+
+    @abstractmethod
+    def observe(self, record: Dict[str, Any]) -> RoundDecision:
+        r"""Observe a completed round.
+
+        Args:
+            record (Dict[str, Any]): The entry of the round in the chat
+                history, with the `user`, `assistant` and `tool_calls` keys.
+
+        Returns:
+            RoundDecision: What the society should do next.
+        """
+        pass
+
+
+class RepetitionRoundController(BaseRoundController):
+    r"""Detect societies repeating themselves or no longer making progress.
+
+    Each round is fingerprinted by its normalized instruction, the name and
+    arguments of its tool calls and their results. A round repeats itself
+    when its instruction or one of its tool calls has been seen
+    :obj:`repeat_threshold` times since the last intervention, and makes no
+    progress when it brings no new instruction, tool call or result. On
+    repetition, or after :obj:`stall_threshold` rounds in a row without
+    progress, the user agent is first asked to re-plan, up to
+    :obj:`max_replans` times, and then the assistant is asked for its final
+    answer.
+
+    Args:
+        repeat_threshold (int, optional): The number of occurrences of the
+            same instruction or tool call counting as repetition.
+            (default: :obj:`3`)
+        stall_threshold (int, optional): The number of rounds in a row
+            without progress counting as a stall. (default: :obj:`3`)
+        max_replans (int, optional): The number of re-plan nudges before the
+            final answer is forced. (default: :obj:`1`)
+    """
+
+    def __init__(
+        self,
+        repeat_threshold: int = 3,
+        stall_threshold: int = 3,
+        max_replans: int = 1,
+    ):
+        if repeat_threshold < 2:
+            raise ValueError(
+                f"`repeat_threshold` must be at least 2, got {repeat_threshold}."
+            )
+        self.repeat_threshold = repeat_threshold
+        self.stall_threshold = stall_threshold
+        self.max_replans = max_replans
+        self.reset()
+
+    def reset(self) -> None:
+        # Everything seen, to detect progress
+        self._seen_instructions: set = set()
+        self._seen_tool_calls: set = set()
+        self._results: set = set()
+        # The repeats since the last intervention
+        self._instructions: Counter = Counter()
+        self._tool_calls: Counter = Counter()
+        self._stall_streak = 0
+        self._replans = 0
+
+    def observe(self, record: Dict[str, Any]) -> RoundDecision:
+        fingerprint = RoundFingerprint.from_record(record)
+
+        progress = (
+            fingerprint.instruction not in self._seen_instructions
+            or any(call not in self._seen_tool_calls for call in fingerprint.tool_calls)
+            or any(result not in self._results for result in fingerprint.results)
+        )
+        self._seen_instructions.add(fingerprint.instruction)
+        self._seen_tool_calls.update(fingerprint.tool_calls)
+        self._results.update(fingerprint.results)
+        self._instructions[fingerprint.instruction] += 1
+        self._tool_calls.update(fingerprint.tool_calls)
+        self._stall_streak = 0 if progress else self._stall_streak + 1
+
+        reason = self._detect(fingerprint)
+        if reason is None:
+            return RoundDecision(RoundAction.CONTINUE)
+
+        # Give the nudge a chance to work before triggering again
+        self._instructions.clear()
+        self._tool_calls.clear()
+        self._stall_streak = 0
+        if self._replans < self.max_replans:
+            self._replans += 1
+            return RoundDecision(RoundAction.REPLAN, reason)
+        return RoundDecision(RoundAction.FINAL_ANSWER, reason)
+
+    def _detect(self, fingerprint: RoundFingerprint) -> Optional[str]:
+        if self._instructions[fingerprint.instruction] >= self.repeat_threshold:
+            return (
+                f"the same instruction was given "
+                f"{self._instructions[fingerprint.instruction]} times"
+            )
+        for call in fingerprint.tool_calls:
+            if self._tool_calls[call] >= self.repeat_threshold:
+                return (
+                    f"the tool `{call.split(':', 1)[0]}` was called "
+                    f"{self._tool_calls[call]} times with the same arguments"
+                )
+        if self._stall_streak >= self.stall_threshold:
+            return f"{self._stall_streak} rounds in a row brought no new information"
+        return None
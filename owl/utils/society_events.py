@@ -0,0 +1,170 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, ClassVar, Dict, List, Optional
+
+
+@dataclass
+class SocietyEvent:
+    r"""Base class of the events yielded while a society is running.
+
+    Args:
+        round_index (int): The index of the round the event belongs to.
+    """
+
+    event_type: ClassVar[str] = "event"
+
+    round_index: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        r"""Convert the event to a JSON serializable dictionary.
+
+        Returns:
+            Dict[str, Any]: The fields of the event and its type.
+        """
+        return {"type": self.event_type, **asdict(self)}
+
+
+@dataclass
+class UserInstructionEvent(SocietyEvent):
+    r"""The user agent gave an instruction.
+
+    Args:
+        content (str): The instruction, as sent to the assistant.
+    """
+
+    event_type: ClassVar[str] = "user_instruction"
+
+    content: str
+
+
+@dataclass
+class ToolCallEvent(SocietyEvent):
+    r"""The assistant agent called a tool.
+
+    Args:
+        tool_name (str): The name of the tool.
+        args (Dict[str, Any]): The arguments of the call.
+        result (Any): The result of the call.
+        tool_call_id (str): The ID of the call.
+        duration (float, optional): The duration of the call in seconds, if
+            measured by the agent. (default: :obj:`None`)
+    """
+
+    event_type: ClassVar[str] = "tool_call"
+
+    tool_name: str
+    args: Dict[str, Any]
+    result: Any
+    tool_call_id: str
+    duration: Optional[float] = None
+
+
+@dataclass
+class AssistantReplyEvent(SocietyEvent):
+    r"""The assistant agent replied to the instruction.
+
+    Args:
+        content (str): The reply of the assistant.
+    """
+
+    event_type: ClassVar[str] = "assistant_reply"
+
+    content: str
+
+
+@dataclass
+class TokenUsageEvent(SocietyEvent):
+    r"""The token usage of both agents in a round.
+
+    Args:
+        prompt_tokens (int): The prompt tokens of the round.
+        completion_tokens (int): The completion tokens of the round.
+        prompt_tokens_saved (int, optional): The prompt tokens saved by
+            context compaction in the round. (default: :obj:`0`)
+    """
+
+    event_type: ClassVar[str] = "token_usage"
+
+    prompt_tokens: int
+    completion_tokens: int
+    prompt_tokens_saved: int = 0
+
+
+@dataclass
+class RoundTelemetryEvent(SocietyEvent):
+    r"""The telemetry of a round: model calls with their latency and tokens,
+    tool calls with their duration and payload size.
+
+    Args:
+        telemetry (Dict[str, Any]): The telemetry of the round, as returned
+            by :meth:`RoundTelemetry.to_dict`.
+    """
+
+    event_type: ClassVar[str] = "round_telemetry"
+
+    telemetry: Dict[str, Any]
+
+
+@dataclass
+class RoundCompletedEvent(SocietyEvent):
+    r"""A round is completed.
+
+    Args:
+        record (Dict[str, Any]): The entry of the round in the chat history,
+            with the `user`, `assistant` and `tool_calls` keys.
+    """
+
+    event_type: ClassVar[str] = "round_completed"
+
+    record: Dict[str, Any]
+
+
+@dataclass
+class RoundControlEvent(SocietyEvent):
+    r"""The round controller intervened after a round.
+
+    Args:
+        action (str): The action taken, `replan` or `final_answer`.
+        reason (str): Why the controller intervened.
+    """
+
+    event_type: ClassVar[str] = "round_control"
+
+    action: str
+    reason: str
+
+
+@dataclass
+class SocietyTerminatedEvent(SocietyEvent):
+    r"""The society stopped. Always the last event of a run.
+
+    Args:
+        reason (str): Why the society stopped, one of `task_done`,
+            `terminated`, `final_answer` (requested by the round
+            controller), `round_limit`, `cancelled` and `deadline`, or
+            `error` for a society which failed in a :obj:`SocietyExecutor`.
+        answer (str): The last reply of the assistant.
+        chat_history (List[Dict[str, Any]]): The entries of all rounds, a
+            :obj:`ChatHistoryStore` if the run was given one.
+        token_info (Dict[str, int]): The token counts of the whole run.
+    """
+
+    event_type: ClassVar[str] = "terminated"
+
+    reason: str
+    answer: str
+    chat_history: List[Dict[str, Any]] = field(default_factory=list)
+    token_info: Dict[str, int] = field(default_factory=dict)
@@ -0,0 +1,386 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import sys
+import threading
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from camel.logger import get_logger
+
+from .common import resolve_import
+from .enhanced_role_playing import OwlRolePlaying, stream_society
+from .society_events import SocietyEvent, SocietyTerminatedEvent, ToolCallEvent
+
+logger = get_logger(__name__)
+
+# Python 3.10 has no `max_tasks_per_child` in `ProcessPoolExecutor`
+_HAS_MAX_TASKS_PER_CHILD = sys.version_info >= (3, 11)
+
+
+@dataclass
+class SocietySpec:
+    r"""A picklable description of a society run, from which a worker
+    process builds the society with its own model clients and toolkits.
+
+    Args:
+        factory (Union[str, Callable[..., OwlRolePlaying]]): The function
+            building the society, given as an import path such as
+            `"examples.run:construct_society"`, or as a function defined at
+            the top level of a module. Models and toolkits it caches in
+            module globals are shared by the runs of a worker.
+        args (Tuple[Any, ...], optional): The positional arguments of the
+            factory, e.g. the task. (default: :obj:`()`)
+        kwargs (Dict[str, Any], optional): The keyword arguments of the
+            factory. (default: :obj:`{}`)
+        round_limit (int, optional): The maximum number of rounds.
+            (default: :obj:`15`)
+        timeout (float, optional): The deadline of the run in seconds.
+            (default: :obj:`None`)
+        name (str, optional): A name identifying the run in the logs.
+            (default: :obj:`None`)
+    """
+
+    factory: Union[str, Callable[..., OwlRolePlaying]]
+    args: Tuple[Any, ...] = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    round_limit: int = 15
+    timeout: Optional[float] = None
+    name: Optional[str] = None
+
+    def build(self) -> OwlRolePlaying:
+        r"""Build the society, in the calling process."""
+        return resolve_import(self.factory)(*self.args, **self.kwargs)
+
+
+# The queue of the events sent back by the worker processes
+_worker_event_queue: Optional[Any] = None
+
+
+def _init_worker(
+    event_queue: Any,
+    initializer: Optional[Union[str, Callable]],
+    initargs: Tuple[Any, ...],
+) -> None:
+    global _worker_event_queue
+    _worker_event_queue = event_queue
+    if initializer is not None:
+        resolve_import(initializer)(*initargs)
+
+
+def _dump_event(event: SocietyEvent) -> bytes:
+    # The events are pickled here rather than by the feeder thread of the
+    # queue, which would only print the error of an unpicklable tool result
+    try:
+        return pickle.dumps(event)
+    except Exception:
+        if not isinstance(event, ToolCallEvent):
+            raise
+        return pickle.dumps(replace(event, result=repr(event.result)))
+
+
+def _run_spec(
+    submission_id: int, spec: SocietySpec, stream_events: bool
+) -> SocietyTerminatedEvent:
+    society = spec.build()
+    for event in stream_society(
+        society, round_limit=spec.round_limit, timeout=spec.timeout
+    ):
+        if isinstance(event, SocietyTerminatedEvent):
+            return event
+        if stream_events and _worker_event_queue is not None:
+            _worker_event_queue.put((submission_id, _dump_event(event)))
+    raise RuntimeError("The society stopped without a termination event.")
+
+
+class SocietyExecutor:
+    r"""Run societies on a pool of worker processes, to use all the cores of
+    a machine for batch workloads.
+
+    Societies run in threads share the GIL, so the CPU work of their tools
+    and of parsing the model replies is serialized. Each worker of the
+    executor builds the societies it runs from their :obj:`SocietySpec`,
+    with its own model clients and toolkits, and sends their events back
+    over a managed queue, read by a thread of the parent process. The puts
+    in a managed queue are synchronous, so all the events of a run are
+    received before its result.
+
+    Workers are replaced after :obj:`max_tasks_per_child` runs, so that the
+    memory leaked by browsers or tools is returned to the system. On Python
+    3.10, whose process pools cannot recycle their workers, the whole pool
+    is replaced instead once it ran that many tasks per worker. A pool
+    broken by a crashed worker is also replaced, the runs it held failing
+    with :obj:`BrokenProcessPool`.
+
+    Args:
+        max_workers (int, optional): The number of worker processes.
+            (default: the number of CPUs)
+        max_tasks_per_child (int, optional): The number of runs after which
+            a worker is replaced, :obj:`None` to keep the workers.
+            (default: :obj:`10`)
+        mp_context (str, optional): The start method of the workers. Forking
+            a process running browser or HTTP client threads is unsafe.
+            (default: :obj:`"spawn"`)
+        initializer (Union[str, Callable], optional): A function run by each
+            worker when it starts, e.g. to load the environment variables or
+            set up logging, as an import path or a top level function.
+            (default: :obj:`None`)
+        initargs (Tuple[Any, ...], optional): The arguments of the
+            initializer. (default: :obj:`()`)
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = 10,
+        mp_context: str = "spawn",
+        initializer: Optional[Union[str, Callable]] = None,
+        initargs: Tuple[Any, ...] = (),
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_tasks_per_child = max_tasks_per_child
+        self._context = multiprocessing.get_context(mp_context)
+        self._manager = self._context.Manager()
+        self._event_queue = self._manager.Queue()
+        self._initializer = initializer
+        self._initargs = initargs
+        self._ids = itertools.count()
+        self._listeners: Dict[int, Callable[[Optional[SocietyEvent]], None]] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_tasks = 0
+        self._retired_pools: List[ProcessPoolExecutor] = []
+        self._closed = False
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_events, name="society-executor-events", daemon=True
+        )
+        self._dispatcher.start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        kwargs: Dict[str, Any] = {}
+        if self.max_tasks_per_child is not None and _HAS_MAX_TASKS_PER_CHILD:
+            kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._event_queue, self._initializer, self._initargs),
+            **kwargs,
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if (
+            self._pool is not None
+            and not _HAS_MAX_TASKS_PER_CHILD
+            and self.max_tasks_per_child is not None
+            and self._pool_tasks >= self.max_workers * self.max_tasks_per_child
+        ):
+            self._retire_pool()
+        if self._pool is None:
+            self._pool = self._new_pool()
+            self._pool_tasks = 0
+        return self._pool
+
+    def _retire_pool(self) -> None:
+        # The old pool finishes its pending runs before exiting
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._retired_pools.append(self._pool)
+            self._pool = None
+
+    def _dispatch_events(self) -> None:
+        while True:
+            message = self._event_queue.get()
+            if message is None:
+                return
+            submission_id, payload = message
+            if payload is None:
+                listener = self._listeners.pop(submission_id, None)
+            else:
+                listener = self._listeners.get(submission_id)
+            if listener is None:
+                continue
+            try:
+                listener(None if payload is None else pickle.loads(payload))
+            except Exception as e:
+                logger.warning(f"Event listener of run {submission_id} failed: {e}")
+
+    def _submit(
+        self,
+        spec: SocietySpec,
+        listener: Optional[Callable[[Optional[SocietyEvent]], None]],
+    ) -> Future:
+        submission_id = next(self._ids)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit a run to a closed executor.")
+            if listener is not None:
+                self._listeners[submission_id] = listener
+            send_events = listener is not None
+            try:
+                future = self._get_pool().submit(
+                    _run_spec, submission_id, spec, send_events
+                )
+            except BrokenProcessPool:
+                logger.warning("A worker died, replacing the process pool.")
+                self._retire_pool()
+                future = self._get_pool().submit(
+                    _run_spec, submission_id, spec, send_events
+                )
+            self._pool_tasks += 1
+
+        if listener is not None:
+            # Ends the events of the run, whether it completed, failed or
+            # was cancelled
+            future.add_done_callback(
+                lambda _: self._event_queue.put((submission_id, None))
+            )
+        return future
+
+    def submit(
+        self,
+        spec: SocietySpec,
+        on_event: Optional[Callable[[SocietyEvent], None]] = None,
+    ) -> Future:
+        r"""Run a society on a worker.
+
+        Args:
+            spec (SocietySpec): The society to run.
+            on_event (Callable[[SocietyEvent], None], optional): A callback
+                receiving the events of each round but the last one, called
+                in a thread of the executor. Without it, the events are not
+                sent back by the worker. (default: :obj:`None`)
+
+        Returns:
+            Future: The future of the run, whose result is the
+                :obj:`SocietyTerminatedEvent` of the society.
+        """
+        if on_event is None:
+            return self._submit(spec, None)
+
+        def listener(event: Optional[SocietyEvent]) -> None:
+            if event is not None:
+                on_event(event)
+
+        return self._submit(spec, listener)
+
+    def stream(
+        self, specs: Iterable[SocietySpec]
+    ) -> Iterator[Tuple[SocietySpec, SocietyEvent]]:
+        r"""Run societies on the workers, and yield their events as soon as
+        they arrive.
+
+        The events of each society are yielded in order, ended by its
+        :obj:`SocietyTerminatedEvent`. A society which failed ends with a
+        :obj:`SocietyTerminatedEvent` with the `error` reason, whose answer
+        is the error.
+
+        Args:
+            specs (Iterable[SocietySpec]): The societies to run.
+
+        Yields:
+            Tuple[SocietySpec, SocietyEvent]: A society and one of its events.
+        """
+        specs = list(specs)
+        messages: "queue.Queue[Tuple[int, Any]]" = queue.Queue()
+
+        def listener(index: int) -> Callable[[Optional[SocietyEvent]], None]:
+            def put(event: Optional[SocietyEvent]) -> None:
+                messages.put((index, event))
+
+            return put
+
+        futures = [
+            self._submit(spec, listener(index)) for index, spec in enumerate(specs)
+        ]
+
+        pending = set(range(len(specs)))
+        while pending:
+            index, event = messages.get()
+            if event is not None:
+                yield specs[index], event
+                continue
+            pending.discard(index)
+            future = futures[index]
+            error = CancelledError() if future.cancelled() else future.exception()
+            if error is None:
+                yield specs[index], future.result()
+            else:
+                logger.error(f"Society {specs[index].name or index} failed: {error}")
+                yield (
+                    specs[index],
+                    SocietyTerminatedEvent(-1, reason="error", answer=str(error)),
+                )
+
+    def map(self, specs: Iterable[SocietySpec]) -> List[Tuple[str, List[dict], dict]]:
+        r"""Run societies on the workers and wait for all of them.
+
+        Args:
+            specs (Iterable[SocietySpec]): The societies to run.
+
+        Returns:
+            List[Tuple[str, List[dict], dict]]: The answer, chat history and
+                token counts of each society, in the order of the specs, like
+                :func:`run_society`.
+        """
+        futures = [self.submit(spec) for spec in specs]
+        results = []
+        for future in futures:
+            event = future.result()
+            results.append((event.answer, event.chat_history, event.token_info))
+        return results
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        r"""Stop the workers once their runs are done.
+
+        Args:
+            wait (bool, optional): Whether to wait for the runs.
+                (default: :obj:`True`)
+            cancel_futures (bool, optional): Whether to cancel the runs not
+                started yet. (default: :obj:`False`)
+        """
+        with self._lock:
+            self._closed = True
+            pool, self._pool = self._pool, None
+        for retired_pool in self._retired_pools:
+            retired_pool.shutdown(wait=wait)
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if wait:
+            self._event_queue.put(None)
+            self._dispatcher.join()
+            self._manager.shutdown()
+
+    def __enter__(self) -> "SocietyExecutor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
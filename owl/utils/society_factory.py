@@ -0,0 +1,171 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Type, Union
+
+from camel.logger import get_logger
+from camel.models import BaseModelBackend
+from camel.toolkits import FunctionTool
+
+from .enhanced_role_playing import OwlRolePlaying
+from .tool_cache import ToolCache
+
+logger = get_logger(__name__)
+
+
+class PrebuiltFunctionTool(FunctionTool):
+    r"""A :obj:`FunctionTool` whose schema is validated once.
+
+    :obj:`FunctionTool` validates its schema against the JSON schema
+    meta-schema each time its name or schema is read, that is for every
+    tool when an agent is built and at every model call. A prebuilt tool
+    validates it again only when :obj:`openai_tool_schema` is replaced, e.g.
+    by :meth:`set_openai_tool_schema`.
+
+    Use :meth:`from_tool` to build one from a tool or a function.
+    """
+
+    _validated_schema: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_tool(cls, tool: Union[FunctionTool, Callable]) -> "PrebuiltFunctionTool":
+        if isinstance(tool, cls):
+            return tool
+        if not isinstance(tool, FunctionTool):
+            tool = FunctionTool(tool)
+        prebuilt = cls.__new__(cls)
+        prebuilt.__dict__.update(tool.__dict__)
+        prebuilt.get_openai_tool_schema()
+        return prebuilt
+
+    def get_openai_tool_schema(self) -> Dict[str, Any]:
+        if self._validated_schema is not self.openai_tool_schema:
+            self.validate_openai_tool_schema(self.openai_tool_schema)
+            self._validated_schema = self.openai_tool_schema
+        return self.openai_tool_schema
+
+    def get_function_name(self) -> str:
+        return self.get_openai_tool_schema()["function"]["name"]
+
+
+class SocietyFactory:
+    r"""Build the expensive parts of a society once, and hand out fresh
+    societies for each task.
+
+    The models and toolkits are created by the caller, once, and shared by
+    all the societies of the factory, like the :obj:`ToolCache`,
+    :obj:`ModelRouter` or :obj:`ToolDispatcher` given in
+    :obj:`society_kwargs`. The tools are converted to
+    :obj:`PrebuiltFunctionTool` up front, so their schemas are generated and
+    validated once instead of at each agent construction and model call.
+
+    Each call to :meth:`create` builds new agents, with their own memory,
+    model manager and routing state: no conversation state is shared
+    between the societies. As the toolkits are, a cancelled society does not
+    release their browsers and code sandboxes, see
+    :func:`release_tool_resources`.
+
+    Args:
+        user_model (BaseModelBackend): The model of the user agent.
+        assistant_model (BaseModelBackend): The model of the assistant agent.
+        tools (List[Union[FunctionTool, Callable]], optional): The tools of
+            the assistant agent. (default: :obj:`None`)
+        society_class (Type[OwlRolePlaying], optional): The class of the
+            societies. (default: :obj:`OwlRolePlaying`)
+        tool_cache (ToolCache, optional): The cache wrapping the tools.
+            (default: :obj:`None`)
+        society_kwargs (Dict[str, Any], optional): Additional arguments of
+            the societies, e.g. `model_router`. (default: :obj:`None`)
+        user_agent_kwargs (Dict[str, Any], optional): Additional arguments of
+            the user agents. (default: :obj:`None`)
+        assistant_agent_kwargs (Dict[str, Any], optional): Additional
+            arguments of the assistant agents. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        user_model: BaseModelBackend,
+        assistant_model: BaseModelBackend,
+        tools: Optional[List[Union[FunctionTool, Callable]]] = None,
+        society_class: Type[OwlRolePlaying] = OwlRolePlaying,
+        tool_cache: Optional[ToolCache] = None,
+        society_kwargs: Optional[Dict[str, Any]] = None,
+        user_agent_kwargs: Optional[Dict[str, Any]] = None,
+        assistant_agent_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        self.user_model = user_model
+        self.assistant_model = assistant_model
+        self.society_class = society_class
+        self.society_kwargs = {
+            "with_task_specify": False,
+            "user_role_name": "user",
+            "assistant_role_name": "assistant",
+            # The toolkits are shared with the other societies
+            "release_tools_on_cancel": False,
+            **(society_kwargs or {}),
+        }
+        self.user_agent_kwargs = user_agent_kwargs or {}
+        self.assistant_agent_kwargs = assistant_agent_kwargs or {}
+
+        start_time = time.perf_counter()
+        tools = list(tools or [])
+        if tool_cache is not None:
+            tools = tool_cache.wrap_tools(tools)
+        self.tools: List[PrebuiltFunctionTool] = [
+            PrebuiltFunctionTool.from_tool(tool) for tool in tools
+        ]
+        # Token counters are created on first use, and some load their
+        # tokenizer then
+        for model in {id(m): m for m in (user_model, assistant_model)}.values():
+            model.token_counter
+        logger.debug(
+            f"Society factory ready with {len(self.tools)} tools in "
+            f"{time.perf_counter() - start_time:.3f}s"
+        )
+
+    @property
+    def tool_schemas(self) -> List[Dict[str, Any]]:
+        r"""The schemas of the tools, as sent to the assistant model."""
+        return [tool.get_openai_tool_schema() for tool in self.tools]
+
+    def create(self, task_prompt: str, **kwargs) -> OwlRolePlaying:
+        r"""Build a fresh society for a task.
+
+        Args:
+            task_prompt (str): The task of the society.
+            **kwargs: Arguments of the society overriding the ones of the
+                factory.
+
+        Returns:
+            OwlRolePlaying: The society.
+        """
+        society_kwargs = {**self.society_kwargs, **kwargs}
+        return self.society_class(
+            task_prompt=task_prompt,
+            user_agent_kwargs={
+                "model": self.user_model,
+                **self.user_agent_kwargs,
+                **society_kwargs.pop("user_agent_kwargs", {}),
+            },
+            assistant_agent_kwargs={
+                "model": self.assistant_model,
+                "tools": self.tools,
+                **self.assistant_agent_kwargs,
+                **society_kwargs.pop("assistant_agent_kwargs", {}),
+            },
+            **society_kwargs,
+        )
+
+    __call__ = create
@@ -0,0 +1,453 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from camel.responses import ChatAgentResponse
+
+
+@dataclass
+class LLMCallTelemetry:
+    r"""The telemetry of one model call of an agent.
+
+    Args:
+        agent (str): The role of the agent, `assistant` or `user`.
+        model (str): The model which served the call.
+        start_time (float): The start of the call, in seconds since epoch.
+        latency (float): The duration of the call in seconds.
+        time_to_first_token (float, optional): The time until the first
+            chunk of a streamed response, :obj:`None` for batch responses.
+        prompt_tokens (int): The prompt tokens of the call.
+        completion_tokens (int): The completion tokens of the call.
+        estimated_prompt_tokens (int, optional): The local estimate of the
+            prompt tokens, with a :obj:`ContextGuard`.
+        retries (int): The number of failed attempts before the call
+            succeeded.
+        error (str, optional): The error of the call if it failed.
+    """
+
+    agent: str
+    model: str
+    start_time: float
+    latency: float
+    time_to_first_token: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    estimated_prompt_tokens: Optional[int] = None
+    retries: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class ToolCallTelemetry:
+    r"""The telemetry of one tool call of the assistant.
+
+    Args:
+        tool_name (str): The name of the tool.
+        tool_call_id (str): The ID of the call.
+        start_time (float, optional): The start of the call, in seconds since
+            epoch, if measured.
+        duration (float, optional): The duration of the call in seconds, if
+            measured.
+        args_size (int): The size of the JSON encoded arguments in bytes.
+        result_size (int): The size of the text form of the result in bytes.
+        error (bool): Whether the call returned an error.
+    """
+
+    tool_name: str
+    tool_call_id: str
+    start_time: Optional[float]
+    duration: Optional[float]
+    args_size: int
+    result_size: int
+    error: bool = False
+
+
+@dataclass
+class RoundTelemetry:
+    r"""The telemetry of one round of a society.
+
+    Args:
+        round_index (int): The index of the round.
+        start_time (float): The start of the round, in seconds since epoch.
+        duration (float): The duration of the round in seconds.
+        llm_calls (List[LLMCallTelemetry]): The model calls of both agents.
+        tool_calls (List[ToolCallTelemetry]): The tool calls of the assistant.
+    """
+
+    round_index: int
+    start_time: float
+    duration: float
+    llm_calls: List[LLMCallTelemetry] = field(default_factory=list)
+    tool_calls: List[ToolCallTelemetry] = field(default_factory=list)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(call.prompt_tokens for call in self.llm_calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(call.completion_tokens for call in self.llm_calls)
+
+    @property
+    def llm_latency(self) -> float:
+        return sum(call.latency for call in self.llm_calls)
+
+    @property
+    def tool_duration(self) -> float:
+        return sum(call.duration or 0.0 for call in self.tool_calls)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **asdict(self),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_latency": self.llm_latency,
+            "tool_duration": self.tool_duration,
+        }
+
+    @classmethod
+    def from_responses(
+        cls,
+        round_index: int,
+        start_time: float,
+        end_time: float,
+        assistant_response: ChatAgentResponse,
+        user_response: ChatAgentResponse,
+    ) -> "RoundTelemetry":
+        r"""Collect the telemetry reported in the info of the responses of a
+        round. Agents which do not report their model calls, such as plain
+        :obj:`ChatAgent`, are accounted for by one call without timing."""
+        llm_calls: List[LLMCallTelemetry] = []
+        for agent, response in (
+            ("user", user_response),
+            ("assistant", assistant_response),
+        ):
+            if "llm_calls" in response.info:
+                llm_calls.extend(
+                    LLMCallTelemetry(agent=agent, **call)
+                    for call in response.info["llm_calls"]
+                )
+            elif response.info.get("usage"):
+                usage = response.info["usage"]
+                llm_calls.append(
+                    LLMCallTelemetry(
+                        agent=agent,
+                        model="unknown",
+                        start_time=start_time,
+                        latency=0.0,
+                        prompt_tokens=usage.get("prompt_tokens", 0),
+                        completion_tokens=usage.get("completion_tokens", 0),
+                    )
+                )
+
+        tool_start_times = assistant_response.info.get("tool_call_start_times", {})
+        tool_durations = assistant_response.info.get("tool_call_durations", {})
+        tool_calls = []
+        for tool_call in assistant_response.info.get("tool_calls") or []:
+            result = tool_call.result
+            tool_calls.append(
+                ToolCallTelemetry(
+                    tool_name=tool_call.tool_name,
+                    tool_call_id=tool_call.tool_call_id,
+                    start_time=tool_start_times.get(tool_call.tool_call_id),
+                    duration=tool_durations.get(tool_call.tool_call_id),
+                    args_size=_size(tool_call.args),
+                    result_size=_size(result),
+                    error=isinstance(result, dict) and "error" in result,
+                )
+            )
+
+        return cls(
+            round_index=round_index,
+            start_time=start_time,
+            duration=end_time - start_time,
+            llm_calls=llm_calls,
+            tool_calls=tool_calls,
+        )
+
+
+def _size(value: Any) -> int:
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    return len(value.encode("utf-8"))
+
+
+@dataclass
+class Span:
+    r"""A span in the OpenTelemetry data model.
+
+    Args:
+        name (str): The name of the span.
+        trace_id (str): The 32 hex digits ID of the trace.
+        span_id (str): The 16 hex digits ID of the span.
+        parent_span_id (str, optional): The ID of the parent span.
+        start_time (float): The start of the span, in seconds since epoch.
+        end_time (float): The end of the span, in seconds since epoch.
+        attributes (Dict[str, Any]): The attributes of the span.
+        error (str, optional): The error message if the span failed.
+    """
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str]
+    start_time: float
+    end_time: float
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_otlp(self) -> Dict[str, Any]:
+        r"""Convert the span to the OTLP/JSON encoding."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int(self.end_time * 1e9)),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            # STATUS_CODE_OK or STATUS_CODE_ERROR
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class SocietyTelemetry:
+    r"""Collect the telemetry of the rounds of a society run and export it.
+
+    Every round is appended to :obj:`jsonl_path` as soon as it completes.
+    When the society stops, the whole run is written to :obj:`otlp_path` as
+    OpenTelemetry spans in the OTLP/JSON encoding: one `society` span, one
+    `round` span per round, and one span per model call and per tool call.
+
+    Args:
+        jsonl_path (Union[str, Path], optional): The JSONL file receiving one
+            line per round. (default: :obj:`None`)
+        otlp_path (Union[str, Path], optional): The file receiving the spans
+            of the run. (default: :obj:`None`)
+        service_name (str, optional): The `service.name` resource attribute
+            of the spans. (default: :obj:`"owl"`)
+    """
+
+    def __init__(
+        self,
+        jsonl_path: Optional[Union[str, Path]] = None,
+        otlp_path: Optional[Union[str, Path]] = None,
+        service_name: str = "owl",
+    ):
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.otlp_path = Path(otlp_path) if otlp_path else None
+        self.service_name = service_name
+
+        self.trace_id = uuid.uuid4().hex
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self.termination_reason: Optional[str] = None
+        self.rounds: List[RoundTelemetry] = []
+        self._lock = threading.Lock()
+
+    def record_round(self, round_telemetry: RoundTelemetry) -> None:
+        r"""Record a completed round."""
+        with self._lock:
+            self.rounds.append(round_telemetry)
+            if self.jsonl_path is not None:
+                self._append_jsonl(
+                    {
+                        "trace_id": self.trace_id,
+                        "type": "round",
+                        **round_telemetry.to_dict(),
+                    }
+                )
+
+    def finish(self, termination_reason: str) -> None:
+        r"""Record the end of the run and export its spans."""
+        with self._lock:
+            self.end_time = time.time()
+            self.termination_reason = termination_reason
+            if self.jsonl_path is not None:
+                self._append_jsonl(
+                    {
+                        "trace_id": self.trace_id,
+                        "type": "society",
+                        "start_time": self.start_time,
+                        "duration": self.end_time - self.start_time,
+                        "termination_reason": termination_reason,
+                        "rounds": len(self.rounds),
+                    }
+                )
+        if self.otlp_path is not None:
+            self.export_otlp(self.otlp_path)
+
+    def _append_jsonl(self, record: Dict[str, Any]) -> None:
+        self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.jsonl_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def to_spans(self) -> List[Span]:
+        r"""Convert the run to OpenTelemetry spans.
+
+        Returns:
+            List[Span]: The spans of the run, the `society` span first.
+        """
+        end_time = self.end_time or time.time()
+        root = Span(
+            name="society",
+            trace_id=self.trace_id,
+            span_id=_span_id(),
+            parent_span_id=None,
+            start_time=self.start_time,
+            end_time=end_time,
+            attributes={
+                "owl.rounds": len(self.rounds),
+                "owl.termination_reason": self.termination_reason,
+            },
+        )
+        spans = [root]
+        for round_telemetry in self.rounds:
+            round_span = Span(
+                name="round",
+                trace_id=self.trace_id,
+                span_id=_span_id(),
+                parent_span_id=root.span_id,
+                start_time=round_telemetry.start_time,
+                end_time=round_telemetry.start_time + round_telemetry.duration,
+                attributes={
+                    "owl.round_index": round_telemetry.round_index,
+                    "gen_ai.usage.input_tokens": round_telemetry.prompt_tokens,
+                    "gen_ai.usage.output_tokens": round_telemetry.completion_tokens,
+                },
+            )
+            spans.append(round_span)
+            for call in round_telemetry.llm_calls:
+                spans.append(
+                    Span(
+                        name=f"llm {call.agent}",
+                        trace_id=self.trace_id,
+                        span_id=_span_id(),
+                        parent_span_id=round_span.span_id,
+                        start_time=call.start_time,
+                        end_time=call.start_time + call.latency,
+                        attributes={
+                            "owl.agent": call.agent,
+                            "gen_ai.request.model": call.model,
+                            "gen_ai.usage.input_tokens": call.prompt_tokens,
+                            "gen_ai.usage.output_tokens": call.completion_tokens,
+                            "owl.time_to_first_token": call.time_to_first_token,
+                            "owl.retries": call.retries,
+                        },
+                        error=call.error,
+                    )
+                )
+            for call in round_telemetry.tool_calls:
+                start_time = call.start_time or round_telemetry.start_time
+                spans.append(
+                    Span(
+                        name=f"tool {call.tool_name}",
+                        trace_id=self.trace_id,
+                        span_id=_span_id(),
+                        parent_span_id=round_span.span_id,
+                        start_time=start_time,
+                        end_time=start_time + (call.duration or 0.0),
+                        attributes={
+                            "owl.tool_name": call.tool_name,
+                            "owl.tool_call_id": call.tool_call_id,
+                            "owl.args_size": call.args_size,
+                            "owl.result_size": call.result_size,
+                        },
+                        error="tool returned an error" if call.error else None,
+                    )
+                )
+        return spans
+
+    def to_otlp(self) -> Dict[str, Any]:
+        r"""Convert the run to an OTLP/JSON `ExportTraceServiceRequest`."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "owl.utils.telemetry"},
+                            "spans": [span.to_otlp() for span in self.to_spans()],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export_otlp(self, path: Union[str, Path]) -> None:
+        r"""Append the run to an OTLP/JSON file, one request per line, as
+        read by the `otlpjsonfile` receiver of the OpenTelemetry collector.
+
+        Args:
+            path (Union[str, Path]): The path of the file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_otlp(), ensure_ascii=False) + "\n")
+
+    def export_jsonl(self, path: Union[str, Path]) -> None:
+        r"""Write every round of the run to a JSONL file.
+
+        Args:
+            path (Union[str, Path]): The path of the file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for round_telemetry in self.rounds:
+                record = {
+                    "trace_id": self.trace_id,
+                    "type": "round",
+                    **round_telemetry.to_dict(),
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
@@ -0,0 +1,644 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import json
+import math
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple, Union
+
+from camel.logger import get_logger
+from camel.messages import OpenAIMessage
+from camel.models import BaseModelBackend
+from camel.responses import ChatAgentResponse
+from camel.utils import BaseTokenCounter
+
+logger = get_logger(__name__)
+
+# The token limit reported by camel for the models it does not know
+UNKNOWN_TOKEN_LIMIT = 999_999_999
+
+SUMMARIZE_PROMPT = """Summarize the following tool result in at most {max_words} words. Keep every number, name, date, URL and fact which may be needed to answer questions about it, and drop the rest.
+
+{content}"""
+
+
+class HeuristicTokenCounter(BaseTokenCounter):
+    r"""Estimate the tokens of messages from their number of characters,
+    without any tokenizer.
+
+    The counter only counts: :meth:`encode` returns placeholder IDs, one per
+    estimated token, and :meth:`decode` is not supported. It must not serve
+    a model whose token IDs are decoded, e.g. to truncate a text, which OWL
+    and the chat agents of camel never do.
+
+    Args:
+        chars_per_token (float, optional): The mean number of characters of
+            a token. (default: :obj:`4.0`)
+        tokens_per_message (int, optional): The tokens added by the chat
+            format around each message. (default: :obj:`4`)
+        tokens_per_image (int, optional): The tokens counted for an image.
+            (default: :obj:`765`)
+    """
+
+    def __init__(
+        self,
+        chars_per_token: float = 4.0,
+        tokens_per_message: int = 4,
+        tokens_per_image: int = 765,
+    ):
+        self.chars_per_token = chars_per_token
+        self.tokens_per_message = tokens_per_message
+        self.tokens_per_image = tokens_per_image
+
+    def count_text(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_tokens_from_messages(self, messages: List[OpenAIMessage]) -> int:
+        num_tokens = 0
+        for message in messages:
+            num_tokens += self.tokens_per_message
+            for key, value in message.items():
+                if isinstance(value, list) and key == "content":
+                    for item in value:
+                        if item.get("type") == "text":
+                            num_tokens += self.count_text(str(item["text"]))
+                        else:
+                            num_tokens += self.tokens_per_image
+                elif isinstance(value, str):
+                    num_tokens += self.count_text(value)
+                elif value is not None:
+                    num_tokens += self.count_text(json.dumps(value, default=str))
+        return num_tokens
+
+    def encode(self, text: str) -> List[int]:
+        r"""Placeholder IDs, as many as the estimated tokens of the text."""
+        return [0] * self.count_text(text)
+
+    def decode(self, token_ids: List[int]) -> str:
+        r"""Not supported, the placeholder IDs of :meth:`encode` do not keep
+        the text.
+
+        Raises:
+            NotImplementedError: Always.
+        """
+        raise NotImplementedError(
+            "HeuristicTokenCounter only counts tokens, it cannot decode them. "
+            "Use a TiktokenTokenCounter with a loadable encoding to decode."
+        )
+
+
+class TiktokenTokenCounter(HeuristicTokenCounter):
+    r"""Count the tokens of messages with a tiktoken encoding, scaled for
+    the models whose tokenizer is not available locally.
+
+    The encoding is loaded on first use. If it cannot be loaded, e.g.
+    offline without a tiktoken cache, the counter falls back to the
+    character heuristic of :obj:`HeuristicTokenCounter`, which cannot
+    decode.
+
+    Args:
+        encoding_name (str, optional): The tiktoken encoding.
+            (default: :obj:`"o200k_base"`)
+        scale (float, optional): The factor applied to the counts, above
+            `1.0` for a conservative estimate of another tokenizer.
+            (default: :obj:`1.0`)
+        **kwargs: The arguments of :obj:`HeuristicTokenCounter`.
+    """
+
+    def __init__(self, encoding_name: str = "o200k_base", scale: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.encoding_name = encoding_name
+        self.scale = scale
+        self._encoding: Any = None
+        self._loaded = False
+
+    @property
+    def encoding(self) -> Any:
+        if not self._loaded:
+            self._loaded = True
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(
+                    f"Tiktoken encoding {self.encoding_name} unavailable, "
+                    f"estimating tokens from characters: {e}"
+                )
+        return self._encoding
+
+    def count_text(self, text: str) -> int:
+        if self.encoding is None:
+            count = super().count_text(text)
+        else:
+            count = len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(count * self.scale)
+
+    def encode(self, text: str) -> List[int]:
+        if self.encoding is None:
+            return super().encode(text)
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, token_ids: List[int]) -> str:
+        if self.encoding is None:
+            return super().decode(token_ids)
+        return self.encoding.decode(token_ids)
+
+
+class TokenizerRegistry:
+    r"""Select a local token counter by model family.
+
+    The families are matched in order against the lower-cased model type,
+    and the counters are cached per model type. Unlike the counters of some
+    backends, which call the provider API, the default counters only run
+    locally, tiktoken being scaled up for the families whose tokenizer is
+    not public.
+
+    Args:
+        default_factory (Callable[[str], BaseTokenCounter], optional): The
+            counter of the models matching no family.
+            (default: a tiktoken counter scaled by `1.2`)
+    """
+
+    def __init__(
+        self,
+        default_factory: Optional[Callable[[str], BaseTokenCounter]] = None,
+    ):
+        self.default_factory = default_factory or (
+            lambda model_type: TiktokenTokenCounter("o200k_base", scale=1.2)
+        )
+        self._families: List[Tuple[Pattern, Callable[[str], BaseTokenCounter]]] = []
+        self._counters: Dict[str, BaseTokenCounter] = {}
+        self._lock = threading.Lock()
+
+        # Later registrations are matched first
+        self.register(r"gpt-", lambda _: TiktokenTokenCounter("cl100k_base"))
+        self.register(
+            r"gpt-4o|gpt-4\.1|gpt-5|^o\d|chatgpt", lambda _: TiktokenTokenCounter()
+        )
+        self.register(r"claude", lambda _: TiktokenTokenCounter(scale=1.2))
+        self.register(
+            r"qwen|deepseek|gemini|mistral|llama",
+            lambda _: TiktokenTokenCounter(scale=1.1),
+        )
+
+    def register(
+        self, pattern: str, factory: Callable[[str], BaseTokenCounter]
+    ) -> None:
+        r"""Register the counter of a model family, matched before the
+        families registered earlier.
+
+        Args:
+            pattern (str): The regular expression searched in the lower-cased
+                model type.
+            factory (Callable[[str], BaseTokenCounter]): The factory of the
+                counter, called with the model type.
+        """
+        with self._lock:
+            self._families.insert(0, (re.compile(pattern), factory))
+            self._counters.clear()
+
+    def get(self, model_type: Union[str, Any]) -> BaseTokenCounter:
+        r"""The token counter of a model type."""
+        key = str(getattr(model_type, "value", model_type)).lower()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                factory = next(
+                    (f for pattern, f in self._families if pattern.search(key)),
+                    self.default_factory,
+                )
+                counter = self._counters[key] = factory(key)
+        return counter
+
+
+class ReductionStrategy(str, Enum):
+    r"""How a prompt above the context window is reduced."""
+
+    TRUNCATE = "truncate"
+    SUMMARIZE = "summarize"
+    DROP_OLDEST_TOOL_RESULTS = "drop_oldest_tool_results"
+
+
+@dataclass
+class PreflightResult:
+    r"""The prompt of a model call after the pre-flight check.
+
+    Args:
+        messages (List[OpenAIMessage]): The prompt to send.
+        estimated_tokens (int): The estimated tokens of the original prompt.
+        tokens (int): The estimated tokens of the prompt to send.
+        budget (int): The prompt token budget of the model.
+    """
+
+    messages: List[OpenAIMessage]
+    estimated_tokens: int
+    tokens: int
+    budget: int
+
+    @property
+    def reduced(self) -> bool:
+        return self.tokens < self.estimated_tokens
+
+
+def model_summarizer(
+    model: BaseModelBackend, max_words: int = 200
+) -> Callable[[str], str]:
+    r"""A summarizer of tool results calling a model, for
+    :obj:`ReductionStrategy.SUMMARIZE`.
+
+    Args:
+        model (BaseModelBackend): The model writing the summaries, best a
+            fast one with a large context window.
+        max_words (int, optional): The maximum length of a summary.
+            (default: :obj:`200`)
+
+    Returns:
+        Callable[[str], str]: The summarizer.
+    """
+
+    def summarize(content: str) -> str:
+        prompt = SUMMARIZE_PROMPT.format(max_words=max_words, content=content)
+        response = model.run([{"role": "user", "content": prompt}], tools=[])
+        return response.choices[0].message.content or ""
+
+    return summarize
+
+
+class ContextGuard:
+    r"""Estimate the prompt of each model call locally, and reduce it before
+    sending when it would overflow the context window of the model.
+
+    The budget of a prompt is the context window of the model, less a
+    safety margin for the estimation error, less the tokens reserved for
+    the completion (the `max_tokens` of the model config, or
+    :obj:`reserve_tokens`). Above it, the configured strategy is applied:
+
+    - `truncate`: the largest messages are cut, tool results first.
+    - `summarize`: the largest tool results are replaced by a summary,
+      written by :obj:`summarizer`, see :func:`model_summarizer`.
+    - `drop_oldest_tool_results`: the oldest tool results are replaced by a
+      placeholder, the latest one being kept.
+
+    Messages are truncated as a last resort if the prompt is still above the
+    budget. The system message and the tool call structure are kept.
+
+    Args:
+        strategy (Union[ReductionStrategy, str], optional): The reduction
+            strategy. (default: :obj:`"drop_oldest_tool_results"`)
+        registry (TokenizerRegistry, optional): The local token counters.
+            (default: :obj:`TokenizerRegistry()`)
+        token_limit (int, optional): The context window, overriding the
+            limit of the model type. (default: :obj:`None`)
+        default_token_limit (int, optional): The context window of the model
+            types whose limit is unknown. (default: :obj:`128000`)
+        reserve_tokens (int, optional): The tokens reserved for the
+            completion when the model config sets no `max_tokens`.
+            (default: :obj:`4096`)
+        safety_margin (float, optional): The fraction of the context window
+            left for the estimation error. (default: :obj:`0.05`)
+        summarizer (Callable[[str], str], optional): The summarizer of the
+            `summarize` strategy, without it the tool results are truncated.
+            (default: :obj:`None`)
+        min_message_chars (int, optional): The length under which a message
+            is not reduced. (default: :obj:`500`)
+    """
+
+    def __init__(
+        self,
+        strategy: Union[
+            ReductionStrategy, str
+        ] = ReductionStrategy.DROP_OLDEST_TOOL_RESULTS,
+        registry: Optional[TokenizerRegistry] = None,
+        token_limit: Optional[int] = None,
+        default_token_limit: int = 128000,
+        reserve_tokens: int = 4096,
+        safety_margin: float = 0.05,
+        summarizer: Optional[Callable[[str], str]] = None,
+        min_message_chars: int = 500,
+    ):
+        self.strategy = ReductionStrategy(strategy)
+        self.registry = registry or TokenizerRegistry()
+        self.token_limit = token_limit
+        self.default_token_limit = default_token_limit
+        self._windows: Dict[str, int] = {}
+        self.reserve_tokens = reserve_tokens
+        self.safety_margin = safety_margin
+        self.summarizer = summarizer
+        self.min_message_chars = min_message_chars
+
+    def context_window(self, model: BaseModelBackend) -> int:
+        r"""The context window of a model.
+
+        The `token_limit` of camel backends is the `max_tokens` of their
+        config when set, i.e. the completion limit, so the limit of the
+        model type is used instead.
+        """
+        if self.token_limit is not None:
+            return self.token_limit
+        key = str(model.model_type)
+        window = self._windows.get(key)
+        if window is None:
+            window = getattr(model.model_type, "token_limit", None)
+            if not isinstance(window, int) or window >= UNKNOWN_TOKEN_LIMIT:
+                window = self.default_token_limit
+            self._windows[key] = window
+        return window
+
+    def budget(self, model: BaseModelBackend) -> int:
+        r"""The prompt token budget of a model."""
+        token_limit = self.context_window(model)
+        reserve = (model.model_config_dict or {}).get("max_tokens")
+        if not isinstance(reserve, int):
+            reserve = self.reserve_tokens
+        return max(int(token_limit * (1 - self.safety_margin)) - reserve, 0)
+
+    def estimate(self, messages: List[OpenAIMessage], model: BaseModelBackend) -> int:
+        r"""The estimated prompt tokens of messages for a model."""
+        return self.registry.get(model.model_type).count_tokens_from_messages(messages)
+
+    def fit(
+        self, messages: List[OpenAIMessage], model: BaseModelBackend
+    ) -> PreflightResult:
+        r"""Reduce a prompt to the budget of a model, if needed.
+
+        Args:
+            messages (List[OpenAIMessage]): The prompt in OpenAI format.
+            model (BaseModelBackend): The model the prompt is sent to.
+
+        Returns:
+            PreflightResult: The prompt to send and its estimates.
+        """
+        counter = self.registry.get(model.model_type)
+        budget = self.budget(model)
+        estimated = counter.count_tokens_from_messages(messages)
+        if estimated <= budget:
+            return PreflightResult(messages, estimated, estimated, budget)
+
+        messages = list(messages)
+        tokens = estimated
+        if self.strategy == ReductionStrategy.DROP_OLDEST_TOOL_RESULTS:
+            tokens = self._drop_oldest_tool_results(messages, counter, budget, tokens)
+        elif self.strategy == ReductionStrategy.SUMMARIZE:
+            tokens = self._summarize(messages, counter, budget, tokens)
+        if tokens > budget:
+            tokens = self._truncate(messages, counter, budget, tokens)
+
+        logger.warning(
+            f"Prompt of about {estimated} tokens is above the budget of "
+            f"{budget} tokens of {model.model_type}, reduced to {tokens} "
+            f"tokens ({self.strategy.value})"
+        )
+        if tokens > budget:
+            logger.warning(
+                "The prompt is still above the budget, its messages are too "
+                "short to be reduced further."
+            )
+        return PreflightResult(messages, estimated, tokens, budget)
+
+    def _candidates(self, messages: List[OpenAIMessage], tool_only: bool) -> List[int]:
+        return [
+            index
+            for index, message in enumerate(messages)
+            if message.get("role") != "system"
+            and (not tool_only or message.get("role") == "tool")
+            and isinstance(message.get("content"), str)
+            and len(message["content"]) > self.min_message_chars
+        ]
+
+    def _replace(
+        self,
+        messages: List[OpenAIMessage],
+        index: int,
+        content: str,
+        counter: BaseTokenCounter,
+        tokens: int,
+    ) -> int:
+        before = counter.count_tokens_from_messages([messages[index]])
+        messages[index] = {**messages[index], "content": content}
+        return tokens - before + counter.count_tokens_from_messages([messages[index]])
+
+    def _drop_oldest_tool_results(
+        self,
+        messages: List[OpenAIMessage],
+        counter: BaseTokenCounter,
+        budget: int,
+        tokens: int,
+    ) -> int:
+        for index in self._candidates(messages, tool_only=True)[:-1]:
+            if tokens <= budget:
+                break
+            dropped = len(messages[index]["content"])
+            tokens = self._replace(
+                messages,
+                index,
+                f"[This earlier tool result of {dropped} characters was "
+                f"dropped to fit the context window]",
+                counter,
+                tokens,
+            )
+        return tokens
+
+    def _summarize(
+        self,
+        messages: List[OpenAIMessage],
+        counter: BaseTokenCounter,
+        budget: int,
+        tokens: int,
+    ) -> int:
+        if self.summarizer is None:
+            return tokens
+        candidates = self._candidates(messages, tool_only=True)
+        candidates.sort(key=lambda i: len(messages[i]["content"]), reverse=True)
+        for index in candidates:
+            if tokens <= budget:
+                break
+            try:
+                summary = self.summarizer(messages[index]["content"])
+            except Exception as e:
+                logger.warning(f"Failed to summarize a tool result: {e}")
+                continue
+            tokens = self._replace(
+                messages,
+                index,
+                f"[Summary of a tool result of {len(messages[index]['content'])} "
+                f"characters]\n{summary}",
+                counter,
+                tokens,
+            )
+        return tokens
+
+    def _truncate(
+        self,
+        messages: List[OpenAIMessage],
+        counter: BaseTokenCounter,
+        budget: int,
+        tokens: int,
+    ) -> int:
+        # Cut tool results first, then the other messages, largest first
+        for tool_only in (True, False):
+            candidates = self._candidates(messages, tool_only)
+            candidates.sort(key=lambda i: len(messages[i]["content"]), reverse=True)
+            for index in candidates:
+                if tokens <= budget:
+                    return tokens
+                content = messages[index]["content"]
+                message_tokens = counter.count_tokens_from_messages([messages[index]])
+                keep = (message_tokens - (tokens - budget)) / max(message_tokens, 1)
+                keep_chars = max(
+                    int(len(content) * keep * 0.95), self.min_message_chars
+                )
+                if keep_chars >= len(content):
+                    continue
+                tokens = self._replace(
+                    messages,
+                    index,
+                    f"{content[:keep_chars]}\n[... {len(content) - keep_chars} "
+                    f"more characters truncated to fit the context window]",
+                    counter,
+                    tokens,
+                )
+        return tokens
+
+
+class TokenLedger:
+    r"""A running account of the tokens of the model calls of a society.
+
+    Every model call reported in the `llm_calls` info of an
+    :obj:`OwlChatAgent` response is recorded, including the calls made
+    while executing tools within a step, of which the `usage` info of the
+    response only holds the last one. A call without usage, e.g. streamed,
+    is accounted with its local estimate.
+
+    Args:
+        parent (TokenLedger, optional): A ledger also receiving the records,
+            e.g. shared by several societies. (default: :obj:`None`)
+    """
+
+    def __init__(self, parent: Optional["TokenLedger"] = None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_prompt_tokens = 0
+        self.calls = 0
+        self.estimated_calls = 0
+        self.by_model: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+
+    def record_call(self, call: Dict[str, Any]) -> Tuple[int, int]:
+        r"""Record a model call, as reported in `llm_calls`.
+
+        Returns:
+            Tuple[int, int]: The prompt and completion tokens accounted.
+        """
+        prompt_tokens = call.get("prompt_tokens") or 0
+        completion_tokens = call.get("completion_tokens") or 0
+        estimated = call.get("estimated_prompt_tokens")
+        uses_estimate = (
+            not prompt_tokens and estimated is not None and not call.get("error")
+        )
+        if uses_estimate:
+            prompt_tokens = estimated
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.estimated_prompt_tokens += estimated or 0
+            self.estimated_calls += int(uses_estimate)
+            model_type = call.get("model")
+            model = self.by_model[str(getattr(model_type, "value", model_type))]
+            model["calls"] += 1
+            model["prompt_tokens"] += prompt_tokens
+            model["completion_tokens"] += completion_tokens
+        if self.parent is not None:
+            self.parent.record_call(call)
+        return prompt_tokens, completion_tokens
+
+    def record_response(self, response: ChatAgentResponse) -> Tuple[int, int]:
+        r"""Record the model calls of an agent response, or its `usage` if
+        the agent does not report its calls.
+
+        Returns:
+            Tuple[int, int]: The prompt and completion tokens accounted.
+        """
+        llm_calls = response.info.get("llm_calls")
+        if llm_calls is None:
+            usage = response.info.get("usage")
+            if not usage:
+                return 0, 0
+            llm_calls = [
+                {
+                    "model": None,
+                    "prompt_tokens": usage.get("prompt_tokens", 0),
+                    "completion_tokens": usage.get("completion_tokens", 0),
+                }
+            ]
+        prompt_tokens, completion_tokens = 0, 0
+        for call in llm_calls:
+            call_prompt, call_completion = self.record_call(call)
+            prompt_tokens += call_prompt
+            completion_tokens += call_completion
+        return prompt_tokens, completion_tokens
+
+    def restore(
+        self,
+        token_info: Dict[str, int],
+        state: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        r"""Start from the token counts of a checkpoint.
+
+        Args:
+            token_info (Dict[str, int]): The `token_info` of the checkpoint.
+            state (Dict[str, Any], optional): The :meth:`to_dict` of the
+                ledger in the checkpoint. Without it, e.g. for the
+                checkpoints of earlier versions, the estimates and the counts
+                per model only account the calls made since the resume.
+                (default: :obj:`None`)
+        """
+        with self._lock:
+            self.prompt_tokens = token_info.get("prompt_token_count", 0)
+            self.completion_tokens = token_info.get("completion_token_count", 0)
+            self.calls = token_info.get("llm_call_count", 0)
+            if state:
+                self.estimated_prompt_tokens = state.get("estimated_prompt_tokens", 0)
+                self.estimated_calls = state.get("estimated_calls", 0)
+                self.by_model.clear()
+                for model, counts in state.get("by_model", {}).items():
+                    self.by_model[model].update(counts)
+
+    @property
+    def token_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "completion_token_count": self.completion_tokens,
+                "prompt_token_count": self.prompt_tokens,
+                "llm_call_count": self.calls,
+            }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "estimated_prompt_tokens": self.estimated_prompt_tokens,
+                "calls": self.calls,
+                "estimated_calls": self.estimated_calls,
+                "by_model": {k: dict(v) for k, v in self.by_model.items()},
+            }
@@ -0,0 +1,478 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from camel.logger import get_logger
+from camel.toolkits import FunctionTool
+
+logger = get_logger(__name__)
+
+# Read-only tools of the toolkits used by the examples, whose results only
+# depend on their arguments
+DEFAULT_CACHEABLE_TOOLS = frozenset(
+    {
+        "search_wiki",
+        "search_duckduckgo",
+        "search_google",
+        "search_baidu",
+        "search_bing",
+        "search_brave",
+        "search_exa",
+        "search_linkup",
+        "search_bocha",
+        "extract_document_content",
+        "ask_question_about_image",
+        "ask_question_about_video",
+        "ask_question_about_audio",
+        "get_repository_info",
+        "retrieve_arxiv_papers",
+    }
+)
+
+
+def is_error_result(value: Any) -> bool:
+    r"""Whether a tool result reports an error, in one of the shapes used by
+    the camel toolkits: a dict with an `error` key, a list holding such a
+    dict (e.g. `search_google`), a `(False, ...)` tuple (e.g.
+    `extract_document_content`), or a text starting with `Error`."""
+    if isinstance(value, dict):
+        return "error" in value
+    if isinstance(value, (list, tuple)):
+        if value and value[0] is False:
+            return True
+        return any(isinstance(item, dict) and "error" in item for item in value)
+    if isinstance(value, str):
+        return value.lstrip().lower().startswith("error")
+    return False
+
+
+def _file_version(value: Any) -> Optional[Tuple[int, int]]:
+    # The size and modification time of the local file an argument names
+    if not isinstance(value, str) or not value or len(value) > 4096:
+        return None
+    try:
+        stat = os.stat(value)
+    except (OSError, ValueError):
+        return None
+    if not os.path.isfile(value):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+@dataclass
+class CacheEntry:
+    r"""A cached tool result.
+
+    Args:
+        value (Any): The result of the tool.
+        duration (float): The duration of the call which produced it.
+        expires_at (float, optional): The expiration time in seconds since
+            epoch, :obj:`None` if it never expires.
+        size (int): The size of the JSON encoded result in bytes.
+    """
+
+    value: Any
+    duration: float
+    expires_at: Optional[float]
+    size: int
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= time.time()
+
+
+class BaseToolCacheBackend(ABC):
+    r"""Base class of the storages of a :obj:`ToolCache`. Backends bound
+    the total size of the entries and evict the least recently used ones."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        r"""Get an entry, :obj:`None` if it is missing or expired."""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry) -> int:
+        r"""Store an entry.
+
+        Returns:
+            int: The number of entries evicted to make room for it.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        r"""Remove all entries."""
+        pass
+
+
+class MemoryToolCacheBackend(BaseToolCacheBackend):
+    r"""Keep the cache in memory, in least recently used order.
+
+    Args:
+        max_size (int, optional): The maximum total size of the entries in
+            bytes. (default: :obj:`64 * 1024 * 1024`)
+    """
+
+    def __init__(self, max_size: int = 64 * 1024 * 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expired:
+                self._size -= self._entries.pop(key).size
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> int:
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).size
+            self._entries[key] = entry
+            self._size += entry.size
+            evicted = 0
+            while self._size > self.max_size and len(self._entries) > 1:
+                _, oldest = self._entries.popitem(last=False)
+                self._size -= oldest.size
+                evicted += 1
+            return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SQLiteToolCacheBackend(BaseToolCacheBackend):
+    r"""Keep the cache in a SQLite database, shared by the processes and the
+    runs using the same file. Only JSON serializable results are stored.
+
+    Args:
+        path (Union[str, Path]): The path of the database file.
+        max_size (int, optional): The maximum total size of the entries in
+            bytes. (default: :obj:`512 * 1024 * 1024`)
+    """
+
+    def __init__(self, path: Union[str, Path], max_size: int = 512 * 1024 * 1024):
+        self.path = str(path)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "duration REAL NOT NULL, "
+                "expires_at REAL, "
+                "size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tool_cache_last_access "
+                "ON tool_cache (last_access)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, duration, expires_at, size FROM tool_cache "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            entry = CacheEntry(json.loads(row[0]), row[1], row[2], row[3])
+            if entry.expired:
+                conn.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                "UPDATE tool_cache SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> int:
+        try:
+            value = json.dumps(entry.value, ensure_ascii=False)
+        except TypeError:
+            return 0
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tool_cache "
+                "(key, value, duration, expires_at, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, entry.duration, entry.expires_at, entry.size, time.time()),
+            )
+            return self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        conn.execute(
+            "DELETE FROM tool_cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        )
+        (total,) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM tool_cache"
+        ).fetchone()
+        evicted = 0
+        if total <= self.max_size:
+            return evicted
+        for key, size in conn.execute(
+            "SELECT key, size FROM tool_cache ORDER BY last_access"
+        ).fetchall()[:-1]:
+            conn.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+            if total <= self.max_size:
+                break
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM tool_cache")
+
+
+@dataclass
+class ToolCacheStats:
+    r"""The cache metrics of a tool.
+
+    Args:
+        hits (int): The calls answered from the cache.
+        misses (int): The calls which ran the tool.
+        evictions (int): The entries evicted when storing its results.
+        time_saved (float): The duration of the original calls answered
+            from the cache, in seconds.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    time_saved: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
+class ToolCache:
+    r"""Cache the results of tools across rounds and tasks.
+
+    Wrapped tools are looked up by tool name and canonicalized arguments:
+    positional and keyword arguments are bound to the signature of the tool
+    and completed with their defaults, so equivalent calls share an entry.
+    Only the tools of :obj:`cacheable_tools`, which must be idempotent, are
+    cached. Exceptions and error results are never cached. An argument
+    naming a local file is keyed with the size and modification time of the
+    file, so that an edited file is read again.
+
+    Args:
+        backend (BaseToolCacheBackend, optional): The storage of the cache.
+            (default: :obj:`MemoryToolCacheBackend()`)
+        ttl (float, optional): The default time to live of an entry in
+            seconds, :obj:`None` for no expiration. (default: :obj:`86400`)
+        tool_ttls (Dict[str, float], optional): Per-tool time to live in
+            seconds keyed by tool name, overriding :obj:`ttl`.
+            (default: :obj:`None`)
+        cacheable_tools (Iterable[str], optional): The names of the tools to
+            cache. (default: :obj:`DEFAULT_CACHEABLE_TOOLS`)
+        error_checks (Dict[str, Callable[[Any], bool]], optional): Per-tool
+            functions telling whether a result is an error, keyed by tool
+            name, overriding :func:`is_error_result`. (default: :obj:`None`)
+    """
+
+    def __init__(
+        self,
+        backend: Optional[BaseToolCacheBackend] = None,
+        ttl: Optional[float] = 86400,
+        tool_ttls: Optional[Dict[str, float]] = None,
+        cacheable_tools: Optional[Iterable[str]] = None,
+        error_checks: Optional[Dict[str, Callable[[Any], bool]]] = None,
+    ):
+        self.backend = backend or MemoryToolCacheBackend()
+        self.ttl = ttl
+        self.tool_ttls = tool_ttls or {}
+        self.cacheable_tools = frozenset(
+            cacheable_tools if cacheable_tools is not None else DEFAULT_CACHEABLE_TOOLS
+        )
+        self.error_checks = error_checks or {}
+        self._stats: Dict[str, ToolCacheStats] = {}
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, tool: FunctionTool) -> bool:
+        return (
+            tool.get_function_name() in self.cacheable_tools
+            and not tool.synthesize_output
+        )
+
+    def wrap(self, tool: Union[FunctionTool, Callable]) -> FunctionTool:
+        r"""Wrap a tool with the cache. Tools which are not cacheable are
+        returned as is.
+
+        Args:
+            tool (Union[FunctionTool, Callable]): The tool.
+
+        Returns:
+            FunctionTool: A tool with the same schema, answering from the
+                cache when possible.
+        """
+        if not isinstance(tool, FunctionTool):
+            tool = FunctionTool(tool)
+        if not self.is_cacheable(tool):
+            return tool
+        name = tool.get_function_name()
+        func = tool.func
+        signature = inspect.signature(func)
+
+        if tool.is_async:
+
+            @functools.wraps(func)
+            async def cached_func(*args, **kwargs):
+                key = self.make_key(name, signature, args, kwargs)
+                hit, value = self._lookup(name, key)
+                if hit:
+                    return value
+                start = time.monotonic()
+                value = await func(*args, **kwargs)
+                self._store(name, key, value, time.monotonic() - start)
+                return value
+
+        else:
+
+            @functools.wraps(func)
+            def cached_func(*args, **kwargs):
+                key = self.make_key(name, signature, args, kwargs)
+                hit, value = self._lookup(name, key)
+                if hit:
+                    return value
+                start = time.monotonic()
+                value = func(*args, **kwargs)
+                self._store(name, key, value, time.monotonic() - start)
+                return value
+
+        return FunctionTool(cached_func, openai_tool_schema=tool.openai_tool_schema)
+
+    def wrap_tools(
+        self, tools: List[Union[FunctionTool, Callable]]
+    ) -> List[FunctionTool]:
+        r"""Wrap the cacheable tools of a list."""
+        return [self.wrap(tool) for tool in tools]
+
+    @staticmethod
+    def make_key(
+        name: str,
+        signature: inspect.Signature,
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+    ) -> str:
+        r"""The cache key of a call, from the tool name, the canonicalized
+        arguments, and the version of the local files they name."""
+        try:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments: Any = dict(bound.arguments)
+            values = list(arguments.values())
+        except TypeError:
+            arguments = {"args": args, "kwargs": kwargs}
+            values = [*args, *kwargs.values()]
+        files = [_file_version(value) for value in values]
+        canonical = json.dumps(
+            [arguments, files] if any(files) else arguments,
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(f"{name}:{canonical}".encode("utf-8")).hexdigest()
+
+    def _get_stats(self, name: str) -> ToolCacheStats:
+        return self._stats.setdefault(name, ToolCacheStats())
+
+    def _lookup(self, name: str, key: str) -> Tuple[bool, Any]:
+        entry = self.backend.get(key)
+        with self._lock:
+            stats = self._get_stats(name)
+            if entry is None:
+                stats.misses += 1
+                return False, None
+            stats.hits += 1
+            stats.time_saved += entry.duration
+        logger.debug(f"Tool cache hit for {name}")
+        return True, entry.value
+
+    def _store(self, name: str, key: str, value: Any, duration: float) -> None:
+        if self.error_checks.get(name, is_error_result)(value):
+            return
+        ttl = self.tool_ttls.get(name, self.ttl)
+        entry = CacheEntry(
+            value=value,
+            duration=duration,
+            expires_at=time.time() + ttl if ttl is not None else None,
+            size=len(
+                json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+            ),
+        )
+        evicted = self.backend.set(key, entry)
+        if evicted:
+            with self._lock:
+                self._get_stats(name).evictions += evicted
+
+    def stats(self) -> Dict[str, ToolCacheStats]:
+        r"""The metrics of each cached tool, keyed by tool name."""
+        with self._lock:
+            return {
+                name: ToolCacheStats(**vars(stats))
+                for name, stats in self._stats.items()
+            }
+
+    @property
+    def hit_rate(self) -> float:
+        r"""The hit rate over all cached tools."""
+        stats = self.stats().values()
+        hits = sum(s.hits for s in stats)
+        calls = hits + sum(s.misses for s in stats)
+        return hits / calls if calls else 0.0
+
+    def clear(self) -> None:
+        r"""Remove all entries and reset the metrics."""
+        self.backend.clear()
+        with self._lock:
+            self._stats.clear()
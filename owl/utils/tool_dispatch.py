@@ -0,0 +1,317 @@
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
+
+import asyncio
+import functools
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from camel.agents import ChatAgent
+from camel.agents._types import ToolCallRequest
+from camel.logger import get_logger
+from camel.toolkits import FunctionTool
+from camel.types.agents import ToolCallingRecord
+
+logger = get_logger(__name__)
+
+
+class ToolDispatcher:
+    r"""Execute the tool calls emitted by an agent in one model response
+    concurrently.
+
+    Async tools are awaited on the running event loop, sync tools are pushed
+    to a thread pool so that they do not block it. At most
+    :obj:`max_concurrency` tool calls run at the same time, and the records
+    are written back to the agent memory in the original call order, so the
+    conversation seen by the model is identical to a sequential run.
+
+    Args:
+        max_concurrency (int, optional): The maximum number of tool calls
+            running at the same time. (default: :obj:`4`)
+        timeout (float, optional): The default timeout in seconds of a single
+            tool call. :obj:`None` means no timeout. (default: :obj:`None`)
+        tool_timeouts (Dict[str, float], optional): Per-tool timeouts in
+            seconds keyed by tool name, overriding :obj:`timeout`.
+            (default: :obj:`None`)
+        max_workers (int, optional): The size of the thread pool used for
+            sync tools. (default: :obj:`max_concurrency`)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        timeout: Optional[float] = None,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        max_workers: Optional[int] = None,
+    ):
+        if max_concurrency < 1:
+            raise ValueError(
+                f"`max_concurrency` must be at least 1, got {max_concurrency}."
+            )
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.max_workers = max_workers or max_concurrency
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        r"""The thread pool used for sync tools, created on first use."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="owl-tool",
+                )
+            return self._executor
+
+    def get_timeout(self, tool_name: str) -> Optional[float]:
+        r"""Get the timeout of a tool.
+
+        Args:
+            tool_name (str): The name of the tool.
+
+        Returns:
+            Optional[float]: The timeout in seconds, or :obj:`None` if the
+                tool has no timeout.
+        """
+        return self.tool_timeouts.get(tool_name, self.timeout)
+
+    def dispatch(
+        self, agent: ChatAgent, tool_call_requests: List[ToolCallRequest]
+    ) -> List[ToolCallingRecord]:
+        r"""Execute the tool calls in the thread pool and record them in the
+        agent memory in the original order.
+
+        The timeout of each call counts from its own start. The calls waiting
+        for one of the :obj:`max_concurrency` slots are only submitted once
+        a slot is free, and a call which the pool did not start before its
+        timeout, all its workers being busy with calls which timed out, is
+        cancelled.
+
+        Args:
+            agent (ChatAgent): The agent owning the tools.
+            tool_call_requests (List[ToolCallRequest]): The tool calls emitted
+                by the model.
+
+        Returns:
+            List[ToolCallingRecord]: The records of the tool calls, in the
+                same order as :obj:`tool_call_requests`.
+        """
+        count = len(tool_call_requests)
+        results: List[Any] = [None] * count
+        start_times: List[float] = [0.0] * count
+        durations: List[float] = [0.0] * count
+        if count == 1 and self.get_timeout(tool_call_requests[0].tool_name) is None:
+            # Without timeout, a single call runs in the calling thread, which
+            # keeps the thread-bound tools such as the browser on one thread
+            results[0], start_times[0], durations[0] = self._call_tool(
+                agent, tool_call_requests[0]
+            )
+            return self._record(
+                agent, tool_call_requests, results, start_times, durations
+            )
+
+        # The monotonic time at which each call started running
+        started: List[Optional[float]] = [None] * count
+        # The index and submission time of each call waiting or running
+        pending: Dict[Future, Tuple[int, float]] = {}
+
+        def _run(index: int) -> Tuple[Any, float, float]:
+            started[index] = time.monotonic()
+            return self._call_tool(agent, tool_call_requests[index])
+
+        def _deadline(index: int, submitted: float) -> Optional[float]:
+            # A call is timed from its start, or from its submission while
+            # the pool is busy with calls which timed out
+            timeout = self.get_timeout(tool_call_requests[index].tool_name)
+            if timeout is None:
+                return None
+            return (started[index] or submitted) + timeout
+
+        # At most `max_concurrency` calls are submitted at once, the next
+        # call is submitted as soon as one ends or times out
+        queued = iter(range(count))
+        for index in itertools.islice(queued, self.max_concurrency):
+            pending[self.executor.submit(_run, index)] = (index, time.monotonic())
+        while pending:
+            deadlines = [
+                deadline
+                for deadline in (_deadline(*entry) for entry in pending.values())
+                if deadline is not None
+            ]
+            wait(
+                pending,
+                timeout=(
+                    max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                ),
+                return_when=FIRST_COMPLETED,
+            )
+            now = time.monotonic()
+            for future, (index, submitted) in list(pending.items()):
+                deadline = _deadline(index, submitted)
+                if future.done():
+                    results[index], start_times[index], durations[index] = (
+                        future.result()
+                    )
+                elif deadline is not None and now >= deadline:
+                    # Only a call which has not started yet can be cancelled,
+                    # a running sync tool keeps running in its worker thread
+                    future.cancel()
+                    begin = started[index] or submitted
+                    results[index] = self._timeout_result(
+                        tool_call_requests[index].tool_name,
+                        started=started[index] is not None,
+                    )
+                    start_times[index] = time.time() - (now - begin)
+                    durations[index] = now - begin
+                else:
+                    continue
+                del pending[future]
+                for next_index in itertools.islice(queued, 1):
+                    pending[self.executor.submit(_run, next_index)] = (
+                        next_index,
+                        time.monotonic(),
+                    )
+
+        return self._record(agent, tool_call_requests, results, start_times, durations)
+
+    async def adispatch(
+        self, agent: ChatAgent, tool_call_requests: List[ToolCallRequest]
+    ) -> List[ToolCallingRecord]:
+        r"""Asynchronously execute the tool calls and record them in the agent
+        memory in the original order.
+
+        Args:
+            agent (ChatAgent): The agent owning the tools.
+            tool_call_requests (List[ToolCallRequest]): The tool calls emitted
+                by the model.
+
+        Returns:
+            List[ToolCallingRecord]: The records of the tool calls, in the
+                same order as :obj:`tool_call_requests`.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _run(request: ToolCallRequest) -> Tuple[Any, float, float]:
+            async with semaphore:
+                start_time = time.time()
+                start = time.monotonic()
+                result = await self._acall_tool(agent, request)
+                return result, start_time, time.monotonic() - start
+
+        outcomes = await asyncio.gather(
+            *[_run(request) for request in tool_call_requests]
+        )
+        results = [result for result, _, _ in outcomes]
+        start_times = [start_time for _, start_time, _ in outcomes]
+        durations = [duration for _, _, duration in outcomes]
+        return self._record(agent, tool_call_requests, results, start_times, durations)
+
+    def _call_tool(
+        self, agent: ChatAgent, request: ToolCallRequest
+    ) -> Tuple[Any, float, float]:
+        tool: FunctionTool = agent.tool_dict[request.tool_name]
+        start_time = time.time()
+        start = time.monotonic()
+        try:
+            if tool.is_async:
+                result = asyncio.run(tool.async_call(**request.args))
+            else:
+                result = tool(**request.args)
+        except Exception as e:
+            # Keep the error in the result like `ChatAgent._execute_tool`
+            error_msg = f"Error executing tool '{request.tool_name}': {e!s}"
+            logger.warning(error_msg)
+            result = {"error": error_msg}
+        return result, start_time, time.monotonic() - start
+
+    async def _acall_tool(self, agent: ChatAgent, request: ToolCallRequest) -> Any:
+        tool: FunctionTool = agent.tool_dict[request.tool_name]
+        if tool.is_async:
+            coro = tool.async_call(**request.args)
+        else:
+            loop = asyncio.get_running_loop()
+            coro = loop.run_in_executor(
+                self.executor, functools.partial(tool, **request.args)
+            )
+        try:
+            return await asyncio.wait_for(
+                coro, timeout=self.get_timeout(request.tool_name)
+            )
+        except asyncio.TimeoutError:
+            return self._timeout_result(request.tool_name)
+        except Exception as e:
+            kind = "async tool" if tool.is_async else "tool"
+            error_msg = f"Error executing {kind} '{request.tool_name}': {e!s}"
+            logger.warning(error_msg)
+            return {"error": error_msg}
+
+    def _timeout_result(self, tool_name: str, started: bool = True) -> Dict[str, str]:
+        # A sync tool that timed out keeps running in its worker thread, we
+        # only stop waiting for it.
+        if started:
+            error_msg = (
+                f"Error executing tool '{tool_name}': timed out after "
+                f"{self.get_timeout(tool_name)} seconds"
+            )
+        else:
+            error_msg = (
+                f"Error executing tool '{tool_name}': not started within "
+                f"{self.get_timeout(tool_name)} seconds, all the tool workers "
+                f"being busy"
+            )
+        logger.warning(error_msg)
+        return {"error": error_msg}
+
+    def _record(
+        self,
+        agent: ChatAgent,
+        tool_call_requests: List[ToolCallRequest],
+        results: List[Any],
+        start_times: List[float],
+        durations: List[float],
+    ) -> List[ToolCallingRecord]:
+        # `OwlChatAgent` reports the timings in the info of its response
+        tool_call_start_times = getattr(agent, "_tool_call_start_times", None)
+        if tool_call_start_times is not None:
+            for request, start_time in zip(tool_call_requests, start_times):
+                tool_call_start_times[request.tool_call_id] = start_time
+        tool_call_durations = getattr(agent, "_tool_call_durations", None)
+        if tool_call_durations is not None:
+            for request, duration in zip(tool_call_requests, durations):
+                tool_call_durations[request.tool_call_id] = duration
+        return [
+            agent._record_tool_calling(
+                request.tool_name, request.args, result, request.tool_call_id
+            )
+            for request, result in zip(tool_call_requests, results)
+        ]
+
+    def shutdown(self, wait: bool = False) -> None:
+        r"""Shut down the thread pool of the dispatcher.
+
+        Args:
+            wait (bool, optional): Whether to wait for the running sync tools
+                to finish. (default: :obj:`False`)
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -12,19 +12,25 @@
 # limitations under the License.
 # ========= Copyright 2023-2024 @ CAMEL-AI.org. All Rights Reserved. =========
 # Import from the correct module path
-from utils import run_society
+from utils import (
+    CancelToken,
+    setup_async_logging,
+    stream_society,
+    AssistantReplyEvent,
+    SocietyTerminatedEvent,
+    ToolCallEvent,
+    UserInstructionEvent,
+)
 import os
 import gradio as gr
 import time
-import json
 import logging
 import datetime
-from typing import Tuple
+from typing import List, Tuple
 import importlib
 from dotenv import load_dotenv, set_key, find_dotenv, unset_key
 import threading
 import queue
-import re
 
 os.environ["PYTHONIOENCODING"] = "utf-8"
 
@@ -68,176 +74,61 @@ def setup_logging():
     root_logger.addHandler(file_handler)
     root_logger.addHandler(console_handler)
 
+    # Write the logs from a background thread, truncating large tool outputs
+    # and keeping them in full in a compressed trace file
+    setup_async_logging(
+        trace_path=os.path.join(logs_dir, f"gradio_trace_{current_date}.jsonl.gz")
+    )
+
     logging.info("Logging system initialized, log file: %s", log_file)
     return log_file
 
 
 # Global variables
 LOG_FILE = None
-LOG_QUEUE: queue.Queue = queue.Queue()  # Log queue
-STOP_LOG_THREAD = threading.Event()
+CONVERSATION_RECORDS: List[str] = []  # Conversation records built from society events
+CONVERSATION_LOCK = threading.Lock()
 CURRENT_PROCESS = None  # Used to track the currently running process
 STOP_REQUESTED = threading.Event()  # Used to mark if stop was requested
+CURRENT_CANCEL_TOKEN = None  # Cancels the running society when stop is requested
 
 
-# Log reading and updating functions
-def log_reader_thread(log_file):
-    """Background thread that continuously reads the log file and adds new lines to the queue"""
-    try:
-        with open(log_file, "r", encoding="utf-8") as f:
-            # Move to the end of file
-            f.seek(0, 2)
-
-            while not STOP_LOG_THREAD.is_set():
-                line = f.readline()
-                if line:
-                    LOG_QUEUE.put(line)  # Add to conversation record queue
-                else:
-                    # No new lines, wait for a short time
-                    time.sleep(0.1)
-    except Exception as e:
-        logging.error(f"Log reader thread error: {str(e)}")
-
-
-def get_latest_logs(max_lines=100, queue_source=None):
-    """Get the latest log lines from the queue, or read directly from the file if the queue is empty
+def record_society_event(event):
+    """Add a society event to the conversation records
 
     Args:
-        max_lines: Maximum number of lines to return
-        queue_source: Specify which queue to use, default is LOG_QUEUE
-
-    Returns:
-        str: Log content
+        event: Event yielded by `stream_society`
     """
-    logs = []
-    log_queue = queue_source if queue_source else LOG_QUEUE
-
-    # Create a temporary queue to store logs so we can process them without removing them from the original queue
-    temp_queue = queue.Queue()
-    temp_logs = []
-
-    try:
-        # Try to get all available log lines from the queue
-        while not log_queue.empty() and len(temp_logs) < max_lines:
-            log = log_queue.get_nowait()
-            temp_logs.append(log)
-            temp_queue.put(log)  # Put the log back into the temporary queue
-    except queue.Empty:
-        pass
-
-    # Process conversation records
-    logs = temp_logs
-
-    # If there are no new logs or not enough logs, try to read the last few lines directly from the file
-    if len(logs) < max_lines and LOG_FILE and os.path.exists(LOG_FILE):
-        try:
-            with open(LOG_FILE, "r", encoding="utf-8") as f:
-                all_lines = f.readlines()
-                # If there are already some logs in the queue, only read the remaining needed lines
-                remaining_lines = max_lines - len(logs)
-                file_logs = (
-                    all_lines[-remaining_lines:]
-                    if len(all_lines) > remaining_lines
-                    else all_lines
-                )
-
-                # Add file logs before queue logs
-                logs = file_logs + logs
-        except Exception as e:
-            error_msg = f"Error reading log file: {str(e)}"
-            logging.error(error_msg)
-            if not logs:  # Only add error message if there are no logs
-                logs = [error_msg]
-
-    # If there are still no logs, return a prompt message
-    if not logs:
-        return "Initialization in progress..."
-
-    # Filter logs, only keep logs with 'camel.agents.chat_agent - INFO'
-    filtered_logs = []
-    for log in logs:
-        if "camel.agents.chat_agent - INFO" in log:
-            filtered_logs.append(log)
-
-    # If there are no logs after filtering, return a prompt message
-    if not filtered_logs:
-        return "No conversation records yet."
-
-    # Process log content, extract the latest user and assistant messages
-    simplified_logs = []
-
-    # Use a set to track messages that have already been processed, to avoid duplicates
-    processed_messages = set()
-
-    def process_message(role, content):
-        # Create a unique identifier to track messages
-        msg_id = f"{role}:{content}"
-        if msg_id in processed_messages:
-            return None
-
-        processed_messages.add(msg_id)
-        content = content.replace("\\n", "\n")
-        lines = [line.strip() for line in content.split("\n")]
-        content = "\n".join(lines)
-
-        role_emoji = "🙋" if role.lower() == "user" else "🤖"
-        return f"""### {role_emoji} {role.title()} Agent
-
-{content}"""
-
-    for log in filtered_logs:
-        formatted_messages = []
-        # Try to extract message array
-        messages_match = re.search(
-            r"Model (.*?), index (\d+), processed these messages: (\[.*\])", log
-        )
-
-        if messages_match:
-            try:
-                messages = json.loads(messages_match.group(3))
-                for msg in messages:
-                    if msg.get("role") in ["user", "assistant"]:
-                        formatted_msg = process_message(
-                            msg.get("role"), msg.get("content", "")
-                        )
-                        if formatted_msg:
-                            formatted_messages.append(formatted_msg)
-            except json.JSONDecodeError:
-                pass
-
-        # If JSON parsing fails or no message array is found, try to extract conversation content directly
-        if not formatted_messages:
-            user_pattern = re.compile(r"\{'role': 'user', 'content': '(.*?)'\}")
-            assistant_pattern = re.compile(
-                r"\{'role': 'assistant', 'content': '(.*?)'\}"
-            )
+    if isinstance(event, UserInstructionEvent):
+        record = f"### 🙋 User Agent\n\n{event.content.strip()}"
+    elif isinstance(event, AssistantReplyEvent):
+        record = f"### 🤖 Assistant Agent\n\n{event.content.strip()}"
+    elif isinstance(event, ToolCallEvent):
+        duration = f" ({event.duration:.1f}s)" if event.duration is not None else ""
+        record = f"🛠️ Tool call: `{event.tool_name}`{duration}"
+    else:
+        return
 
-            for content in user_pattern.findall(log):
-                formatted_msg = process_message("user", content)
-                if formatted_msg:
-                    formatted_messages.append(formatted_msg)
+    with CONVERSATION_LOCK:
+        CONVERSATION_RECORDS.append(record)
 
-            for content in assistant_pattern.findall(log):
-                formatted_msg = process_message("assistant", content)
-                if formatted_msg:
-                    formatted_messages.append(formatted_msg)
 
-        if formatted_messages:
-            simplified_logs.append("\n\n".join(formatted_messages))
+def get_conversation_records(max_records=100):
+    """Get the latest conversation records
 
-    # Format log output, ensure appropriate separation between each conversation record
-    formatted_logs = []
-    for i, log in enumerate(simplified_logs):
-        # Remove excess whitespace characters from beginning and end
-        log = log.strip()
+    Args:
+        max_records: Maximum number of records to return
 
-        formatted_logs.append(log)
+    Returns:
+        str: Conversation records in markdown
+    """
+    with CONVERSATION_LOCK:
+        records = CONVERSATION_RECORDS[-max_records:]
 
-        # Ensure each conversation record ends with a newline
-        if not log.endswith("\n"):
-            formatted_logs.append("\n")
+    if not records:
+        return "No conversation records yet."
 
-    return "\n".join(formatted_logs)
+    return "\n\n".join(records)
 
 
 # Dictionary containing module descriptions
@@ -403,10 +294,19 @@ def run_owl(question: str, example_module: str) -> Tuple[str, str, str]:
                 f"❌ Error: Build failed - {str(e)}",
             )
 
-        # Run society simulation
+        # Run society simulation, until it is done or stop is requested
+        global CURRENT_CANCEL_TOKEN
+        STOP_REQUESTED.clear()
+        cancel_token = CancelToken(event=STOP_REQUESTED)
+        CURRENT_CANCEL_TOKEN = cancel_token
+        reason = None
         try:
             logging.info("Running society simulation...")
-            answer, chat_history, token_info = run_society(society)
+            for event in stream_society(society, cancel_token=cancel_token):
+                record_society_event(event)
+                if isinstance(event, SocietyTerminatedEvent):
+                    answer, token_info = event.answer, event.token_info
+                    reason = event.reason
             logging.info("Society simulation completed")
         except Exception as e:
             logging.error(f"Error occurred while running society simulation: {str(e)}")
@@ -415,6 +315,9 @@ def run_owl(question: str, example_module: str) -> Tuple[str, str, str]:
                 "0",
                 f"❌ Error: Run failed - {str(e)}",
             )
+        finally:
+            if CURRENT_CANCEL_TOKEN is cancel_token:
+                CURRENT_CANCEL_TOKEN = None
 
         # Safely get token count
         if not isinstance(token_info, dict):
@@ -428,10 +331,13 @@ def run_owl(question: str, example_module: str) -> Tuple[str, str, str]:
             f"Processing completed, token usage: completion={completion_tokens}, prompt={prompt_tokens}, total={total_tokens}"
         )
 
+        status = "✅ Successfully completed"
+        if reason == "cancelled":
+            status = "⏹ Stopped by user"
         return (
             answer,
             f"Completion tokens: {completion_tokens:,} | Prompt tokens: {prompt_tokens:,} | Total: {total_tokens:,}",
-            "✅ Successfully completed",
+            status,
         )
 
     except Exception as e:
@@ -441,6 +347,17 @@ def run_owl(question: str, example_module: str) -> Tuple[str, str, str]:
         return (f"Error occurred: {str(e)}", "0", f"❌ Error: {str(e)}")
 
 
+def stop_owl() -> str:
+    """Stop the running society, releasing its browser and code sandboxes"""
+    STOP_REQUESTED.set()
+    cancel_token = CURRENT_CANCEL_TOKEN
+    if cancel_token is None:
+        return "<span class='status-indicator status-success'></span> Ready"
+    logging.info("Stop requested, cancelling the running society")
+    cancel_token.cancel()
+    return "<span class='status-indicator status-running'></span> Stopping..."
+
+
 def update_module_description(module_name: str) -> str:
     """Return the description of the selected module"""
     return MODULE_DESCRIPTIONS.get(module_name, "No description available")
@@ -789,19 +706,14 @@ def create_ui():
     def clear_log_file():
         """Clear log file content"""
         try:
+            # Clear conversation records
+            with CONVERSATION_LOCK:
+                CONVERSATION_RECORDS.clear()
             if LOG_FILE and os.path.exists(LOG_FILE):
                 # Clear log file content instead of deleting the file
                 open(LOG_FILE, "w").close()
                 logging.info("Log file has been cleared")
-                # Clear log queue
-                while not LOG_QUEUE.empty():
-                    try:
-                        LOG_QUEUE.get_nowait()
-                    except queue.Empty:
-                        break
-                return ""
-            else:
-                return ""
+            return ""
         except Exception as e:
             logging.error(f"Error clearing log file: {str(e)}")
             return ""
@@ -834,7 +746,7 @@ def create_ui():
         # While waiting for processing to complete, update logs once per second
         while bg_thread.is_alive():
             # Update conversation record display
-            logs2 = get_latest_logs(100, LOG_QUEUE)
+            logs2 = get_conversation_records(100)
 
             # Always update status
             yield (
@@ -851,7 +763,7 @@ def create_ui():
             answer, token_count, status = result
 
             # Final update of conversation record
-            logs2 = get_latest_logs(100, LOG_QUEUE)
+            logs2 = get_conversation_records(100)
 
             # Set different indicators based on status
             if "Error" in status:
@@ -865,7 +777,7 @@ def create_ui():
 
             yield token_count, status_with_indicator, logs2
         else:
-            logs2 = get_latest_logs(100, LOG_QUEUE)
+            logs2 = get_conversation_records(100)
             yield (
                 "0",
                 "<span class='status-indicator status-error'></span> Terminated",
@@ -1122,6 +1034,7 @@ def create_ui():
                     run_button = gr.Button(
                         "Run", variant="primary", elem_classes="primary"
                     )
+                    stop_button = gr.Button("Stop", variant="stop")
 
                 status_output = gr.HTML(
                     value="<span class='status-indicator status-success'></span> Ready",
@@ -1257,6 +1170,8 @@ def create_ui():
             outputs=[token_count_output, status_output, log_display2],
         )
 
+        stop_button.click(fn=stop_owl, outputs=[status_output], queue=False)
+
         # Module selection updates description
         module_dropdown.change(
             fn=update_module_description,
@@ -1266,7 +1181,7 @@ def create_ui():
 
         # Conversation record related event handling
         refresh_logs_button2.click(
-            fn=lambda: get_latest_logs(100, LOG_QUEUE), outputs=[log_display2]
+            fn=lambda: get_conversation_records(100), outputs=[log_display2]
         )
 
         clear_logs_button2.click(fn=clear_log_file, outputs=[log_display2])
@@ -1297,13 +1212,6 @@ def main():
         LOG_FILE = setup_logging()
         logging.info("OWL Web application started")
 
-        # Start log reading thread
-        log_thread = threading.Thread(
-            target=log_reader_thread, args=(LOG_FILE,), daemon=True
-        )
-        log_thread.start()
-        logging.info("Log reading thread started")
-
         # Initialize .env file (if it doesn't exist)
         init_env_file()
         app = create_ui()
@@ -1323,8 +1231,6 @@ def main():
         traceback.print_exc()
 
     finally:
-        # Ensure log thread stops
-        STOP_LOG_THREAD.set()
         STOP_REQUESTED.set()
         logging.info("Application closed")
 
@@ -18,7 +18,14 @@ from camel.toolkits import (
 from camel.types import ModelPlatformType, ModelType
 from camel.logger import set_log_level
 
-from ..owl.utils import arun_society, DocumentProcessingToolkit, OwlGAIARolePlaying
+from ..owl.utils import (
+    arun_society,
+    DocumentProcessingToolkit,
+    OwlGAIARolePlaying,
+    RequestPriority,
+    ScheduledModelBackend,
+    SocietyFactory,
+)
 
 from ..config.settings import settings
 
@@ -32,6 +39,7 @@ class OwlService:
 
     tools: List[FunctionTool]
     models: Dict[str, BaseModelBackend]
+    society_factory: SocietyFactory
 
     def __init__(self):
         self.setup()
@@ -43,17 +51,7 @@ class OwlService:
         Ask a question to the Owl API.
         """
         logger.info(f"Asking question to Owl API: {question[:100]}...")
-        society = OwlGAIARolePlaying(
-            task_prompt=question,
-            with_task_specify=False,
-            user_role_name="user",
-            user_agent_kwargs={"model": self.models["user"]},
-            assistant_role_name="assistant",
-            assistant_agent_kwargs={
-                "model": self.models["assistant"],
-                "tools": self.tools,
-            },
-        )
+        society = self.society_factory.create(question)
 
         answer, chat_history, token_count = await arun_society(society)
         return {
@@ -142,6 +140,17 @@ class OwlService:
             ).get_tools(),
             *MarkItDownToolkit().get_tools(),
         ]
+        # Concurrent questions share the rate limits of the provider
+        self.society_factory = SocietyFactory(
+            user_model=ScheduledModelBackend(
+                self.models["user"], priority=RequestPriority.INTERACTIVE
+            ),
+            assistant_model=ScheduledModelBackend(
+                self.models["assistant"], priority=RequestPriority.INTERACTIVE
+            ),
+            tools=self.tools,
+            society_class=OwlGAIARolePlaying,
+        )
 
 
 # Create service instance